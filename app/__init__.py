@@ -1,15 +1,29 @@
-from flask import Flask, render_template, url_for, request, jsonify, send_file, Response
+from flask import Flask, render_template, url_for, request, jsonify, Response, abort
 import os
 import json
-import threading
 import time
+import threading
 import base64
-from app.llm.volcano_audio import get_or_generate_subtitle, optimize_subtitles_with_llm
+from app.llm.volcano_audio import (asr_provider, get_or_generate_subtitle, optimize_subtitles_with_llm,
+                                   optimize_subtitles_incremental, subtitle_cache_params, is_optimization_stale,
+                                   load_previous_optimization, optimization_source_path, save_optimized_subtitle)
+from app.llm.cue_store import load_cue_store
 from app.llm.tts_helper import text_to_speech, get_available_voices, get_available_languages
 from app.llm.gemini_ocr import recognize_text_from_image
-import requests
+from app.llm.http_pool import get_http_pool
 from utils.text_helper import analyze_text, ai_correct_essay, ai_correct_essay_stream
 from app.game_24 import game_24
+from app.library import LibraryIndex
+from app.audio_probe import AudioProbe
+from app.ingest import AudioStore
+from app.batch_subtitles import public_audio_url
+from app.subtitle_store import (SUBTITLE_FORMATS, SubtitleStore, add_write_hook, ensure_sidecar, file_sha256,
+                                write_atomic)
+from app.subtitle_search import SubtitleSearchIndex
+from app.url_import import UrlImportManager
+from app.task_store import TaskStore
+from app.jobs import background_executor, get_background_jobs, parse_priority, QueueFullError
+from app.media import resolve_media_path, send_media, AUDIO_MAX_AGE, SUBTITLE_MAX_AGE
 
 app = Flask(__name__)
 
@@ -20,36 +34,90 @@ TEMP_UPLOAD_DIR = os.path.join(app.static_folder, 'temp')
 # 确保临时目录存在
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
 
+# 音频元数据（时长、码率、编码）按 (路径, 大小, mtime) 缓存，每个文件只探测一次
+audio_prober = AudioProbe(AUDIO_ROOT)
+# 音频库索引（SQLite），按目录 mtime 增量更新，同步后探测新增音轨的元数据
+library_index = LibraryIndex(AUDIO_ROOT, SUBTITLE_ROOT, prober=audio_prober)
+# 音频内容哈希存储，相同内容只保存一份并复用字幕
+audio_store = AudioStore(AUDIO_ROOT, SUBTITLE_ROOT)
+# 字幕内容寻址存储，按音频内容和生成参数复用字幕
+subtitle_artifacts = SubtitleStore(audio_store)
+# 字幕全文检索索引（SQLite FTS5），字幕写入时增量更新
+subtitle_index = SubtitleSearchIndex(SUBTITLE_ROOT)
+add_write_hook(subtitle_index.index_file)
+
+
+def _on_url_import_complete(job):
+    """URL 导入完成后复用字幕并刷新音频库索引"""
+    audio_store.reuse_subtitles(job['path'])
+    book, disc, _ = job['path'].split('/', 2)
+    library_index.refresh_disc(book, disc)
+
+
+# URL 导入在后台下载，接口立即返回任务 ID
+url_importer = UrlImportManager(audio_store, on_complete=_on_url_import_complete)
+
 @app.route('/')
 def index():
-    audio_tree = {}
-    for book in os.listdir(AUDIO_ROOT):
-        book_path = os.path.join(AUDIO_ROOT, book)
-        if not os.path.isdir(book_path):
-            continue
-        audio_tree[book] = {}
-        for disc in os.listdir(book_path):
-            disc_path = os.path.join(book_path, disc)
-            if not os.path.isdir(disc_path):
-                continue
-            files = [f for f in os.listdir(disc_path) if f.lower().endswith(('.mp3', '.m4a'))]
-            files.sort()
-            audio_tree[book][disc] = files
-    return render_template('index.html', audio_tree=audio_tree, current_page='home')
+    audio_tree = library_index.get_tree()
+    return render_template('index.html', audio_tree=audio_tree, audio_durations=library_index.get_durations(),
+                           current_page='home')
+
+@app.route('/api/library')
+def api_library():
+    """
+    音频库列表接口
+    可选参数 book、disc 用于过滤，返回音轨及字幕状态
+    """
+    book = request.args.get('book')
+    disc = request.args.get('disc')
+    return jsonify({
+        "success": True,
+        "tracks": library_index.get_tracks(book, disc)
+    })
 
 @app.route('/audio/<path:filename>')
 def serve_audio(filename):
-    """直接提供音频文件，而不是通过静态文件路径"""
-    return send_file(os.path.join(AUDIO_ROOT, filename))
+    """
+    提供音频文件，而不是通过静态文件路径（支持 Range 和条件请求）
+    MEDIA_DELIVERY_MODE=x-accel 时只校验路径，文件由 nginx 发送
+    """
+    audio_path = resolve_media_path(AUDIO_ROOT, filename)
+    if audio_path is None:
+        abort(404)
+    return send_media(AUDIO_ROOT, audio_path, max_age=AUDIO_MAX_AGE)
 
 @app.route('/subtitles/<path:filename>')
 def serve_subtitle(filename):
-    """直接提供字幕文件，而不是通过静态文件路径"""
-    subtitle_path = os.path.join(SUBTITLE_ROOT, filename)
-    if os.path.exists(subtitle_path):
-        return send_file(subtitle_path)
+    """
+    提供字幕文件，而不是通过静态文件路径（支持 Range 和条件请求）
+    MEDIA_DELIVERY_MODE=x-accel 时只校验路径，文件由 nginx 发送
+
+    格式由扩展名（.srt / .vtt / .json）决定；请求 .srt 时也可以通过 Accept 头
+    （text/vtt、application/json）协商。.vtt 和 .json 由同名 SRT 派生，缺失时即时生成
+    """
+    stem, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    negotiated = ext == '.srt'
+    if negotiated:
+        # */* 时 best_match 返回第一项，保持返回 SRT
+        formats = {SUBTITLE_FORMATS[name][1]: name for name in ('srt', 'vtt', 'json')}
+        fmt = formats.get(request.accept_mimetypes.best_match(list(formats)), 'srt')
+    else:
+        fmt = {'.vtt': 'vtt', '.json': 'json'}.get(ext)
+
+    if fmt in ('vtt', 'json'):
+        srt_path = resolve_media_path(SUBTITLE_ROOT, f"{stem}.srt")
+        subtitle_path = ensure_sidecar(srt_path, fmt) if srt_path is not None else None
     else:
+        subtitle_path = resolve_media_path(SUBTITLE_ROOT, filename)
+
+    if subtitle_path is None:
         return "Subtitle not found", 404
+    response = send_media(SUBTITLE_ROOT, subtitle_path, max_age=SUBTITLE_MAX_AGE)
+    if negotiated:
+        response.vary.add('Accept')
+    return response
 
 @app.route('/upload-audio', methods=['POST'])
 def upload_audio():
@@ -68,6 +136,9 @@ def upload_audio():
         if not all([book, disc, audio_name]):
             return jsonify({"success": False, "error": "缺少必要参数"}), 400
         
+        # 校验路径，防止 book/disc 中包含 .. 写到音频目录之外
+        audio_store.resolve(f"{book}/{disc}/{audio_name}")
+        
         # 确保目录存在
         book_path = os.path.join(AUDIO_ROOT, book)
         disc_path = os.path.join(book_path, disc)
@@ -104,11 +175,8 @@ def upload_audio():
                     # 如果上传文件没有后缀，默认使用.mp3
                     audio_name = f"{audio_name}.mp3"
             
-            # 文件保存路径
-            file_path = os.path.join(disc_path, audio_name)
-                
-            # 保存文件
-            audio_file.save(file_path)
+            # 边写临时文件边计算哈希，完成后原子重命名
+            ingest_result = audio_store.ingest_stream(audio_file.stream, f"{book}/{disc}/{audio_name}")
             
         elif audio_source == 'url':
             # URL导入
@@ -129,33 +197,71 @@ def upload_audio():
                     # 如果URL没有明确的后缀，默认使用.mp3
                     audio_name = f"{audio_name}.mp3"
             
-            # 文件保存路径
-            file_path = os.path.join(disc_path, audio_name)
-                
-            # 下载文件
-            response = requests.get(audio_url, stream=True)
-            if response.status_code != 200:
-                return jsonify({"success": False, "error": f"下载失败，状态码: {response.status_code}"}), 400
-                
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # 提交后台下载任务（超时、断点续传、大小和 sha256 校验），立即返回任务 ID
+            expected_size = request.form.get('audioSize')
+            job_id = url_importer.submit(
+                audio_url,
+                f"{book}/{disc}/{audio_name}",
+                expected_sha256=request.form.get('audioSha256') or None,
+                expected_size=int(expected_size) if expected_size else None
+            )
+            
+            return jsonify({
+                "success": True,
+                "status": "queued",
+                "message": "已开始后台下载",
+                "job_id": job_id,
+                "status_url": f"/api/import-jobs/{job_id}",
+                "path": f"/audio/{book}/{disc}/{audio_name}"
+            }), 202
                     
         else:
             return jsonify({"success": False, "error": "不支持的音频来源类型"}), 400
             
-        # 更新音频树（不需要手动更新，下次刷新页面会自动加载）
+        # 相同内容的音轨已有字幕时直接复用
+        subtitles_reused = audio_store.reuse_subtitles(ingest_result['path'])
+        
+        # 更新音频库索引，刷新页面即可看到新文件
+        library_index.refresh_disc(book, disc)
         
         return jsonify({
             "success": True,
             "message": "文件上传成功",
-            "path": f"/audio/{book}/{disc}/{audio_name}"
+            "path": f"/audio/{book}/{disc}/{audio_name}",
+            "sha256": ingest_result['sha256'],
+            "deduplicated": ingest_result['deduplicated'],
+            "subtitles_reused": subtitles_reused
         })
         
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/import-jobs/<job_id>')
+def get_import_job(job_id):
+    """
+    查询 URL 导入任务进度
+    """
+    job = url_importer.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "任务不存在"}), 404
+    
+    book, disc, filename = job['path'].split('/', 2)
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job['status'],
+        "bytes_downloaded": job['bytes_downloaded'],
+        "total_bytes": job['total_bytes'],
+        "progress": job['progress'],
+        "attempts": job['attempts'],
+        "sha256": job['sha256'],
+        "deduplicated": job['deduplicated'],
+        "error": job['error'],
+        "path": f"/audio/{book}/{disc}/{filename}"
+    })
+
 @app.route('/generate-subtitle', methods=['POST'])
 def generate_subtitle():
     """
@@ -170,24 +276,37 @@ def generate_subtitle():
     if not all([book, disc, filename]):
         return jsonify({"error": "Missing required parameters"}), 400
     
-    # 对于本地开发环境，我们需要使用可公开访问的URL
-    # 这里我们使用一个替代URL，您需要替换为真实的可公开访问的音频URL
-    # 例如，您可以使用已经上传到某个公共服务器的音频文件
-    # 或者您可以将本地文件临时上传到一个文件共享服务
-    
-    # 以下是使用公共示例URL的例子
-    # 实际使用时需要替换为您自己的文件
-    # 对于测试，您可以使用一些公共可访问的音频样本
-    public_sample_url = "https://read-ai.instap.net/static/audios/{book}/{disc}/{filename}".format(
-        book=book, disc=disc, filename=filename
-    )
+    # ASR_INPUT=local 时把本地文件直接上传给 ASR（格式不支持或识别失败时退回公开 URL），默认由火山引擎从公开 URL 下载
+    public_sample_url = public_audio_url(book, disc, filename)
     
     try:
         # 获取不带扩展名的文件名
         filename_without_ext = os.path.splitext(filename)[0]
         
-        # 使用公共可访问的URL生成字幕
-        srt_content = get_or_generate_subtitle(public_sample_url, book, disc, filename_without_ext)
+        audio_path = f"{book}/{disc}/{filename}"
+        subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.srt")
+        # 生成时默认经过 LLM 优化，存储键中包含优化器版本
+        srt_params = subtitle_cache_params(inline_optimization=True, asr=asr_provider(filename))
+        
+        # 存储中已有相同音频、相同参数的字幕，或内容相同的音轨已有字幕时直接复用，省去 ASR 调用
+        generated = False
+        if not os.path.exists(subtitle_path):
+            if not subtitle_artifacts.materialize(audio_path, 'srt', srt_params):
+                audio_store.reuse_subtitles(audio_path)
+            generated = not os.path.exists(subtitle_path)
+        
+        # 按音频时长放宽识别任务的等待时间，本地识别时提交实际采样率
+        metadata = (audio_prober.get(audio_path) or {}) if generated else {}
+        transcription = {}
+        srt_content = get_or_generate_subtitle(public_sample_url, book, disc, filename_without_ext,
+                                               duration_ms=metadata.get('duration_ms'),
+                                               audio_path=os.path.join(AUDIO_ROOT, audio_path),
+                                               sample_rate=metadata.get('sample_rate'),
+                                               transcription=transcription)
+        if generated:
+            subtitle_artifacts.adopt(audio_path, 'srt', subtitle_cache_params(inline_optimization=True,
+                                                                              asr=transcription.get('asr')))
+        library_index.refresh_disc(book, disc)
         
         # 返回成功结果
         return jsonify({
@@ -198,8 +317,35 @@ def generate_subtitle():
         # 返回错误信息
         return jsonify({"error": str(e)}), 500
 
-# 全局变量跟踪优化任务状态
-optimization_tasks = {}
+# 优化任务状态保存在 SQLite 中，所有 worker 共享，同一音轨同一时间只会有一个优化任务
+# worker 崩溃遗留的 processing 记录超过 TASK_STALE_AFTER 秒后视为失败，可以被重新认领
+optimization_tasks = TaskStore('subtitle_optimization')
+
+_recovered = False
+_recover_lock = threading.Lock()
+
+
+@app.before_request
+def recover_orphaned_tasks():
+    """
+    Web 进程处理第一个请求前接管已退出的 worker 遗留的任务：重新排队 URL 导入，
+    把不再刷新心跳的优化任务标记为失败。
+
+    不在导入时执行：命令行工具（python -m app.batch_subtitles 等）也会导入 app，
+    短命的 CLI 进程接管下载任务后随即退出，任务会再次成为孤儿。
+    """
+    global _recovered
+    if _recovered:
+        return
+    with _recover_lock:
+        if _recovered:
+            return
+        _recovered = True
+    try:
+        url_importer.recover()
+        optimization_tasks.expire_stale()
+    except Exception as e:
+        print(f"Failed to recover orphaned tasks: {e}")
 
 @app.route('/api/optimize-subtitle', methods=['POST'])
 def optimize_subtitle():
@@ -214,14 +360,22 @@ def optimize_subtitle():
     if not all([book, disc, filename]):
         return jsonify({"error": "Missing required parameters"}), 400
     
+    # 正在播放的音轨（interactive，默认）优先于预取任务（prefetch）
+    try:
+        priority = parse_priority(data.get('priority', 'interactive'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     # 创建任务唯一标识
     task_key = f"{book}_{disc}_{filename}"
     
-    # 检查是否已有优化文件
+    # 检查是否已有优化文件（原始字幕重新生成后，已有的优化文件视为过期，需要增量重新优化）
     filename_without_ext = os.path.splitext(filename)[0]
     optimized_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.optimized.srt")
+    original_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.srt")
     
-    if os.path.exists(optimized_subtitle_path):
+    if os.path.exists(optimized_subtitle_path) and not is_optimization_stale(original_subtitle_path,
+                                                                              optimized_subtitle_path):
         return jsonify({
             "success": True,
             "status": "completed",
@@ -229,73 +383,161 @@ def optimize_subtitle():
         })
     
     # 检查原始字幕是否存在
-    original_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.srt")
     if not os.path.exists(original_subtitle_path):
         return jsonify({"error": "Original subtitle not found"}), 404
     
-    # 检查是否正在处理中
-    if task_key in optimization_tasks and optimization_tasks[task_key]['status'] == 'processing':
+    # 相同音频、相同原始字幕已经优化过时直接复用
+    audio_path = f"{book}/{disc}/{filename}"
+    optimized_params = subtitle_cache_params(optimized_from=file_sha256(original_subtitle_path))
+    if subtitle_artifacts.materialize(audio_path, 'optimized', optimized_params):
+        with open(original_subtitle_path, 'r', encoding='utf-8') as f:
+            write_atomic(optimization_source_path(optimized_subtitle_path), f.read())
+        library_index.refresh_disc(book, disc)
+        return jsonify({
+            "success": True,
+            "status": "completed",
+            "optimized_url": f"/subtitles/{book}/{disc}/{filename_without_ext}.optimized.srt"
+        })
+    
+    # 原子地认领任务，其他 worker 正在处理时直接返回
+    if not optimization_tasks.claim(task_key):
         return jsonify({
             "success": True,
             "status": "processing",
             "message": "Optimization already in progress"
         })
     
-    # 标记任务开始
-    optimization_tasks[task_key] = {
-        'status': 'processing',
-        'start_time': time.time()
-    }
-    
     def optimize_subtitle_task():
         try:
+            # 从执行器队列中取出时刷新心跳（之后由 TaskStore 的心跳线程维持）；已被其他 worker 接管时不再执行
+            if not optimization_tasks.heartbeat(task_key):
+                print(f"Subtitle optimization {task_key} was taken over by another worker, skipping")
+                return
+            
             # 读取原始字幕
             with open(original_subtitle_path, 'r', encoding='utf-8') as f:
                 original_srt = f.read()
             
-            # 调用LLM优化
-            optimized_srt = optimize_subtitles_with_llm(original_srt)
+            # 调用LLM优化；已有优化字幕时只重新优化变化的条目
+            previous_source, previous_optimized = load_previous_optimization(optimized_subtitle_path)
+            if previous_source is not None:
+                optimized_srt = optimize_subtitles_incremental(original_srt, previous_source, previous_optimized)
+            else:
+                optimized_srt = optimize_subtitles_with_llm(original_srt)
             
-            # 保存优化后的字幕
+            # 保存优化后的字幕和来源快照
             if optimized_srt and optimized_srt != original_srt:
-                os.makedirs(os.path.dirname(optimized_subtitle_path), exist_ok=True)
-                with open(optimized_subtitle_path, 'w', encoding='utf-8') as f:
-                    f.write(optimized_srt)
+                save_optimized_subtitle(optimized_subtitle_path, optimized_srt, original_srt)
+                subtitle_artifacts.adopt(audio_path, 'optimized', optimized_params)
+                library_index.refresh_disc(book, disc)
                 
-                optimization_tasks[task_key] = {
-                    'status': 'completed',
-                    'end_time': time.time(),
+                optimization_tasks.complete(task_key, {
                     'optimized_url': f"/subtitles/{book}/{disc}/{filename_without_ext}.optimized.srt"
-                }
+                })
                 print(f"Subtitle optimization completed for {task_key}")
             else:
-                optimization_tasks[task_key] = {
-                    'status': 'failed',
-                    'end_time': time.time(),
-                    'error': 'LLM optimization failed or returned unchanged content'
-                }
+                optimization_tasks.fail(task_key, 'LLM optimization failed or returned unchanged content')
                 print(f"Subtitle optimization failed for {task_key}")
                 
         except Exception as e:
-            optimization_tasks[task_key] = {
-                'status': 'failed',
-                'end_time': time.time(),
-                'error': str(e)
-            }
+            optimization_tasks.fail(task_key, str(e))
             print(f"Subtitle optimization error for {task_key}: {str(e)}")
     
-    # 启动后台线程
-    thread = threading.Thread(target=optimize_subtitle_task)
-    thread.daemon = True
-    thread.start()
+    # 提交到共享的有界后台执行器
+    try:
+        job = background_executor.submit(optimize_subtitle_task, name=f"optimize:{task_key}",
+                                         priority=priority, key=task_key)
+    except QueueFullError as e:
+        optimization_tasks.fail(task_key, str(e))
+        return jsonify({"success": False, "error": str(e)}), 503
     
     return jsonify({
         "success": True,
         "status": "processing",
         "task_id": task_key,
+        "job_id": job.id,
         "message": "Optimization started"
     })
 
+@app.route('/api/jobs')
+def list_background_jobs():
+    """
+    查询后台任务执行器状态（当前 worker）：排队中、运行中和最近完成的任务
+    """
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "executors": get_background_jobs()
+    })
+
+@app.route('/api/http-pool')
+def http_pool_stats():
+    """
+    查询共享 HTTP 连接池统计（当前 worker）：请求数、新建连接数和连接复用率
+    """
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "pool": get_http_pool().stats()
+    })
+
+@app.route('/api/subtitle-cue')
+def get_subtitle_cue():
+    """
+    查询音轨某一时刻的字幕（优先使用优化后的字幕）
+    参数: book, disc, filename, t（秒）
+    """
+    book = request.args.get('book')
+    disc = request.args.get('disc')
+    filename = request.args.get('filename')
+    t = request.args.get('t', type=float)
+    
+    if not all([book, disc, filename]) or t is None:
+        return jsonify({"error": "Missing required parameters"}), 400
+    
+    filename_without_ext = os.path.splitext(filename)[0]
+    for suffix, optimized in (('.optimized.srt', True), ('.srt', False)):
+        path = resolve_media_path(SUBTITLE_ROOT, f"{book}/{disc}/{filename_without_ext}{suffix}")
+        cues = load_cue_store(path) if path else None
+        if cues is None:
+            continue
+        
+        index = cues.index_at(int(t * 1000))
+        cue = cues[index] if index is not None else None
+        return jsonify({
+            "success": True,
+            "optimized": optimized,
+            "cue": {
+                "index": index,
+                "start_ms": cue.start_ms,
+                "end_ms": cue.end_ms,
+                "text": cue.text,
+                "speaker": cue.speaker
+            } if cue else None
+        })
+    
+    return jsonify({"error": "Subtitle not found"}), 404
+
+@app.route('/api/search')
+def search_subtitles():
+    """
+    字幕全文检索，按相关度返回音轨和条目时间
+    参数: q（检索的句子或词）, book（可选）, limit（可选，默认 20）
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing required parameter: q"}), 400
+    
+    started = time.perf_counter()
+    results = subtitle_index.search(query, book=request.args.get('book') or None,
+                                    limit=request.args.get('limit', 20, type=int))
+    return jsonify({
+        "success": True,
+        "query": query,
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
 @app.route('/api/check-optimized-subtitle')
 def check_optimized_subtitle():
     """
@@ -310,25 +552,27 @@ def check_optimized_subtitle():
     
     task_key = f"{book}_{disc}_{filename}"
     filename_without_ext = os.path.splitext(filename)[0]
-    
-    # 检查优化文件是否存在
     optimized_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.optimized.srt")
+    original_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.srt")
     
-    if os.path.exists(optimized_subtitle_path):
+    # 优化文件存在且不落后于原始字幕时已完成；正在（重新）优化时，已有的优化文件是按旧的原始字幕生成的
+    task = optimization_tasks.get(task_key)
+    processing = task is not None and task['status'] == 'processing'
+    if not processing and os.path.exists(optimized_subtitle_path) and not is_optimization_stale(
+            original_subtitle_path, optimized_subtitle_path):
         return jsonify({
             "success": True,
             "status": "completed",
             "optimized_url": f"/subtitles/{book}/{disc}/{filename_without_ext}.optimized.srt"
         })
     
-    # 检查任务状态
-    if task_key in optimization_tasks:
-        task = optimization_tasks[task_key]
+    # 处理中或失败；已完成的任务记录属于重新生成之前的原始字幕，视为未开始
+    if task is not None and task['status'] != 'completed':
         return jsonify({
             "success": True,
             "status": task['status'],
-            "error": task.get('error'),
-            "optimized_url": task.get('optimized_url')
+            "error": task['error'],
+            "optimized_url": task['result'].get('optimized_url')
         })
     
     return jsonify({
@@ -336,6 +580,87 @@ def check_optimized_subtitle():
         "status": "not_started"
     })
 
+# SSE 连接保持的最长时间（秒），需小于 gunicorn 的 --timeout；到时浏览器会自动重连
+OPTIMIZATION_EVENTS_MAX_WAIT = float(os.getenv('OPTIMIZATION_EVENTS_MAX_WAIT', '55'))
+OPTIMIZATION_EVENTS_HEARTBEAT = 15
+# 每个 worker 同时保持的 SSE 连接数上限：gthread worker 中每个连接占用一个线程，
+# 必须给普通请求留出线程（默认 8 个线程中最多 4 个用于 SSE）；超出时返回 503，前端退回轮询
+OPTIMIZATION_EVENTS_MAX_STREAMS = int(os.getenv('OPTIMIZATION_EVENTS_MAX_STREAMS', '4'))
+_optimization_event_streams = threading.BoundedSemaphore(OPTIMIZATION_EVENTS_MAX_STREAMS)
+
+@app.route('/api/optimized-subtitle-events')
+def optimized_subtitle_events():
+    """
+    字幕优化状态推送（Server-Sent Events）
+
+    连接保持期间只在优化完成或失败时发送一次 completed / failed 事件，
+    任务不存在时发送 not_started；其余时间只发送注释行作为心跳。
+    同时打开的连接达到 OPTIMIZATION_EVENTS_MAX_STREAMS 时返回 503，前端改用轮询。
+    """
+    book = request.args.get('book')
+    disc = request.args.get('disc')
+    filename = request.args.get('filename')
+    
+    if not all([book, disc, filename]):
+        return jsonify({"error": "Missing required parameters"}), 400
+    
+    task_key = f"{book}_{disc}_{filename}"
+    filename_without_ext = os.path.splitext(filename)[0]
+    optimized_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.optimized.srt")
+    original_subtitle_path = os.path.join(SUBTITLE_ROOT, book, disc, f"{filename_without_ext}.srt")
+    optimized_url = f"/subtitles/{book}/{disc}/{filename_without_ext}.optimized.srt"
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    def optimized_is_current():
+        # 原始字幕重新生成后，已有的优化文件在重新优化完成前视为过期
+        return os.path.exists(optimized_subtitle_path) and not is_optimization_stale(original_subtitle_path,
+                                                                                      optimized_subtitle_path)
+    
+    def generate_events():
+        yield "retry: 2000\n\n"
+        deadline = time.monotonic() + OPTIMIZATION_EVENTS_MAX_WAIT
+        while True:
+            task = optimization_tasks.get(task_key)
+            if (task is None or task['status'] != 'processing') and optimized_is_current():
+                yield sse('completed', {"status": "completed", "optimized_url": optimized_url})
+                return
+            
+            remaining = deadline - time.monotonic()
+            task = optimization_tasks.wait_finished(
+                task_key, timeout=max(0, min(OPTIMIZATION_EVENTS_HEARTBEAT, remaining))
+            )
+            if task is None or (task['status'] == 'completed' and not optimized_is_current()):
+                # 没有任务，或已完成的任务属于重新生成之前的原始字幕
+                yield sse('not_started', {"status": "not_started"})
+                return
+            if task['status'] == 'completed':
+                yield sse('completed', {
+                    "status": "completed",
+                    "optimized_url": task['result'].get('optimized_url', optimized_url)
+                })
+                return
+            if task['status'] == 'failed':
+                yield sse('failed', {"status": "failed", "error": task['error']})
+                return
+            if remaining <= 0:
+                # 关闭连接，浏览器按 retry 间隔自动重连，避免被 gunicorn 超时杀掉
+                return
+            yield ": keepalive\n\n"
+    
+    if not _optimization_event_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many status streams, use /api/check-optimized-subtitle"}), 503, {
+            'Retry-After': str(OPTIMIZATION_EVENTS_HEARTBEAT)
+        }
+    response = Response(generate_events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 连接结束（正常结束或客户端断开）时释放名额
+    response.call_on_close(_optimization_event_streams.release)
+    return response
+
 @app.route('/word-counter')
 def word_counter():
     """作文字数统计页面"""
@@ -0,0 +1,542 @@
+"""
+音频元数据探测
+读取音轨的时长、码率、采样率、声道数和编码：MP3 解析帧头（含 Xing/Info/VBRI 可变码率头），
+M4A 解析 moov 原子，都只读取文件头部的少量字节；无法解析时退回 ffprobe（如已安装）。
+结果按 (路径, 大小, mtime) 缓存在 SQLite 中，每个文件只探测一次，大量文件在进程池中并行探测。
+
+用法:
+    python -m app.audio_probe app/static/audios/ET3/disc1/01.mp3
+"""
+import argparse
+import json
+import os
+import shutil
+import struct
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.db import get_connection, transaction
+
+FFPROBE_PATH = os.getenv('FFPROBE_PATH') or shutil.which('ffprobe')
+AUDIO_PROBE_WORKERS = int(os.getenv('AUDIO_PROBE_WORKERS', str(min(4, os.cpu_count() or 1))))
+# 待探测文件少于该数量时在当前进程内探测，进程池的启动开销比解析文件头还大
+AUDIO_PROBE_POOL_MIN = int(os.getenv('AUDIO_PROBE_POOL_MIN', '16'))
+
+SCHEMA = ('audio_probe', """
+CREATE TABLE IF NOT EXISTS audio_metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration_ms INTEGER,
+    bitrate INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER,
+    codec TEXT,
+    prober TEXT,
+    error TEXT,
+    probed_at REAL NOT NULL
+);
+""")
+
+METADATA_FIELDS = ('duration_ms', 'bitrate', 'sample_rate', 'channels', 'codec')
+
+# MPEG 音频帧头查表：码率（kbps）按 (版本, 层) 区分，采样率按版本区分
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+# 查找第一个音频帧时最多读取的字节数（ID3 标签之后）
+_MP3_SCAN_BYTES = 64 * 1024
+
+
+def _parse_mp3_header(header: bytes) -> Optional[Dict]:
+    """解析 4 字节的 MPEG 音频帧头，不是合法帧头时返回 None"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}.get((header[1] >> 3) & 0x03)
+    layer = {1: 3, 2: 2, 3: 1}.get((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    table = (1, layer) if version == 1 else (2, 1 if layer == 1 else 2)
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and version != 1:
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+    bitrate = _MP3_BITRATES[table][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    if layer == 1:
+        frame_size = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        frame_size = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': 1 if header[3] >> 6 == 3 else 2,
+        'samples_per_frame': samples_per_frame,
+        'frame_size': frame_size,
+    }
+
+
+def _mp3_audio_start(f) -> int:
+    """跳过文件开头的 ID3v2 标签，返回音频数据的起始位置"""
+    f.seek(0)
+    head = f.read(10)
+    if head[:3] == b'ID3' and len(head) == 10:
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        return 10 + tag_size + (10 if head[5] & 0x10 else 0)
+    return 0
+
+
+def _find_mp3_frame(data: bytes) -> Tuple[int, Optional[Dict]]:
+    """在数据中查找第一个合法的帧头，返回 (偏移, 帧头信息)，找不到时帧头信息为 None"""
+    offset = 0
+    while offset < len(data) - 4:
+        offset = data.find(b'\xff', offset)
+        if offset < 0 or offset > len(data) - 4:
+            break
+        frame = _parse_mp3_header(data[offset:offset + 4])
+        if frame is not None:
+            return offset, frame
+        offset += 1
+    return offset, None
+
+
+def _mp3_side_info(frame: Dict) -> int:
+    """Xing/Info 头位于第一帧的边信息之后"""
+    if frame['version'] == 1:
+        return 32 if frame['channels'] == 2 else 17
+    return 17 if frame['channels'] == 2 else 9
+
+
+def probe_mp3(path: str) -> Dict:
+    """
+    解析 MP3 文件头
+
+    有 Xing/Info 或 VBRI 头时按总帧数计算时长，否则按固定码率和音频数据大小估算。
+
+    Raises:
+        ValueError: 找不到合法的音频帧
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        audio_start = _mp3_audio_start(f)
+        f.seek(audio_start)
+        data = f.read(_MP3_SCAN_BYTES)
+        f.seek(max(0, size - 128))
+        has_id3v1 = f.read(3) == b'TAG'
+
+    offset, frame = _find_mp3_frame(data)
+    if frame is None:
+        raise ValueError("no MPEG audio frame found")
+
+    audio_bytes = size - audio_start - offset - (128 if has_id3v1 else 0)
+    # Xing/Info 头位于第一帧的边信息之后，VBRI 头固定在帧头后 32 字节
+    frames = None
+    xing = offset + 4 + _mp3_side_info(frame)
+    if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 16:
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+    vbri = offset + 4 + 32
+    if frames is None and data[vbri:vbri + 4] == b'VBRI' and len(data) >= vbri + 18:
+        frames = struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+
+    if frames:
+        duration_ms = int(frames * frame['samples_per_frame'] * 1000 / frame['sample_rate'])
+        bitrate = int(audio_bytes * 8 * 1000 / duration_ms) if duration_ms else frame['bitrate']
+    else:
+        bitrate = frame['bitrate']
+        duration_ms = int(audio_bytes * 8 * 1000 / bitrate)
+    return {
+        'duration_ms': duration_ms,
+        'bitrate': bitrate,
+        'sample_rate': frame['sample_rate'],
+        'channels': frame['channels'],
+        'codec': 'mp3',
+    }
+
+
+def _iter_atoms(f, start: int, end: int):
+    """遍历 [start, end) 范围内的 MP4 原子，产出 (类型, 数据起始位置, 数据结束位置)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        atom_size, atom_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = end - position
+        if atom_size < header_size:
+            return
+        yield atom_type, position + header_size, min(position + atom_size, end)
+        position += atom_size
+
+
+def _find_atom(f, start: int, end: int, path: Tuple[bytes, ...]) -> Optional[Tuple[int, int]]:
+    """按路径查找原子，例如 (b'mdia', b'mdhd')"""
+    for atom_type, data_start, data_end in _iter_atoms(f, start, end):
+        if atom_type == path[0]:
+            if len(path) == 1:
+                return data_start, data_end
+            return _find_atom(f, data_start, data_end, path[1:])
+    return None
+
+
+def _read_media_header(f, start: int) -> Tuple[int, int]:
+    """读取 mvhd/mdhd 中的 (timescale, duration)"""
+    f.seek(start)
+    version = f.read(4)[0]
+    if version == 1:
+        f.seek(start + 4 + 16)
+        return struct.unpack('>IQ', f.read(12))
+    f.seek(start + 4 + 8)
+    return struct.unpack('>II', f.read(8))
+
+
+def probe_m4a(path: str) -> Dict:
+    """
+    解析 M4A（MP4 容器）的 moov 原子，moov 在文件末尾时只多一次 seek
+
+    Raises:
+        ValueError: 不是 MP4 文件或缺少 moov
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        moov = _find_atom(f, 0, size, (b'moov',))
+        if moov is None:
+            raise ValueError("no moov atom found")
+
+        result = {'codec': None, 'sample_rate': None, 'channels': None}
+        for atom_type, trak_start, trak_end in _iter_atoms(f, *moov):
+            if atom_type != b'trak':
+                continue
+            mdia = _find_atom(f, trak_start, trak_end, (b'mdia',))
+            hdlr = mdia and _find_atom(f, *mdia, (b'hdlr',))
+            if not hdlr:
+                continue
+            f.seek(hdlr[0] + 8)
+            if f.read(4) != b'soun':
+                continue
+            mdhd = _find_atom(f, *mdia, (b'mdhd',))
+            if mdhd:
+                timescale, duration = _read_media_header(f, mdhd[0])
+                if timescale:
+                    result['duration_ms'] = int(duration * 1000 / timescale)
+            stsd = _find_atom(f, *mdia, (b'minf', b'stbl', b'stsd'))
+            if stsd:
+                f.seek(stsd[0] + 8)
+                entry = f.read(36)
+                if len(entry) == 36:
+                    fmt = entry[4:8]
+                    result['codec'] = 'aac' if fmt == b'mp4a' else fmt.decode('latin-1').strip()
+                    result['channels'] = struct.unpack('>H', entry[24:26])[0]
+                    result['sample_rate'] = struct.unpack('>I', entry[32:36])[0] >> 16
+            break
+
+        if 'duration_ms' not in result:
+            mvhd = _find_atom(f, *moov, (b'mvhd',))
+            if mvhd is None:
+                raise ValueError("no audio track duration found")
+            timescale, duration = _read_media_header(f, mvhd[0])
+            if not timescale:
+                raise ValueError("invalid movie header")
+            result['duration_ms'] = int(duration * 1000 / timescale)
+
+    result['bitrate'] = int(size * 8 * 1000 / result['duration_ms']) if result['duration_ms'] else None
+    return result
+
+
+def _mp3_truncation(path: str) -> Optional[str]:
+    """沿帧链检查 MP3 的最后一帧是否完整，并与 Xing 头记录的总字节数比较"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        audio_start = _mp3_audio_start(f)
+        f.seek(audio_start)
+        data = f.read(_MP3_SCAN_BYTES)
+        offset, frame = _find_mp3_frame(data)
+        if frame is None:
+            return None
+
+        xing = offset + 4 + _mp3_side_info(frame)
+        if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 16:
+            flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+            if flags & 0x02:
+                field = xing + (12 if flags & 0x01 else 8)
+                declared = struct.unpack('>I', data[field:field + 4])[0]
+                if declared > size - audio_start - offset:
+                    return f"audio data is {size - audio_start - offset} bytes, Xing header declares {declared}"
+
+        # 帧头只有少数几种取值，缓存解析结果；遇到非帧头（ID3v1/APE 标签等）时停止
+        headers = {}
+        position = audio_start + offset
+        walked = 0
+        block_start, block = position, b''
+        while position + 4 <= size:
+            if position + 4 > block_start + len(block):
+                f.seek(position)
+                block_start, block = position, f.read(1024 * 1024)
+            header = block[position - block_start:position - block_start + 4]
+            frame = headers.get(header)
+            if frame is None:
+                frame = headers[header] = _parse_mp3_header(header)
+                if frame is None:
+                    break
+            # 至少走过一帧，确认不是数据中偶然出现的同步字
+            if position + frame['frame_size'] > size and walked:
+                return f"last frame at {position} needs {frame['frame_size']} bytes, {size - position} available"
+            position += frame['frame_size']
+            walked += 1
+    return None
+
+
+def _m4a_truncation(path: str) -> Optional[str]:
+    """检查 MP4 顶层原子是否都完整，以及是否包含 moov"""
+    size = os.path.getsize(path)
+    position = 0
+    has_moov = False
+    with open(path, 'rb') as f:
+        while position + 8 <= size:
+            f.seek(position)
+            atom_size, atom_type = struct.unpack('>I4s', f.read(8))
+            if atom_size == 1:
+                atom_size = struct.unpack('>Q', f.read(8))[0]
+            elif atom_size == 0:
+                atom_size = size - position
+            if atom_size < 8:
+                return f"invalid {atom_type!r} atom size {atom_size} at {position}"
+            if position + atom_size > size:
+                return f"{atom_type!r} atom at {position} needs {atom_size} bytes, {size - position} available"
+            has_moov = has_moov or atom_type == b'moov'
+            position += atom_size
+    return None if has_moov else "no moov atom found"
+
+
+def detect_truncation(path: str, name: str = None) -> Optional[str]:
+    """
+    检查音频文件是否被截断（例如下载时没有 Content-Length，连接提前关闭）
+
+    MP3 沿帧链检查最后一帧是否完整，M4A 检查顶层原子是否完整；
+    其他格式或无法识别的文件不做判断。
+
+    Args:
+        path: 文件路径
+        name: 用于判断格式的文件名（例如下载中的临时文件对应的目标路径），默认为 path
+
+    Returns:
+        str: 截断的原因；没有发现截断时返回 None
+    """
+    lower = (name or path).lower()
+    try:
+        if lower.endswith('.m4a'):
+            return _m4a_truncation(path)
+        if lower.endswith('.mp3'):
+            return _mp3_truncation(path)
+    except (OSError, struct.error) as e:
+        return str(e)
+    return None
+
+
+def probe_ffprobe(path: str) -> Dict:
+    """
+    用 ffprobe 读取元数据
+
+    Raises:
+        ValueError: 未安装 ffprobe 或 ffprobe 无法识别文件
+    """
+    if not FFPROBE_PATH:
+        raise ValueError("ffprobe not available")
+    completed = subprocess.run(
+        [FFPROBE_PATH, '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'format=duration,bit_rate:stream=codec_name,sample_rate,channels',
+         '-of', 'json', path],
+        capture_output=True, text=True, timeout=60
+    )
+    if completed.returncode != 0:
+        raise ValueError(completed.stderr.strip() or f"ffprobe exited with {completed.returncode}")
+    data = json.loads(completed.stdout or '{}')
+    fmt = data.get('format') or {}
+    stream = (data.get('streams') or [{}])[0]
+    if 'duration' not in fmt:
+        raise ValueError("ffprobe reported no duration")
+    return {
+        'duration_ms': int(float(fmt['duration']) * 1000),
+        'bitrate': int(fmt['bit_rate']) if fmt.get('bit_rate') else None,
+        'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+        'channels': stream.get('channels'),
+        'codec': stream.get('codec_name'),
+    }
+
+
+def probe_file(path: str) -> Dict:
+    """
+    探测单个音频文件，先解析文件头，失败时退回 ffprobe
+
+    Args:
+        path: 音频文件路径
+
+    Returns:
+        Dict: duration_ms、bitrate、sample_rate、channels、codec、prober；
+        都失败时只有 error
+    """
+    parser = probe_m4a if path.lower().endswith('.m4a') else probe_mp3
+    errors = []
+    for name, probe in (('header', parser), ('ffprobe', probe_ffprobe)):
+        try:
+            result = probe(path)
+        except (OSError, ValueError, struct.error, IndexError, subprocess.SubprocessError) as e:
+            errors.append(f"{name}: {e}")
+            continue
+        result['prober'] = name
+        return result
+    return {'error': '; '.join(errors)}
+
+
+def _probe_batch(paths: List[str]) -> List[Dict]:
+    """进程池中执行的任务：一次探测一批文件，减少进程间通信次数"""
+    return [probe_file(path) for path in paths]
+
+
+class AudioProbe:
+    """音频元数据缓存，路径均为相对音频根目录的 book/disc/filename"""
+
+    def __init__(self, audio_root: str, db_path: str = None, workers: int = None):
+        """
+        Args:
+            audio_root: 音频根目录
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+            workers: 进程池大小，默认读取 AUDIO_PROBE_WORKERS
+        """
+        self.audio_root = audio_root
+        self.db_path = db_path
+        self.workers = max(1, workers or AUDIO_PROBE_WORKERS)
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    def cached(self) -> Dict[str, Dict]:
+        """
+        读取全部缓存（不检查文件是否变化），用于与音频库索引合并
+
+        无法解析的文件同样按 (大小, mtime) 缓存，元数据字段为 None，文件不变时不会重新探测
+
+        Returns:
+            Dict: {path: {size, mtime_ns, duration_ms, bitrate, sample_rate, channels, codec}}
+        """
+        return {
+            row['path']: {key: row[key] for key in ('size', 'mtime_ns') + METADATA_FIELDS}
+            for row in self._conn().execute(
+                'SELECT path, size, mtime_ns, duration_ms, bitrate, sample_rate, channels, codec '
+                'FROM audio_metadata'
+            )
+        }
+
+    def get(self, relative_path: str) -> Optional[Dict]:
+        """
+        获取单个音轨的元数据，缓存缺失或文件已变化时立即探测
+
+        Returns:
+            Dict: duration_ms、bitrate、sample_rate、channels、codec，文件不存在或无法解析时返回 None
+        """
+        try:
+            stat_result = os.stat(os.path.join(self.audio_root, relative_path))
+        except FileNotFoundError:
+            return None
+        return self.probe_many([(relative_path, stat_result.st_size, stat_result.st_mtime_ns)]).get(relative_path)
+
+    def probe_many(self, files: Iterable[Tuple[str, int, int]]) -> Dict[str, Dict]:
+        """
+        批量获取元数据，只探测缓存中没有或 (大小, mtime) 已变化的文件
+
+        Args:
+            files: (相对路径, 大小, mtime_ns)
+
+        Returns:
+            Dict: {path: 元数据}，无法解析的文件不包含在内
+        """
+        files = list(files)
+        if not files:
+            return {}
+        conn = self._conn()
+        known = {}
+        # 分批查询，避免超过 SQLite 的参数个数上限
+        for i in range(0, len(files), 500):
+            chunk = [path for path, _, _ in files[i:i + 500]]
+            for row in conn.execute(
+                f"SELECT * FROM audio_metadata WHERE path IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                known[row['path']] = row
+
+        results = {}
+        missing = []
+        for path, size, mtime_ns in files:
+            row = known.get(path)
+            if row is not None and row['size'] == size and row['mtime_ns'] == mtime_ns:
+                if row['error'] is None:
+                    results[path] = {key: row[key] for key in METADATA_FIELDS}
+            else:
+                missing.append((path, size, mtime_ns))
+        if not missing:
+            return results
+
+        started = time.monotonic()
+        probed = self._probe_paths([os.path.join(self.audio_root, path) for path, _, _ in missing])
+        now = time.time()
+        with transaction(conn):
+            conn.executemany(
+                'INSERT OR REPLACE INTO audio_metadata '
+                '(path, size, mtime_ns, duration_ms, bitrate, sample_rate, channels, codec, prober, error, probed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(path, size, mtime_ns, *(meta.get(key) for key in METADATA_FIELDS),
+                  meta.get('prober'), meta.get('error'), now)
+                 for (path, size, mtime_ns), meta in zip(missing, probed)]
+            )
+        failed = 0
+        for (path, _, _), meta in zip(missing, probed):
+            if 'error' in meta:
+                failed += 1
+                print(f"Audio probe failed for {path}: {meta['error']}")
+            else:
+                results[path] = {key: meta.get(key) for key in METADATA_FIELDS}
+        print(f"Audio probe: {len(missing)} files in {time.monotonic() - started:.2f}s ({failed} failed)")
+        return results
+
+    def _probe_paths(self, paths: List[str]) -> List[Dict]:
+        """探测文件列表，文件较多时分批交给进程池"""
+        if len(paths) < AUDIO_PROBE_POOL_MIN or self.workers == 1:
+            return _probe_batch(paths)
+        workers = min(self.workers, len(paths))
+        chunk_size = -(-len(paths) // (workers * 4))
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return [meta for batch in executor.map(_probe_batch, chunks) for meta in batch]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="探测音频文件的时长、码率和编码")
+    parser.add_argument("paths", nargs='+', help="音频文件路径")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        print(f"{path}: {json.dumps(probe_file(path), ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,401 @@
+"""
+批量生成字幕
+为整本教材或单张光盘预先生成缺失的 .srt 和 .optimized.srt，开学前预热新教材，
+避免第一个听众等待 ASR 和 LLM。支持并发上限、限速、中断后续跑和进度汇总。
+
+用法:
+    python -m app.batch_subtitles ET3
+    python -m app.batch_subtitles ET3/disc1 ET4 --concurrency 4 --rate 20
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from app.library import AUDIO_EXTENSIONS
+from app.llm.volcano_audio import (ASR_INPUT, ASR_PROVIDER, VolcanoAudioProvider, VolcanoJobPoller, get_job_poller,
+                                   is_optimization_stale, load_previous_optimization, optimization_source_path,
+                                   optimize_subtitles_incremental, optimize_subtitles_with_llm, poll_timeout_for,
+                                   save_optimized_subtitle, subtitle_cache_params, transcribe_audio, uses_local_asr)
+from app.subtitle_store import copy_atomic, file_sha256, write_subtitle
+
+# ASR 服务需要可公开访问的音频 URL
+PUBLIC_AUDIO_BASE_URL = os.getenv('PUBLIC_AUDIO_BASE_URL', 'https://read-ai.instap.net/static/audios')
+
+
+def public_audio_url(book: str, disc: str, filename: str, base_url: str = None) -> str:
+    """拼接音轨的公开访问 URL（路径各段做 URL 编码）"""
+    base_url = (base_url or PUBLIC_AUDIO_BASE_URL).rstrip('/')
+    return f"{base_url}/{quote(book)}/{quote(disc)}/{quote(filename)}"
+
+
+class RateLimiter:
+    """按固定间隔放行调用，所有线程共享，rate 为每分钟允许的调用次数"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 60.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BatchSubtitleGenerator:
+    """
+    批量字幕生成器，已存在的字幕文件会被跳过，因此中断后重新执行即可续跑
+
+    ASR 任务提交后交给多路复用的 VolcanoJobPoller 跟踪，等待识别结果时不占用线程；
+    识别完成后写字幕和 LLM 优化在 concurrency 个线程中执行。
+    """
+
+    def __init__(self, audio_root: str, subtitle_root: str, concurrency: int = 2,
+                 rate: float = None, optimize: bool = True, audio_base_url: str = None,
+                 audio_store=None, task_store=None, on_disc_done=None,
+                 asr_concurrency: int = 8, poller: VolcanoJobPoller = None, subtitle_store=None,
+                 prober=None, asr_input: str = None):
+        """
+        Args:
+            audio_root: 音频根目录
+            subtitle_root: 字幕根目录
+            concurrency: 写字幕和 LLM 优化的线程数
+            rate: 每分钟最多发起的 ASR/LLM 调用次数，None 表示不限速
+            optimize: 是否生成 .optimized.srt
+            audio_base_url: 音频公开访问的基础 URL
+            audio_store: AudioStore，提供时先尝试复用内容相同音轨的字幕
+            task_store: 字幕优化的 TaskStore，提供时与 Web 端共享认领，避免重复优化
+            on_disc_done: 每张光盘处理完后的回调 (book, disc)，例如刷新音频库索引
+            asr_concurrency: 同时进行中的 ASR 任务数
+            poller: ASR 任务轮询器，默认使用进程内共享的轮询器
+            subtitle_store: SubtitleStore，提供时先从内容寻址存储取字幕，新生成的字幕也收入存储
+            prober: AudioProbe，提供时预先探测所有音轨的时长，按时长从长到短提交 ASR 并据此设置等待时间
+            asr_input: local 直接上传本地文件识别（格式不支持或失败时退回公开 URL），url 只用公开 URL，默认读取 ASR_INPUT
+        """
+        self.audio_root = audio_root
+        self.subtitle_root = subtitle_root
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate)
+        self.optimize = optimize
+        self.audio_base_url = audio_base_url
+        self.audio_store = audio_store
+        self.task_store = task_store
+        self.on_disc_done = on_disc_done
+        self.asr_concurrency = max(1, asr_concurrency)
+        self.poller = poller
+        self.subtitle_store = subtitle_store
+        self.prober = prober
+        self.asr_input = asr_input or ASR_INPUT
+        self._metadata = {}
+        self._converter = VolcanoAudioProvider()
+
+    # ------------------------------------------------------------------ 音轨枚举
+
+    def find_tracks(self, targets: List[str]) -> List[Tuple[str, str, str]]:
+        """
+        展开 book 或 book/disc 目标为音轨列表
+
+        Returns:
+            List[Tuple]: (book, disc, filename)，按路径排序
+        """
+        tracks = []
+        for target in targets:
+            parts = [part for part in target.strip('/').split('/') if part]
+            if not parts or len(parts) > 2 or '..' in parts:
+                raise ValueError(f"目标格式应为 book 或 book/disc: {target}")
+
+            book_dir = os.path.join(self.audio_root, parts[0])
+            if not os.path.isdir(book_dir):
+                raise ValueError(f"教材不存在: {parts[0]}")
+            discs = [parts[1]] if len(parts) == 2 else sorted(
+                name for name in os.listdir(book_dir) if os.path.isdir(os.path.join(book_dir, name))
+            )
+            for disc in discs:
+                disc_dir = os.path.join(book_dir, disc)
+                if not os.path.isdir(disc_dir):
+                    raise ValueError(f"光盘不存在: {parts[0]}/{disc}")
+                for filename in sorted(os.listdir(disc_dir)):
+                    if filename.lower().endswith(AUDIO_EXTENSIONS) and not filename.startswith('.'):
+                        tracks.append((parts[0], disc, filename))
+        return sorted(set(tracks))
+
+    def _probe_tracks(self, tracks: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Dict]:
+        """批量探测音轨元数据（已缓存的不重新探测），探测失败的音轨不包含在内"""
+        files = {}
+        for track in tracks:
+            path = '/'.join(track)
+            try:
+                stat_result = os.stat(os.path.join(self.audio_root, path))
+            except OSError:
+                continue
+            files[path] = (track, stat_result.st_size, stat_result.st_mtime_ns)
+        metadata = self.prober.probe_many((path, size, mtime_ns) for path, (_, size, mtime_ns) in files.items())
+        return {files[path][0]: meta for path, meta in metadata.items()}
+
+    def _preferred_asr(self, filename: str) -> str:
+        return 'dashscope' if uses_local_asr(filename, self.asr_input) else ASR_PROVIDER
+
+    def _duration(self, track: Tuple[str, str, str]) -> int:
+        return (self._metadata.get(track) or {}).get('duration_ms') or 0
+
+    def _transcribe_local(self, track: Tuple[str, str, str]):
+        """上传本地文件识别，返回 (CueStore, 识别服务)"""
+        metadata = self._metadata.get(track) or {}
+        return transcribe_audio(public_audio_url(*track, base_url=self.audio_base_url),
+                                os.path.join(self.audio_root, *track),
+                                duration_ms=metadata.get('duration_ms'), sample_rate=metadata.get('sample_rate'),
+                                asr_input=self.asr_input)
+
+    def _subtitle_path(self, book: str, disc: str, filename: str, suffix: str) -> str:
+        stem = os.path.splitext(filename)[0]
+        return os.path.join(self.subtitle_root, book, disc, f"{stem}{suffix}")
+
+    # ------------------------------------------------------------------ 处理
+
+    def _prepare(self, book: str, disc: str, filename: str) -> Dict:
+        """检查已有字幕（必要时复用相同内容音轨的字幕），返回初始处理结果"""
+        result = {'track': f"{book}/{disc}/{filename}", 'srt': 'skipped',
+                  'optimized': 'skipped' if self.optimize else 'disabled', 'error': None}
+        if not os.path.exists(self._subtitle_path(book, disc, filename, '.srt')):
+            result['srt'] = 'pending'
+            if self.subtitle_store is not None and self.subtitle_store.materialize(
+                    result['track'], 'srt', subtitle_cache_params(asr=self._preferred_asr(filename))):
+                result['srt'] = 'reused'
+            elif self.audio_store is not None and self.audio_store.reuse_subtitles(result['track']):
+                result['srt'] = 'reused'
+                if os.path.exists(self._subtitle_path(book, disc, filename, '.optimized.srt')):
+                    result['optimized'] = 'reused'
+        return result
+
+    def _finish_track(self, book: str, disc: str, filename: str, result: Dict,
+                      asr_future: Optional[Future]) -> Dict:
+        """
+        写入识别结果并生成缺失的优化字幕
+
+        Returns:
+            Dict: track、srt、optimized（值为 skipped / reused / generated / failed / busy / disabled）和 error
+        """
+        srt_path = self._subtitle_path(book, disc, filename, '.srt')
+        optimized_path = self._subtitle_path(book, disc, filename, '.optimized.srt')
+        try:
+            if asr_future is not None:
+                if self.asr_input == 'local':
+                    cues, asr = asr_future.result()
+                    srt_content = cues.to_srt() if len(cues) else self._converter.convert_to_srt({})
+                    words = sorted(word for cue_words in cues.words if cue_words for word in cue_words)
+                else:
+                    subtitles_data = asr_future.result()
+                    asr = ASR_PROVIDER
+                    srt_content = self._converter.convert_to_srt(subtitles_data)
+                    words = self._converter.extract_words(subtitles_data)
+                write_subtitle(srt_path, srt_content, words=words)
+                result['srt'] = 'generated'
+                if self.subtitle_store is not None:
+                    self.subtitle_store.adopt(result['track'], 'srt', subtitle_cache_params(asr=asr))
+
+            # 原始字幕重新生成过时，已有的优化字幕需要增量重新优化
+            if self.optimize and (not os.path.exists(optimized_path)
+                                  or is_optimization_stale(srt_path, optimized_path)):
+                optimized_params = subtitle_cache_params(optimized_from=file_sha256(srt_path))
+                if self.subtitle_store is not None and self.subtitle_store.materialize(
+                        result['track'], 'optimized', optimized_params):
+                    copy_atomic(srt_path, optimization_source_path(optimized_path))
+                    result['optimized'] = 'reused'
+                else:
+                    result['optimized'] = self._optimize(book, disc, filename, srt_path, optimized_path)
+                    if result['optimized'] == 'generated' and self.subtitle_store is not None:
+                        self.subtitle_store.adopt(result['track'], 'optimized', optimized_params)
+        except Exception as e:
+            result['error'] = str(e)
+            if result['srt'] == 'pending':
+                result['srt'] = 'failed'
+            if self.optimize:
+                result['optimized'] = 'failed'
+        return result
+
+    def _optimize(self, book: str, disc: str, filename: str, srt_path: str, optimized_path: str) -> str:
+        # 与 /api/optimize-subtitle 使用相同的任务标识，Web 端正在优化时跳过
+        task_key = f"{book}_{disc}_{filename}"
+        if self.task_store is not None and not self.task_store.claim(task_key):
+            return 'busy'
+
+        try:
+            with open(srt_path, 'r', encoding='utf-8') as f:
+                original_srt = f.read()
+            self.rate_limiter.acquire()
+            previous_source, previous_optimized = load_previous_optimization(optimized_path)
+            if previous_source is not None:
+                optimized_srt = optimize_subtitles_incremental(original_srt, previous_source, previous_optimized)
+            else:
+                optimized_srt = optimize_subtitles_with_llm(original_srt)
+            if not optimized_srt or optimized_srt == original_srt:
+                raise RuntimeError('LLM optimization failed or returned unchanged content')
+            save_optimized_subtitle(optimized_path, optimized_srt, original_srt)
+        except Exception as e:
+            if self.task_store is not None:
+                self.task_store.fail(task_key, str(e))
+            raise
+
+        if self.task_store is not None:
+            self.task_store.complete(task_key, {
+                'optimized_url': f"/subtitles/{book}/{disc}/{os.path.splitext(filename)[0]}.optimized.srt"
+            })
+        return 'generated'
+
+    def _schedule(self, tracks: List[Tuple[str, str, str]], executor: ThreadPoolExecutor,
+                  results: queue.Queue, asr_executor: ThreadPoolExecutor = None):
+        """
+        依次提交 ASR 任务（受 asr_concurrency 和限速约束），识别完成后交给线程池
+
+        本地识别需要持续上传文件，在 asr_executor 中执行；URL 识别交给轮询器，不占用线程
+        """
+        asr_slots = threading.BoundedSemaphore(self.asr_concurrency)
+
+        def finish(track, result, asr_future):
+            results.put((track, self._finish_track(*track, result, asr_future)))
+
+        for track in tracks:
+            try:
+                result = self._prepare(*track)
+            except Exception as e:
+                results.put((track, {'track': '/'.join(track), 'srt': 'failed',
+                                     'optimized': 'failed' if self.optimize else 'disabled', 'error': str(e)}))
+                continue
+
+            if result['srt'] != 'pending':
+                executor.submit(finish, track, result, None)
+                continue
+
+            asr_slots.acquire()
+            self.rate_limiter.acquire()
+            try:
+                if asr_executor is not None:
+                    asr_future = asr_executor.submit(self._transcribe_local, track)
+                else:
+                    asr_future = self.poller.submit(public_audio_url(*track, base_url=self.audio_base_url),
+                                                    timeout=poll_timeout_for(self._duration(track)))
+            except Exception as e:
+                asr_slots.release()
+                asr_future = Future()
+                asr_future.set_exception(e)
+
+            def on_asr_done(future, track=track, result=result):
+                asr_slots.release()
+                executor.submit(finish, track, result, future)
+
+            asr_future.add_done_callback(on_asr_done)
+
+    def run(self, targets: List[str]) -> Dict:
+        """
+        处理所有目标并打印进度
+
+        Returns:
+            Dict: 汇总信息 total、srt/optimized 各状态计数、failed（失败音轨及原因）、elapsed
+        """
+        tracks = self.find_tracks(targets)
+        if self.poller is None:
+            self.poller = get_job_poller()
+        started = time.monotonic()
+        summary = {'total': len(tracks), 'srt': {}, 'optimized': {}, 'failed': []}
+        remaining_per_disc = {}
+        for book, disc, _ in tracks:
+            remaining_per_disc[(book, disc)] = remaining_per_disc.get((book, disc), 0) + 1
+
+        print(f"Batch subtitles: {len(tracks)} tracks, concurrency={self.concurrency}, "
+              f"asr_concurrency={self.asr_concurrency}, asr_input={self.asr_input}")
+        if self.prober is not None:
+            self._metadata = self._probe_tracks(tracks)
+            # 长音轨识别最慢，先提交可以缩短整批的收尾时间
+            tracks = sorted(tracks, key=lambda track: -self._duration(track))
+            print(f"Audio duration: {sum(map(self._duration, tracks)) / 60000:.1f} min "
+                  f"({len(self._metadata)}/{len(tracks)} tracks probed)")
+        results = queue.Queue()
+        asr_executor = ThreadPoolExecutor(max_workers=self.asr_concurrency, thread_name_prefix='batch-asr') \
+            if self.asr_input == 'local' else None
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch-subtitles') as executor:
+            scheduler = threading.Thread(target=self._schedule, args=(tracks, executor, results, asr_executor),
+                                         daemon=True)
+            scheduler.start()
+            for done in range(1, len(tracks) + 1):
+                (book, disc, _), result = results.get()
+                for stage in ('srt', 'optimized'):
+                    summary[stage][result[stage]] = summary[stage].get(result[stage], 0) + 1
+                if result['error']:
+                    summary['failed'].append({'track': result['track'], 'error': result['error']})
+
+                print(f"[{done}/{len(tracks)}] {result['track']}: srt={result['srt']} "
+                      f"optimized={result['optimized']}" + (f" error={result['error']}" if result['error'] else ''))
+
+                remaining_per_disc[(book, disc)] -= 1
+                if remaining_per_disc[(book, disc)] == 0 and self.on_disc_done:
+                    self.on_disc_done(book, disc)
+            scheduler.join()
+        if asr_executor is not None:
+            asr_executor.shutdown()
+
+        summary['elapsed'] = round(time.monotonic() - started, 1)
+        return summary
+
+
+def print_summary(summary: Dict):
+    """打印汇总信息"""
+    print('-' * 50)
+    print(f"Tracks: {summary['total']}  elapsed: {summary['elapsed']}s")
+    for stage in ('srt', 'optimized'):
+        counts = ', '.join(f"{status}={count}" for status, count in sorted(summary[stage].items()))
+        print(f"{stage}: {counts or '-'}")
+    for failure in summary['failed']:
+        print(f"FAILED {failure['track']}: {failure['error']}")
+    print('-' * 50)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="为教材或光盘批量生成缺失的字幕（中断后重新执行即可续跑）")
+    parser.add_argument("targets", nargs='+', help="book 或 book/disc，相对于 app/static/audios")
+    parser.add_argument("--concurrency", "-c", type=int, default=2, help="写字幕和 LLM 优化的线程数（默认 2）")
+    parser.add_argument("--asr-concurrency", type=int, default=8, help="同时进行中的 ASR 任务数（默认 8）")
+    parser.add_argument("--rate", "-r", type=float, help="每分钟最多发起的 ASR/LLM 调用次数（默认不限速）")
+    parser.add_argument("--no-optimize", action='store_true', help="只生成 .srt，不做 LLM 优化")
+    parser.add_argument("--base-url", help="音频公开访问的基础 URL（默认读取 PUBLIC_AUDIO_BASE_URL）")
+    parser.add_argument("--asr-input", choices=('local', 'url'),
+                        help="local 直接上传本地文件识别，url 由 ASR 服务从公开 URL 下载（默认读取 ASR_INPUT）")
+    args = parser.parse_args(argv)
+
+    from app import (AUDIO_ROOT, SUBTITLE_ROOT, audio_prober, audio_store, library_index, optimization_tasks,
+                     subtitle_artifacts)
+
+    generator = BatchSubtitleGenerator(
+        AUDIO_ROOT, SUBTITLE_ROOT,
+        concurrency=args.concurrency,
+        asr_concurrency=args.asr_concurrency,
+        rate=args.rate,
+        optimize=not args.no_optimize,
+        audio_base_url=args.base_url,
+        audio_store=audio_store,
+        task_store=optimization_tasks,
+        on_disc_done=library_index.refresh_disc,
+        subtitle_store=subtitle_artifacts,
+        prober=audio_prober,
+        asr_input=args.asr_input,
+    )
+    try:
+        summary = generator.run(args.targets)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 2
+    print_summary(summary)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
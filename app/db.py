@@ -0,0 +1,80 @@
+"""
+SQLite 持久化工具
+所有 gunicorn worker 共享同一个数据库文件（WAL 模式），用于保存音频库索引等状态
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 部署时 data 目录与 audios/subtitles 一样软链接到 shared 目录，发版后数据不丢失
+DATA_ROOT = os.getenv('READ_AI_DATA_DIR', os.path.join(PROJECT_ROOT, 'data'))
+DB_PATH = os.getenv('READ_AI_DB_PATH', os.path.join(DATA_ROOT, 'read-ai.sqlite3'))
+
+_local = threading.local()
+
+
+class _Connection(sqlite3.Connection):
+    """记录已初始化过的表结构，避免每次获取连接都执行建表语句"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.applied_schemas = set()
+
+
+def get_connection(db_path: str = None, schema: tuple = None) -> sqlite3.Connection:
+    """
+    获取当前线程的数据库连接
+
+    sqlite3 连接不能跨线程、跨进程共享，这里按 (进程, 线程, 数据库文件) 缓存连接，
+    gunicorn fork 出的 worker 会自动重新建立连接。
+
+    Args:
+        db_path: 数据库文件路径，默认为 DB_PATH
+        schema: (名称, 建表SQL) 元组，首次使用该连接时执行
+
+    Returns:
+        sqlite3.Connection: 自动提交模式的连接，行以 sqlite3.Row 返回
+    """
+    db_path = db_path or DB_PATH
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, factory=_Connection)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        _local.connections[db_path] = conn
+
+    if schema and schema[0] not in conn.applied_schemas:
+        conn.executescript(schema[1])
+        conn.applied_schemas.add(schema[0])
+
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection, immediate: bool = True):
+    """
+    显式事务，BEGIN IMMEDIATE 会立即获取写锁，保证"先读后写"在多个 worker 之间是原子的
+
+    Args:
+        conn: get_connection 返回的连接
+        immediate: 是否立即获取写锁
+    """
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
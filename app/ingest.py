@@ -0,0 +1,262 @@
+"""
+音频入库
+上传/导入的音频边写临时文件边计算 sha256，写完后原子重命名到目标路径，
+并在 SQLite 中记录内容哈希：相同内容只保存一份（硬链接），字幕可在相同内容的音轨之间复用
+"""
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, Iterable, Optional
+
+from werkzeug.security import safe_join
+
+from app.db import get_connection
+from app.subtitle_store import copy_atomic, notify_subtitle_written
+
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = ('audio_store', """
+CREATE TABLE IF NOT EXISTS audio_files (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audio_files_sha256 ON audio_files (sha256);
+""")
+
+SUBTITLE_SUFFIXES = ('.srt', '.vtt', '.json', '.optimized.srt', '.optimized.vtt', '.optimized.json',
+                     '.optimized.src.srt')
+
+
+def hash_file(path: str) -> str:
+    """按块计算文件的 sha256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class AudioStore:
+    """音频内容哈希存储，path 均为相对 audio_root 的 book/disc/filename"""
+
+    def __init__(self, audio_root: str, subtitle_root: str, db_path: str = None):
+        """
+        Args:
+            audio_root: 音频根目录
+            subtitle_root: 字幕根目录
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+        """
+        self.audio_root = audio_root
+        self.subtitle_root = subtitle_root
+        self.db_path = db_path
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    def resolve(self, relative_path: str) -> str:
+        """
+        将相对路径解析为 audio_root 下的绝对路径
+
+        Raises:
+            ValueError: 路径越界（例如包含 ..）
+        """
+        path = safe_join(self.audio_root, relative_path)
+        if path is None:
+            raise ValueError(f"非法的音频路径: {relative_path}")
+        return path
+
+    # ------------------------------------------------------------------ 写入
+
+    def ingest_stream(self, stream, relative_path: str) -> Dict:
+        """
+        从文件对象流式入库（例如 request.files['audioFile'].stream）
+
+        Args:
+            stream: 支持 read(size) 的二进制文件对象
+            relative_path: 目标路径 book/disc/filename
+
+        Returns:
+            Dict: 见 ingest_chunks
+        """
+        return self.ingest_chunks(iter(lambda: stream.read(CHUNK_SIZE), b''), relative_path)
+
+    def ingest_chunks(self, chunks: Iterable[bytes], relative_path: str) -> Dict:
+        """
+        流式入库：边写临时文件边计算哈希，完成后原子替换目标文件
+
+        临时文件与目标文件位于同一目录，os.replace 保证读者要么看到旧文件，要么看到完整的新文件。
+
+        Args:
+            chunks: 字节块迭代器
+            relative_path: 目标路径 book/disc/filename
+
+        Returns:
+            Dict: path、sha256、size、deduplicated（是否与已有音频共享同一份数据）
+        """
+        dest = self.resolve(relative_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.ingest-', suffix='.part', dir=os.path.dirname(dest))
+
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            return self._commit(tmp_path, relative_path, hasher.hexdigest(), size)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def ingest_file(self, tmp_path: str, relative_path: str, sha256: str = None) -> Dict:
+        """
+        登记一个已经写好的临时文件（需与目标在同一文件系统），未提供哈希时重新计算
+
+        Args:
+            tmp_path: 临时文件路径，成功后会被移动或删除
+            relative_path: 目标路径 book/disc/filename
+            sha256: 已知的内容哈希
+
+        Returns:
+            Dict: 见 ingest_chunks
+        """
+        sha256 = sha256 or hash_file(tmp_path)
+        try:
+            return self._commit(tmp_path, relative_path, sha256, os.path.getsize(tmp_path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path: str, relative_path: str, sha256: str, size: int) -> Dict:
+        dest = self.resolve(relative_path)
+        canonical = self.find_by_hash(sha256, exclude=relative_path)
+
+        deduplicated = False
+        if canonical:
+            # 相同内容已存在：硬链接到已有文件，磁盘上只保存一份
+            link_path = f"{tmp_path}.link"
+            try:
+                os.link(self.resolve(canonical), link_path)
+                os.replace(link_path, dest)
+                deduplicated = True
+            except OSError:
+                # 跨文件系统等不支持硬链接的情况，退回普通文件
+                if os.path.exists(link_path):
+                    os.remove(link_path)
+        if not deduplicated:
+            os.replace(tmp_path, dest)
+
+        self._record(relative_path, sha256, size, os.stat(dest).st_mtime_ns)
+        if deduplicated:
+            print(f"Audio ingested: {relative_path} sha256={sha256[:12]} (deduplicated with {canonical})")
+        else:
+            print(f"Audio ingested: {relative_path} sha256={sha256[:12]} size={size}")
+        return {
+            'path': relative_path,
+            'sha256': sha256,
+            'size': size,
+            'deduplicated': deduplicated,
+        }
+
+    def _record(self, relative_path: str, sha256: str, size: int, mtime_ns: int):
+        self._conn().execute(
+            'INSERT INTO audio_files (path, sha256, size, mtime_ns, created_at) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET '
+            'sha256 = excluded.sha256, size = excluded.size, mtime_ns = excluded.mtime_ns',
+            (relative_path, sha256, size, mtime_ns, time.time())
+        )
+
+    # ------------------------------------------------------------------ 查询
+
+    def find_by_hash(self, sha256: str, exclude: str = None) -> Optional[str]:
+        """
+        查找内容相同且仍存在于磁盘上的音频
+
+        Returns:
+            相对路径，没有找到时返回 None
+        """
+        rows = self._conn().execute(
+            'SELECT path FROM audio_files WHERE sha256 = ? ORDER BY created_at', (sha256,)
+        ).fetchall()
+        for row in rows:
+            if row['path'] != exclude and os.path.isfile(self.resolve(row['path'])):
+                return row['path']
+        return None
+
+    def ensure_hash(self, relative_path: str) -> Optional[str]:
+        """
+        获取音频的内容哈希；文件不是通过入库接口写入（例如 rsync 同步）或已被修改时重新计算
+
+        Returns:
+            sha256，文件不存在时返回 None
+        """
+        path = self.resolve(relative_path)
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        row = self._conn().execute(
+            'SELECT sha256, size, mtime_ns FROM audio_files WHERE path = ?', (relative_path,)
+        ).fetchone()
+        if row and row['size'] == stat_result.st_size and row['mtime_ns'] == stat_result.st_mtime_ns:
+            return row['sha256']
+
+        sha256 = hash_file(path)
+        self._record(relative_path, sha256, stat_result.st_size, stat_result.st_mtime_ns)
+        return sha256
+
+    # ------------------------------------------------------------------ 字幕复用
+
+    def _subtitle_path(self, relative_path: str, suffix: str) -> str:
+        stem = os.path.splitext(relative_path)[0]
+        return os.path.join(self.subtitle_root, f"{stem}{suffix}")
+
+    def reuse_subtitles(self, relative_path: str) -> bool:
+        """
+        如果内容相同的其他音轨已经有字幕，直接复制过来，省去一次 ASR 和 LLM 调用
+
+        Args:
+            relative_path: 目标音轨 book/disc/filename
+
+        Returns:
+            bool: 是否复用了原始字幕
+        """
+        target_srt = self._subtitle_path(relative_path, '.srt')
+        if os.path.exists(target_srt):
+            return False
+
+        sha256 = self.ensure_hash(relative_path)
+        if not sha256:
+            return False
+
+        rows = self._conn().execute(
+            'SELECT path FROM audio_files WHERE sha256 = ? AND path != ? ORDER BY created_at',
+            (sha256, relative_path)
+        ).fetchall()
+        for row in rows:
+            source_srt = self._subtitle_path(row['path'], '.srt')
+            if not os.path.exists(source_srt):
+                continue
+            os.makedirs(os.path.dirname(target_srt), exist_ok=True)
+            for suffix in SUBTITLE_SUFFIXES:
+                source = self._subtitle_path(row['path'], suffix)
+                if os.path.exists(source):
+                    # 字幕可能是内容寻址存储的硬链接，复制到临时文件再原子替换
+                    copy_atomic(source, self._subtitle_path(relative_path, suffix))
+            for suffix in ('.srt', '.optimized.srt'):
+                if os.path.exists(self._subtitle_path(relative_path, suffix)):
+                    notify_subtitle_written(self._subtitle_path(relative_path, suffix))
+            print(f"Subtitles reused from {row['path']} for {relative_path}")
+            return True
+        return False
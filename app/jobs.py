@@ -0,0 +1,231 @@
+"""
+后台任务执行器
+有界线程池 + 优先级队列，替代每个请求新建一个线程的做法：
+正在播放的音轨优先于预取任务，队列满时拒绝新任务，并提供排队/运行/完成任务的查询
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# 优先级，数值越小越先执行
+PRIORITY_INTERACTIVE = 0  # 用户正在播放的音轨
+PRIORITY_DEFAULT = 5
+PRIORITY_PREFETCH = 10  # 预取、批量任务
+
+PRIORITY_NAMES = {
+    'interactive': PRIORITY_INTERACTIVE,
+    'default': PRIORITY_DEFAULT,
+    'prefetch': PRIORITY_PREFETCH,
+}
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    """后台任务记录"""
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: Dict, name: str, priority: int, key: str = None):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        self.key = key
+        self.priority = priority
+        self.status = 'queued'
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'priority': self.priority,
+            'status': self.status,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'wait_seconds': round((self.started_at or time.time()) - self.submitted_at, 3),
+        }
+
+
+class BoundedExecutor:
+    """
+    有界优先级线程池
+
+    - 工作线程数量固定（max_workers），排队任务数超过 max_queue 时 submit 抛出 QueueFullError
+    - 相同 key 的任务在排队中时不会重复提交；以更高优先级再次提交会把它提前
+    - 工作线程在第一次提交时启动，gunicorn fork 之后会在子进程中重新创建
+    """
+
+    def __init__(self, name: str, max_workers: int = None, max_queue: int = None, history: int = 100):
+        """
+        Args:
+            name: 执行器名称，用于日志和查询接口
+            max_workers: 工作线程数，默认读取 BACKGROUND_WORKERS（2）
+            max_queue: 最大排队任务数，默认读取 BACKGROUND_QUEUE_SIZE（100）
+            history: 保留的已完成任务记录数
+        """
+        self.name = name
+        self.max_workers = max_workers or int(os.getenv('BACKGROUND_WORKERS', '2'))
+        self.max_queue = max_queue or int(os.getenv('BACKGROUND_QUEUE_SIZE', '100'))
+
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._queue = queue.PriorityQueue()
+        self._queued = {}  # job.id -> Job
+        self._queued_keys = {}  # key -> Job
+        self._running = {}
+        self._finished = deque(maxlen=history)
+        self._threads = []
+        self._pid = None
+
+    def submit(self, fn: Callable, *args, name: str = None, priority: int = PRIORITY_DEFAULT,
+               key: str = None, **kwargs) -> Job:
+        """
+        提交任务
+
+        Args:
+            fn: 任务函数
+            *args, **kwargs: 任务参数
+            name: 任务名称，用于查询接口
+            priority: 优先级，数值越小越先执行
+            key: 去重键，相同 key 的任务排队中时返回已有任务
+
+        Returns:
+            Job: 任务记录
+
+        Raises:
+            QueueFullError: 排队任务数已达上限
+        """
+        with self._lock:
+            self._ensure_workers()
+
+            existing = self._queued_keys.get(key) if key else None
+            if existing is not None:
+                if priority < existing.priority:
+                    # 旧的队列项在出队时会因优先级不一致被跳过
+                    existing.priority = priority
+                    self._queue.put((priority, next(self._counter), existing))
+                return existing
+
+            if len(self._queued) >= self.max_queue:
+                raise QueueFullError(f"{self.name} 任务队列已满（{self.max_queue}）")
+
+            job = Job(fn, args, kwargs, name or getattr(fn, '__name__', 'job'), priority, key)
+            self._queued[job.id] = job
+            if key:
+                self._queued_keys[key] = job
+            self._queue.put((priority, next(self._counter), job))
+            return job
+
+    def stats(self) -> Dict:
+        """
+        查询执行器状态
+
+        Returns:
+            Dict: 配置、排队中（按执行顺序）、运行中、最近完成的任务
+        """
+        with self._lock:
+            queued = sorted(self._queued.values(), key=lambda j: (j.priority, j.submitted_at))
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': [job.to_dict() for job in queued],
+                'running': [job.to_dict() for job in self._running.values()],
+                'finished': [job.to_dict() for job in reversed(self._finished)],
+            }
+
+    def _ensure_workers(self):
+        """在当前进程中启动工作线程（调用方持有锁）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        if self._pid is not None:
+            # fork 之后父进程的线程不存在于子进程中，丢弃继承来的队列状态
+            self._queue = queue.PriorityQueue()
+            self._queued.clear()
+            self._queued_keys.clear()
+            self._running.clear()
+        self._pid = pid
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_job(self, work_queue: queue.PriorityQueue) -> Optional[Job]:
+        priority, _, job = work_queue.get()
+        with self._lock:
+            # 被提前的任务会在队列里留下旧的队列项，跳过它们
+            if job.status != 'queued' or priority != job.priority:
+                return None
+            job.status = 'running'
+            job.started_at = time.time()
+            self._queued.pop(job.id, None)
+            if job.key:
+                self._queued_keys.pop(job.key, None)
+            self._running[job.id] = job
+        return job
+
+    def _worker(self):
+        work_queue = self._queue
+        while True:
+            job = self._next_job(work_queue)
+            if job is None:
+                continue
+            try:
+                job.fn(*job.args, **job.kwargs)
+                job.status = 'completed'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                print(f"Background job {job.name} failed: {str(e)}")
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._running.pop(job.id, None)
+                    self._finished.append(job)
+                job.done.set()
+
+
+def parse_priority(value) -> int:
+    """
+    将请求中的优先级转换为数值，支持 'interactive' / 'default' / 'prefetch' 或整数
+
+    Returns:
+        int: 优先级
+    """
+    if value is None:
+        return PRIORITY_DEFAULT
+    if isinstance(value, int):
+        return value
+    if str(value).lstrip('-').isdigit():
+        return int(value)
+    if value not in PRIORITY_NAMES:
+        raise ValueError(f"不支持的优先级: {value}")
+    return PRIORITY_NAMES[value]
+
+
+# 进程内共享的后台 LLM 任务执行器
+background_executor = BoundedExecutor('llm-jobs')
+
+
+def get_background_jobs() -> List[Dict]:
+    """返回所有执行器的状态，供 /api/jobs 使用"""
+    return [background_executor.stats()]
@@ -0,0 +1,437 @@
+"""
+音频库索引
+将 AUDIO_ROOT 下 教材/光盘/音轨 的结构和字幕状态保存在 SQLite 中，
+根据目录 mtime 增量更新，首页和列表接口直接读取索引，不再每次遍历整个目录树
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.db import get_connection, transaction
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a')
+
+SCHEMA = ('library', """
+CREATE TABLE IF NOT EXISTS library_books (
+    book TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS library_discs (
+    book TEXT NOT NULL,
+    disc TEXT NOT NULL,
+    audio_mtime_ns INTEGER NOT NULL,
+    subtitle_mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (book, disc)
+);
+CREATE TABLE IF NOT EXISTS library_tracks (
+    book TEXT NOT NULL,
+    disc TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    has_subtitle INTEGER NOT NULL DEFAULT 0,
+    has_optimized INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (book, disc, filename)
+);
+CREATE TABLE IF NOT EXISTS library_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+""")
+
+
+def _list_dirs(path: str) -> Dict[str, int]:
+    """列出目录下的子目录及其 mtime，目录不存在时返回空字典"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry.stat().st_mtime_ns for entry in it if entry.is_dir()}
+    except FileNotFoundError:
+        return {}
+
+
+def _dir_mtime(path: str) -> int:
+    """目录 mtime，不存在时返回 0"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _probed_for(meta: Optional[Dict], size: int, mtime_ns: int) -> bool:
+    """缓存的探测结果是否对应当前文件（无法解析的文件也算已探测）"""
+    return meta is not None and (meta['size'], meta['mtime_ns']) == (size, mtime_ns)
+
+
+def _has_metadata(meta: Dict) -> bool:
+    """探测结果中是否有元数据（无法解析的文件全部为 None）"""
+    return any(value is not None for key, value in meta.items() if key not in ('size', 'mtime_ns'))
+
+
+class LibraryIndex:
+    """音频库索引，每个 worker 一个实例，数据保存在共享的 SQLite 文件中"""
+
+    def __init__(self, audio_root: str, subtitle_root: str, db_path: str = None,
+                 sync_interval: float = None, prober=None):
+        """
+        Args:
+            audio_root: 音频根目录
+            subtitle_root: 字幕根目录
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+            sync_interval: 两次增量同步之间的最小间隔（秒）
+            prober: AudioProbe，提供时同步后探测新增或修改过的音轨，列表中包含时长、码率和编码
+        """
+        self.audio_root = audio_root
+        self.subtitle_root = subtitle_root
+        self.db_path = db_path
+        self.prober = prober
+        if sync_interval is None:
+            sync_interval = float(os.getenv('LIBRARY_SYNC_INTERVAL', '10'))
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._sync_thread = None
+        self._last_sync = 0.0
+        self._cache_generation = None
+        self._cache = None
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    # ------------------------------------------------------------------ 读取
+
+    def get_tree(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        获取音频树，结构与首页模板使用的 audio_tree 相同
+
+        Returns:
+            Dict: {book: {disc: [filename, ...]}}
+        """
+        self._ensure_fresh()
+        return self._load()['tree']
+
+    def get_tracks(self, book: str = None, disc: str = None) -> List[Dict]:
+        """
+        获取音轨列表（含字幕状态），可按教材和光盘过滤
+
+        Args:
+            book: 教材名称，None 表示全部
+            disc: 光盘名称，None 表示全部
+
+        Returns:
+            List[Dict]: 每个音轨包含 book、disc、filename、size、has_subtitle、has_optimized，
+            以及 duration_ms、bitrate、codec（未探测时为 None）
+        """
+        self._ensure_fresh()
+        tracks = self._load()['tracks']
+        if book is not None:
+            tracks = [t for t in tracks if t['book'] == book]
+        if disc is not None:
+            tracks = [t for t in tracks if t['disc'] == disc]
+        return tracks
+
+    def get_durations(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        获取已探测到的音轨时长，供首页显示
+
+        Returns:
+            Dict: {book: {disc: {filename: duration_ms}}}
+        """
+        self._ensure_fresh()
+        return self._load()['durations']
+
+    def _generation(self) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT value FROM library_meta WHERE key = 'generation'"
+        ).fetchone()
+        return int(row['value']) if row else None
+
+    def _load(self) -> Dict:
+        """
+        从数据库加载索引；只有 generation 变化时才重新查询，
+        其余情况下直接返回进程内缓存
+        """
+        generation = self._generation()
+        if self._cache is not None and generation == self._cache_generation:
+            return self._cache
+
+        conn = self._conn()
+        tree = {}
+        for row in conn.execute('SELECT book FROM library_books ORDER BY book'):
+            tree[row['book']] = {}
+        for row in conn.execute('SELECT book, disc FROM library_discs ORDER BY book, disc'):
+            tree.setdefault(row['book'], {})[row['disc']] = []
+
+        metadata = self.prober.cached() if self.prober is not None else {}
+        durations = {}
+        tracks = []
+        for row in conn.execute(
+            'SELECT book, disc, filename, size, mtime_ns, has_subtitle, has_optimized '
+            'FROM library_tracks ORDER BY book, disc, filename'
+        ):
+            tree.setdefault(row['book'], {}).setdefault(row['disc'], []).append(row['filename'])
+            meta = metadata.get(f"{row['book']}/{row['disc']}/{row['filename']}")
+            if meta is not None and (meta['size'], meta['mtime_ns']) != (row['size'], row['mtime_ns']):
+                meta = None
+            if meta is not None and meta['duration_ms'] is not None:
+                durations.setdefault(row['book'], {}).setdefault(row['disc'], {})[row['filename']] = meta['duration_ms']
+            tracks.append({
+                'book': row['book'],
+                'disc': row['disc'],
+                'filename': row['filename'],
+                'size': row['size'],
+                'has_subtitle': bool(row['has_subtitle']),
+                'has_optimized': bool(row['has_optimized']),
+                'duration_ms': meta['duration_ms'] if meta else None,
+                'bitrate': meta['bitrate'] if meta else None,
+                'codec': meta['codec'] if meta else None,
+            })
+
+        self._cache = {'tree': tree, 'tracks': tracks, 'durations': durations}
+        self._cache_generation = generation
+        return self._cache
+
+    # ------------------------------------------------------------------ 同步
+
+    def _ensure_fresh(self):
+        """
+        索引为空时同步扫描目录（不探测音频元数据）；之后按 sync_interval 节流，
+        在后台线程中增量同步并探测元数据，请求本身只读取数据库
+        """
+        now = time.monotonic()
+        if self._last_sync and now - self._last_sync < self.sync_interval:
+            return
+
+        if self._generation() is None:
+            # 首次构建只列目录；整个音频库的元数据探测耗时较长，交给下面的后台同步
+            self.sync(probe=False)
+
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+            self._last_sync = now
+
+        self._sync_thread = threading.Thread(target=self._background_sync)
+        self._sync_thread.daemon = True
+        self._sync_thread.start()
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Library index sync failed: {str(e)}")
+        finally:
+            self._syncing = False
+
+    def sync(self, probe: bool = True) -> bool:
+        """
+        增量同步整个音频库
+
+        教材目录 mtime 未变化时沿用索引中的光盘列表；只有音频目录或字幕目录
+        mtime 变化的光盘才会重新列出文件。
+
+        Args:
+            probe: 是否探测新增或修改过的音轨的元数据
+
+        Returns:
+            bool: 索引是否有变化
+        """
+        conn = self._conn()
+        known_books = {
+            row['book']: row['mtime_ns']
+            for row in conn.execute('SELECT book, mtime_ns FROM library_books')
+        }
+        known_discs = {}
+        for row in conn.execute(
+            'SELECT book, disc, audio_mtime_ns, subtitle_mtime_ns FROM library_discs'
+        ):
+            known_discs.setdefault(row['book'], {})[row['disc']] = (
+                row['audio_mtime_ns'], row['subtitle_mtime_ns']
+            )
+
+        # 先扫描文件系统，再在一个短事务中写入，避免扫描期间长时间持有写锁
+        books = _list_dirs(self.audio_root)
+        book_updates = []
+        disc_updates = []
+        removed_discs = []
+
+        for book, book_mtime in books.items():
+            book_path = os.path.join(self.audio_root, book)
+            if known_books.get(book) != book_mtime:
+                book_updates.append((book, book_mtime))
+                discs = list(_list_dirs(book_path))
+            else:
+                discs = list(known_discs.get(book, {}))
+
+            for disc in discs:
+                audio_mtime = _dir_mtime(os.path.join(book_path, disc))
+                if not audio_mtime:
+                    # 光盘目录已被删除，但教材目录 mtime 未变（例如网络存储上直接删除）
+                    removed_discs.append((book, disc))
+                    continue
+                subtitle_mtime = _dir_mtime(os.path.join(self.subtitle_root, book, disc))
+                if known_discs.get(book, {}).get(disc) != (audio_mtime, subtitle_mtime):
+                    disc_updates.append(
+                        (book, disc, audio_mtime, subtitle_mtime, self._scan_disc(book, disc))
+                    )
+
+            for disc in set(known_discs.get(book, {})) - set(discs):
+                removed_discs.append((book, disc))
+
+        removed_books = set(known_books) - set(books)
+        # 扫描期间目录被删除
+        for book, disc, _, _, tracks in disc_updates:
+            if tracks is None:
+                removed_discs.append((book, disc))
+        disc_updates = [u for u in disc_updates if u[4] is not None]
+
+        if not (book_updates or disc_updates or removed_discs or removed_books):
+            if self._generation() is None:
+                # 空音频库也要写入 generation，避免每次请求都重新全量同步
+                self._bump_generation(conn)
+            return self._probe_tracks(conn) if probe else False
+
+        with transaction(conn):
+            for book in removed_books:
+                conn.execute('DELETE FROM library_books WHERE book = ?', (book,))
+                conn.execute('DELETE FROM library_discs WHERE book = ?', (book,))
+                conn.execute('DELETE FROM library_tracks WHERE book = ?', (book,))
+            for book, disc in removed_discs:
+                conn.execute('DELETE FROM library_discs WHERE book = ? AND disc = ?', (book, disc))
+                conn.execute('DELETE FROM library_tracks WHERE book = ? AND disc = ?', (book, disc))
+            for book, mtime in book_updates:
+                self._upsert_book(conn, book, mtime)
+            for book, disc, audio_mtime, subtitle_mtime, tracks in disc_updates:
+                self._replace_disc(conn, book, disc, audio_mtime, subtitle_mtime, tracks)
+            self._bump_generation(conn)
+
+        print(f"Library index updated: {len(disc_updates)} discs rescanned, "
+              f"{len(removed_discs)} discs and {len(removed_books)} books removed")
+        if probe:
+            self._probe_tracks(conn)
+        return True
+
+    def refresh_disc(self, book: str, disc: str):
+        """
+        立即重新扫描单张光盘，用于上传音频或生成字幕之后
+
+        Args:
+            book: 教材名称
+            disc: 光盘名称
+        """
+        book_path = os.path.join(self.audio_root, book)
+        audio_mtime = _dir_mtime(os.path.join(book_path, disc))
+        subtitle_mtime = _dir_mtime(os.path.join(self.subtitle_root, book, disc))
+        tracks = self._scan_disc(book, disc)
+
+        conn = self._conn()
+        with transaction(conn):
+            if tracks is None:
+                conn.execute('DELETE FROM library_discs WHERE book = ? AND disc = ?', (book, disc))
+                conn.execute('DELETE FROM library_tracks WHERE book = ? AND disc = ?', (book, disc))
+            else:
+                self._upsert_book(conn, book, _dir_mtime(book_path))
+                self._replace_disc(conn, book, disc, audio_mtime, subtitle_mtime, tracks)
+            self._bump_generation(conn)
+        self._probe_tracks(conn, book, disc)
+
+    def _probe_tracks(self, conn, book: str = None, disc: str = None) -> bool:
+        """
+        探测缺少元数据或文件已变化的音轨（已缓存的直接跳过，包括无法解析的文件），
+        列表中显示的元数据有变化时才更新 generation
+
+        Returns:
+            bool: 列表中显示的元数据是否有变化
+        """
+        if self.prober is None:
+            return False
+        sql = 'SELECT book, disc, filename, size, mtime_ns FROM library_tracks'
+        params = ()
+        if book is not None:
+            sql += ' WHERE book = ? AND disc = ?'
+            params = (book, disc)
+        files = [(f"{row['book']}/{row['disc']}/{row['filename']}", row['size'], row['mtime_ns'])
+                 for row in conn.execute(sql, params)]
+        metadata = self.prober.cached()
+        stale = [(path, size, mtime_ns) for path, size, mtime_ns in files
+                 if not _probed_for(metadata.get(path), size, mtime_ns)]
+        if not stale:
+            return False
+        try:
+            self.prober.probe_many(stale)
+        except Exception as e:
+            print(f"Audio probe failed: {str(e)}")
+            return False
+        # 这些音轨在列表中原本没有元数据；全部无法解析时列表不变，不必让各 worker 重新加载
+        metadata = self.prober.cached()
+        if not any(_probed_for(metadata.get(path), size, mtime_ns) and _has_metadata(metadata[path])
+                   for path, size, mtime_ns in stale):
+            return False
+        self._bump_generation(conn)
+        return True
+
+    def _scan_disc(self, book: str, disc: str) -> Optional[List[Dict]]:
+        """列出光盘下的音频文件及字幕状态，光盘目录不存在时返回 None"""
+        disc_path = os.path.join(self.audio_root, book, disc)
+        subtitle_path = os.path.join(self.subtitle_root, book, disc)
+        try:
+            subtitle_names = set(os.listdir(subtitle_path))
+        except FileNotFoundError:
+            subtitle_names = set()
+
+        tracks = []
+        try:
+            with os.scandir(disc_path) as it:
+                for entry in it:
+                    if not entry.is_file() or not entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                        continue
+                    stat = entry.stat()
+                    stem = os.path.splitext(entry.name)[0]
+                    tracks.append({
+                        'filename': entry.name,
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns,
+                        'has_subtitle': f"{stem}.srt" in subtitle_names,
+                        'has_optimized': f"{stem}.optimized.srt" in subtitle_names,
+                    })
+        except FileNotFoundError:
+            return None
+        return tracks
+
+    @staticmethod
+    def _upsert_book(conn, book: str, mtime_ns: int):
+        conn.execute(
+            'INSERT INTO library_books (book, mtime_ns) VALUES (?, ?) '
+            'ON CONFLICT(book) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+            (book, mtime_ns)
+        )
+
+    @staticmethod
+    def _replace_disc(conn, book: str, disc: str, audio_mtime: int, subtitle_mtime: int,
+                      tracks: List[Dict]):
+        conn.execute(
+            'INSERT INTO library_discs (book, disc, audio_mtime_ns, subtitle_mtime_ns) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT(book, disc) DO UPDATE SET '
+            'audio_mtime_ns = excluded.audio_mtime_ns, subtitle_mtime_ns = excluded.subtitle_mtime_ns',
+            (book, disc, audio_mtime, subtitle_mtime)
+        )
+        conn.execute('DELETE FROM library_tracks WHERE book = ? AND disc = ?', (book, disc))
+        conn.executemany(
+            'INSERT INTO library_tracks '
+            '(book, disc, filename, size, mtime_ns, has_subtitle, has_optimized) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (book, disc, t['filename'], t['size'], t['mtime_ns'],
+                 int(t['has_subtitle']), int(t['has_optimized']))
+                for t in tracks
+            ]
+        )
+
+    @staticmethod
+    def _bump_generation(conn):
+        conn.execute(
+            "INSERT INTO library_meta (key, value) VALUES ('generation', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
@@ -5,7 +5,11 @@ LLM 模块初始化文件
 
 # Usage: python -m utils.llm_v2 --provider aliyun --model qwen-max --prompt "who are you?"
 
+import asyncio
+
 from .providers import (
+    LLM_CONCURRENCY,
+    aclose_llm_clients,
     get_provider_config,
     validate_model,
     SiliconFlowProvider,
@@ -25,18 +29,26 @@ __all__ = [
     'GeminiModel',
     'OpenAIModel',
     'get_default_llm',
-    'generate_text'
+    'generate_text',
+    'stream_text',
+    'generate_texts',
+    'gather_limited',
+    'aclose_llm_clients'
 ]
 
-# 默认使用阿里云提供者 (注意：provider 名称应该是小写的)
-default_llm = get_provider_config('aliyun').get_llm()
-
 def get_default_llm():
-    """获取默认的 LLM 客户端"""
-    return default_llm
+    """获取默认的 LLM 客户端（首次调用时创建，之后复用缓存的客户端）"""
+    # 默认使用阿里云提供者 (注意：provider 名称应该是小写的)
+    return get_provider_config('aliyun').get_llm()
+
+def __getattr__(name):
+    # 兼容旧代码中的 app.llm.default_llm，导入模块时不再创建客户端
+    if name == 'default_llm':
+        return get_default_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 async def generate_text(prompt, provider='aliyun', model=None):
-    """生成文本的简单接口
+    """生成文本的简单接口（异步客户端，不阻塞事件循环）
     
     Args:
         prompt: 提示文本
@@ -47,15 +59,71 @@ async def generate_text(prompt, provider='aliyun', model=None):
         str: 生成的文本
     """
     provider_instance = get_provider_config(provider.lower())
-    llm = provider_instance.get_llm()
+    llm = provider_instance.get_async_llm()
     
     # 构建请求参数
     params = {
         "model": model or provider_instance.__default_model__,
         "messages": [{"role": "user", "content": prompt}],
-        # "stream": True,
     }
     
     # 发送请求
-    response = llm.chat.completions.create(**params)
-    return response.choices[0].message.content
\ No newline at end of file
+    response = await llm.chat.completions.create(**params)
+    return response.choices[0].message.content
+
+async def stream_text(prompt, provider='aliyun', model=None):
+    """流式生成文本，逐段产出
+
+    Args:
+        prompt: 提示文本
+        provider: 提供者名称，默认为 'aliyun'
+        model: 模型名称，如果为 None 则使用提供者的默认模型
+
+    Yields:
+        str: 生成的文本片段
+    """
+    provider_instance = get_provider_config(provider.lower())
+    llm = provider_instance.get_async_llm()
+    stream = await llm.chat.completions.create(
+        model=model or provider_instance.__default_model__,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def gather_limited(coros, limit=None, return_exceptions=False):
+    """并发执行协程，同时进行的数量不超过 limit，结果按输入顺序返回
+
+    Args:
+        coros: 协程列表
+        limit: 并发上限，默认 LLM_CONCURRENCY（环境变量，默认 64）
+        return_exceptions: 为 True 时把异常作为结果返回，不中断其他请求
+
+    Returns:
+        list: 每个协程的结果
+    """
+    semaphore = asyncio.Semaphore(limit or LLM_CONCURRENCY)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=return_exceptions)
+
+async def generate_texts(prompts, provider='aliyun', model=None, concurrency=None, return_exceptions=False):
+    """批量生成文本，在同一个事件循环中并发请求
+
+    Args:
+        prompts: 提示文本列表
+        provider: 提供者名称，默认为 'aliyun'
+        model: 模型名称，如果为 None 则使用提供者的默认模型
+        concurrency: 并发上限，默认 LLM_CONCURRENCY
+        return_exceptions: 为 True 时失败的请求返回异常对象
+
+    Returns:
+        list: 与 prompts 顺序一致的生成结果
+    """
+    return await gather_limited([generate_text(prompt, provider, model) for prompt in prompts],
+                                limit=concurrency, return_exceptions=return_exceptions)
@@ -5,13 +5,14 @@ LLM 模块的命令行入口点
 
 import asyncio
 import argparse
-from . import generate_text
+from . import aclose_llm_clients, generate_text, stream_text
 
 def main():
     parser = argparse.ArgumentParser(description="LLM 模块验证工具")
     parser.add_argument("--provider", "-p", default="aliyun", help="LLM 提供者 (aliyun, openai, siliconflow, xai, gemini)")
     parser.add_argument("--model", "-m", help="模型名称，如果不指定则使用默认模型")
     parser.add_argument("--prompt", default="你好，请介绍一下自己", help="提示文本")
+    parser.add_argument("--stream", action="store_true", help="流式输出")
     
     args = parser.parse_args()
     
@@ -22,13 +23,20 @@ def main():
             print(f"提示: {args.prompt}")
             print("\n正在生成回复...\n")
             
-            response = await generate_text(args.prompt, args.provider, args.model)
             print("回复:")
             print("-" * 50)
-            print(response)
+            if args.stream:
+                async for text in stream_text(args.prompt, args.provider, args.model):
+                    print(text, end="", flush=True)
+                print()
+            else:
+                response = await generate_text(args.prompt, args.provider, args.model)
+                print(response)
             print("-" * 50)
         except Exception as e:
             print(f"错误: {e}")
+        finally:
+            await aclose_llm_clients()
     
     asyncio.run(run())
 
@@ -0,0 +1,408 @@
+"""
+ASR 本地替身服务
+实现火山引擎字幕接口（/api/v1/vc/submit、/api/v1/vc/query）、DashScope 录音文件识别接口
+（/api/v1/services/audio/asr/transcription、/api/v1/tasks/<task_id>）和 DashScope 实时识别
+WebSocket 接口（/api-ws/v1/inference，本地文件上传识别 ASR_INPUT=local 使用）的请求/响应格式，
+用于离线压测和回归测试整条字幕流水线：任务先返回若干次处理中再完成，
+支持固定延迟、按比例注入失败和自定义识别结果。
+
+用法:
+    python -m app.llm.asr_standin --port 8765 --latency 0.05 --pending-polls 2 --failure-rate 0.1
+
+    # 让应用使用替身服务
+    export VOLCANO_AUDIO_API_BASE=http://127.0.0.1:8765/api/v1/vc
+    export DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8765/api/v1
+    export DASHSCOPE_WEBSOCKET_BASE_URL=ws://127.0.0.1:8766/api-ws/v1/inference
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from flask import Flask, jsonify, request
+
+# 默认识别结果（毫秒），可用 --utterances 指定 JSON 文件替换
+DEFAULT_UTTERANCES = [
+    {'start_time': 500, 'end_time': 2600, 'text': 'Excuse me, is this the way to the library?'},
+    {'start_time': 3000, 'end_time': 5200, 'text': 'Yes, go straight and turn left at the second corner.'},
+    {'start_time': 5600, 'end_time': 6900, 'text': 'Thank you very much.'},
+    {'start_time': 7200, 'end_time': 8300, 'text': "You're welcome."},
+]
+
+# 火山引擎查询接口的状态码：处理中 / 识别失败
+VOLCANO_PENDING_CODE = 2000
+VOLCANO_FAILED_CODE = 1013
+
+
+class StandinConfig:
+    """替身服务的行为配置"""
+
+    def __init__(self, latency: float = 0.0, pending_polls: int = 2, failure_rate: float = 0.0,
+                 job_failure_rate: float = 0.0, utterances: List[Dict] = None, repeat: int = 1,
+                 seed: int = None):
+        """
+        Args:
+            latency: 每个请求的固定延迟（秒）
+            pending_polls: 任务完成前返回“处理中”的查询次数
+            failure_rate: 提交/查询请求返回 HTTP 5xx 的比例（可重试的失败）
+            job_failure_rate: 任务最终识别失败的比例（不可重试）
+            utterances: 识别结果，每项包含 start_time、end_time（毫秒）和 text
+            repeat: 识别结果重复的次数（时间依次后移），用于模拟长音轨
+            seed: 随机种子，设置后失败注入可复现
+        """
+        self.latency = latency
+        self.pending_polls = pending_polls
+        self.failure_rate = failure_rate
+        self.job_failure_rate = job_failure_rate
+        self.utterances = utterances or DEFAULT_UTTERANCES
+        self.repeat = max(1, repeat)
+        self.random = random.Random(seed)
+        # HTTP 接口和实时识别接口共用的统计与锁
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'queries': 0, 'injected_failures': 0, 'realtime_sessions': 0}
+
+    def inject_failure(self) -> bool:
+        """按 failure_rate 决定本次请求是否返回可重试的失败"""
+        with self.lock:
+            injected = self.random.random() < self.failure_rate
+            if injected:
+                self.stats['injected_failures'] += 1
+        return injected
+
+    def build_utterances(self) -> List[Dict]:
+        """按 repeat 展开识别结果"""
+        span = max(u['end_time'] for u in self.utterances) + 500
+        return [
+            {'start_time': u['start_time'] + i * span, 'end_time': u['end_time'] + i * span, 'text': u['text']}
+            for i in range(self.repeat)
+            for u in self.utterances
+        ]
+
+
+def load_utterances(path: str) -> List[Dict]:
+    """
+    读取识别结果 JSON 文件：utterances 列表，或火山引擎查询接口的完整响应
+
+    Returns:
+        List[Dict]: 每项包含 start_time、end_time（毫秒）和 text
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('utterances', [])
+    return [{'start_time': int(u['start_time']), 'end_time': int(u['end_time']), 'text': u['text']}
+            for u in data]
+
+
+def create_app(config: StandinConfig = None) -> Flask:
+    """
+    创建替身服务
+
+    Args:
+        config: 行为配置，默认不延迟、不注入失败，任务查询两次后完成
+
+    Returns:
+        Flask: 可以直接 run()，或在测试中使用 test_client()
+    """
+    config = config or StandinConfig()
+    app = Flask(__name__)
+    jobs: Dict[str, Dict] = {}
+    lock = config.lock
+    app.config['STANDIN_JOBS'] = jobs
+    app.config['STANDIN_STATS'] = stats = config.stats
+
+    def create_job(file_urls: List[str]) -> str:
+        job_id = uuid.uuid4().hex
+        with lock:
+            failed = config.random.random() < config.job_failure_rate
+            jobs[job_id] = {'file_urls': file_urls, 'polls': 0, 'failed': failed, 'created_at': time.time()}
+            stats['submitted'] += 1
+        return job_id
+
+    def poll_job(job_id: str) -> Optional[str]:
+        """查询一次任务，返回 pending / failed / done，任务不存在时返回 None"""
+        with lock:
+            job = jobs.get(job_id)
+            stats['queries'] += 1
+            if job is None:
+                return None
+            job['polls'] += 1
+            if job['polls'] <= config.pending_polls:
+                return 'pending'
+            return 'failed' if job['failed'] else 'done'
+
+    @app.before_request
+    def simulate_network():
+        if config.latency:
+            time.sleep(config.latency)
+        if request.endpoint in ('volcano_submit', 'volcano_query', 'dashscope_submit', 'dashscope_task'):
+            if config.inject_failure():
+                return jsonify({'code': 'InternalError', 'message': 'injected failure'}), 503
+
+    # ------------------------------------------------------------------ 火山引擎
+
+    @app.route('/api/v1/vc/submit', methods=['POST'])
+    def volcano_submit():
+        data = request.get_json(silent=True) or {}
+        if not data.get('url'):
+            return jsonify({'code': 1001, 'message': 'Invalid parameter: url'}), 400
+        return jsonify({'id': create_job([data['url']]), 'code': 0, 'message': 'Success'})
+
+    @app.route('/api/v1/vc/query', methods=['GET'])
+    def volcano_query():
+        job_id = request.args.get('id', '')
+        status = poll_job(job_id)
+        if status is None:
+            return jsonify({'id': job_id, 'code': 1001, 'message': 'Invalid parameter: id'}), 400
+        if status == 'pending':
+            return jsonify({'id': job_id, 'code': VOLCANO_PENDING_CODE, 'message': 'Processing'})
+        if status == 'failed':
+            return jsonify({'id': job_id, 'code': VOLCANO_FAILED_CODE, 'message': 'Audio decode failed'})
+
+        utterances = config.build_utterances()
+        return jsonify({
+            'id': job_id,
+            'code': 0,
+            'message': 'Success',
+            'duration': utterances[-1]['end_time'] / 1000 if utterances else 0,
+            'utterances': [dict(u, words=[]) for u in utterances],
+        })
+
+    # ------------------------------------------------------------------ DashScope
+
+    @app.route('/api/v1/services/audio/asr/transcription', methods=['POST'])
+    def dashscope_submit():
+        data = request.get_json(silent=True) or {}
+        file_urls = (data.get('input') or {}).get('file_urls') or []
+        if not file_urls:
+            return jsonify({'code': 'InvalidParameter', 'message': 'input.file_urls is required',
+                            'request_id': uuid.uuid4().hex}), 400
+        task_id = create_job(file_urls)
+        return jsonify({'request_id': uuid.uuid4().hex,
+                        'output': {'task_id': task_id, 'task_status': 'PENDING'}})
+
+    @app.route('/api/v1/tasks/<task_id>', methods=['GET', 'POST'])
+    def dashscope_task(task_id):
+        status = poll_job(task_id)
+        if status is None:
+            return jsonify({'code': 'InvalidParameter', 'message': 'task not found',
+                            'request_id': uuid.uuid4().hex}), 400
+        output = {'task_id': task_id, 'task_status': {
+            'pending': 'RUNNING', 'failed': 'FAILED', 'done': 'SUCCEEDED'}[status]}
+        if status == 'failed':
+            output.update(code='DecodeError', message='Audio decode failed')
+        elif status == 'done':
+            output['results'] = [{
+                'file_url': url,
+                'transcription_url': f"{request.host_url}transcriptions/{task_id}/{i}.json",
+                'subtask_status': 'SUCCEEDED',
+            } for i, url in enumerate(jobs[task_id]['file_urls'])]
+        return jsonify({'request_id': uuid.uuid4().hex, 'output': output})
+
+    @app.route('/transcriptions/<task_id>/<int:index>.json', methods=['GET'])
+    def dashscope_transcription(task_id, index):
+        job = jobs.get(task_id)
+        if job is None or index >= len(job['file_urls']):
+            return jsonify({'message': 'not found'}), 404
+        utterances = config.build_utterances()
+        sentences = [{'sentence_id': i + 1, 'begin_time': u['start_time'], 'end_time': u['end_time'],
+                      'text': u['text']} for i, u in enumerate(utterances)]
+        return jsonify({
+            'file_url': job['file_urls'][index],
+            'properties': {'original_duration_in_milliseconds': utterances[-1]['end_time'] if utterances else 0},
+            'transcripts': [{'channel_id': 0, 'text': ' '.join(u['text'] for u in utterances),
+                             'sentences': sentences}],
+        })
+
+    @app.route('/stats', methods=['GET'])
+    def standin_stats():
+        with lock:
+            return jsonify(dict(stats, jobs=len(jobs)))
+
+    return app
+
+
+def _realtime_sentence(utterance: Dict, sentence_id: int, final: bool = True) -> Dict:
+    """实时识别的句子结果，词级时间按单词平均分配；final 为 False 时是中间结果（end_time 为 None）"""
+    tokens = utterance['text'].split()
+    span = (utterance['end_time'] - utterance['start_time']) / max(1, len(tokens))
+    words = [{'begin_time': int(utterance['start_time'] + i * span),
+              'end_time': int(utterance['start_time'] + (i + 1) * span),
+              'text': token, 'punctuation': ''} for i, token in enumerate(tokens)]
+    return {'sentence_id': sentence_id, 'begin_time': utterance['start_time'],
+            'end_time': utterance['end_time'] if final else None,
+            'text': utterance['text'], 'words': words}
+
+
+def create_realtime_app(config: StandinConfig = None):
+    """
+    创建 DashScope 实时识别 WebSocket 接口（Recognition.call 使用的双工协议）
+
+    客户端发送 run-task，收到 task-started 后发送二进制音频和 finish-task，
+    之后依次收到每句的 result-generated（先中间结果再最终结果）和 task-finished；
+    按 failure_rate 拒绝握手（HTTP 503），按 job_failure_rate 返回 task-failed。
+
+    Returns:
+        aiohttp.web.Application
+    """
+    # aiohttp 是 dashscope SDK 的依赖，只有启动实时识别接口时才需要
+    from aiohttp import WSMsgType, web
+
+    config = config or StandinConfig()
+
+    def event(task_id: str, name: str, payload: Dict = None, **header) -> Dict:
+        message = {'header': dict(task_id=task_id, event=name, attributes={}, **header)}
+        message['payload'] = payload if payload is not None else {}
+        return message
+
+    async def recognition(request):
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        if config.inject_failure():
+            return web.Response(status=503, text='injected failure')
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        task_id, received, failed = None, 0, False
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                received += len(msg.data)
+                continue
+            if msg.type != WSMsgType.TEXT:
+                break
+            header = json.loads(msg.data).get('header') or {}
+            if header.get('action') == 'run-task':
+                task_id = header.get('task_id') or uuid.uuid4().hex
+                with config.lock:
+                    config.stats['realtime_sessions'] += 1
+                    failed = config.random.random() < config.job_failure_rate
+                await ws.send_json(event(task_id, 'task-started'))
+            elif header.get('action') == 'finish-task':
+                if failed or not received:
+                    await ws.send_json(event(task_id, 'task-failed', error_code='DecodeError',
+                                             error_message='Audio decode failed'))
+                    break
+                utterances = config.build_utterances()
+                for i, utterance in enumerate(utterances):
+                    for final in (False, True):
+                        await ws.send_json(event(task_id, 'result-generated', {
+                            'output': {'sentence': _realtime_sentence(utterance, i + 1, final)},
+                            'usage': {'duration': utterance['end_time'] // 1000} if final else None,
+                        }))
+                await ws.send_json(event(task_id, 'task-finished', {'output': {}, 'usage': None}))
+                break
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/api-ws/v1/inference', recognition)
+    app.router.add_get('/api-ws/v1/inference/', recognition)
+    return app
+
+
+class RealtimeServer:
+    """在后台线程的事件循环中运行实时识别 WebSocket 接口"""
+
+    def __init__(self, config: StandinConfig = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            config: 与 HTTP 接口共用的行为配置
+            host: 监听地址
+            port: 监听端口，0 表示随机端口（启动后读取 port）
+        """
+        self.config = config or StandinConfig()
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """DASHSCOPE_WEBSOCKET_BASE_URL 应设置的地址"""
+        return f"ws://{self.host}:{self.port}/api-ws/v1/inference"
+
+    def start(self) -> str:
+        """启动服务，返回 WebSocket 基础 URL"""
+        started = threading.Event()
+        errors = []
+        self._thread = threading.Thread(target=self._serve, args=(started, errors), daemon=True,
+                                        name='asr-standin-realtime')
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self.url
+
+    def _serve(self, started: threading.Event, errors: List[Exception]):
+        from aiohttp import web
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_realtime_app(self.config))
+        try:
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, self.host, self.port).start())
+            self.port = runner.addresses[0][1]
+        except Exception as e:
+            errors.append(e)
+            started.set()
+            loop.close()
+            return
+        self._loop = loop
+        started.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+    def stop(self):
+        """停止服务并等待后台线程退出"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="火山引擎 / DashScope 语音识别接口的本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ws-port", type=int, help="实时识别 WebSocket 端口，默认 --port + 1")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--pending-polls", type=int, default=2, help="任务完成前返回处理中的查询次数")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="请求返回 HTTP 503 的比例")
+    parser.add_argument("--job-failure-rate", type=float, default=0.0, help="任务最终识别失败的比例")
+    parser.add_argument("--utterances", help="识别结果 JSON 文件（utterances 列表或火山引擎查询响应）")
+    parser.add_argument("--repeat", type=int, default=1, help="识别结果重复次数，用于模拟长音轨")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args(argv)
+
+    config = StandinConfig(
+        latency=args.latency,
+        pending_polls=args.pending_polls,
+        failure_rate=args.failure_rate,
+        job_failure_rate=args.job_failure_rate,
+        utterances=load_utterances(args.utterances) if args.utterances else None,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+    realtime = RealtimeServer(config, args.host, args.ws_port or args.port + 1)
+    realtime.start()
+    print(f"ASR stand-in listening on http://{args.host}:{args.port}")
+    print(f"  VOLCANO_AUDIO_API_BASE=http://{args.host}:{args.port}/api/v1/vc")
+    print(f"  DASHSCOPE_HTTP_BASE_URL=http://{args.host}:{args.port}/api/v1")
+    print(f"  DASHSCOPE_WEBSOCKET_BASE_URL={realtime.url}")
+    try:
+        create_app(config).run(host=args.host, port=args.port, threaded=True)
+    finally:
+        realtime.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
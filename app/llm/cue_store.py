@@ -0,0 +1,395 @@
+"""
+字幕条目存储
+开始/结束时间以整数毫秒保存在 array('q') 中，文本、说话人和词级时间保存在并行列表里，
+按时间查找条目为 O(log n)，支持整体平移时间轴和快速序列化为 SRT / WebVTT / JSON；
+SRT 使用单遍、按行的流式解析器读取
+"""
+import itertools
+import json
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+Cue = namedtuple('Cue', ['start_ms', 'end_ms', 'text', 'speaker'])
+
+_TIME_RE = re.compile(r'^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*$')
+_TIMING_RE = re.compile(
+    r'^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+)
+_SPEAKER_RE = re.compile(r'\[([A-Z])\]\s*(.*)', re.DOTALL)
+
+
+def parse_srt_time(time_str: str) -> Optional[int]:
+    """
+    将SRT时间格式 (HH:MM:SS,mmm) 转换为毫秒
+
+    Returns:
+        int: 毫秒，格式不正确时返回 None
+    """
+    match = _TIME_RE.match(time_str or '')
+    if not match:
+        return None
+    hours, minutes, seconds, millis = match.groups()
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis.ljust(3, '0'))
+
+
+def _timing_ms(hours: str, minutes: str, seconds: str, millis: str) -> int:
+    if len(millis) != 3:
+        millis = millis.ljust(3, '0')
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def _parse_timing(line: str) -> Optional[Tuple[int, int]]:
+    """解析时间行 '00:00:01,000 --> 00:00:02,000'（允许行尾带位置信息），不是时间行时返回 None"""
+    match = _TIMING_RE.match(line)
+    if not match:
+        return None
+    h1, m1, s1, ms1, h2, m2, s2, ms2 = match.groups()
+    return _timing_ms(h1, m1, s1, ms1), _timing_ms(h2, m2, s2, ms2)
+
+
+def iter_srt_cues(source: Union[str, Iterable[str]]) -> Iterator[Tuple[int, int, str]]:
+    """
+    单遍、按行解析 SRT，线性时间，不回溯
+
+    - 兼容 CRLF 换行和 UTF-8 BOM（只用 CR 换行的文件需以 newline='' 打开）
+    - 以时间行识别条目，序号缺失、不连续或条目之间缺少空行都能正确切分
+    - 时间行无法解析的条目被跳过
+
+    Args:
+        source: SRT 字符串，或逐行产出文本的文件对象/迭代器
+
+    Yields:
+        Tuple: (start_ms, end_ms, text)，多行文本以换行连接
+    """
+    if isinstance(source, str):
+        lines = source.lstrip('\ufeff').splitlines()
+    else:
+        lines = iter(source)
+        first = next(lines, None)
+        if first is None:
+            return
+        lines = itertools.chain((first.lstrip('\ufeff'),), lines)
+
+    timing = None
+    text_lines = []
+    # 文本中的纯数字行可能是下一个条目的序号，要等看到下一行才能确定
+    pending_number = None
+    parse_timing = _parse_timing
+
+    for line in lines:
+        if '-->' in line:
+            # 新条目开始；时间行无法解析时 parsed 为 None，该条目的文本被丢弃
+            parsed = parse_timing(line)
+            if timing is not None:
+                yield timing[0], timing[1], '\n'.join(text_lines).strip()
+            timing, text_lines, pending_number = parsed, [], None
+            continue
+
+        # strip() 同时去掉行尾的 \r\n
+        stripped = line.strip()
+        if pending_number is not None:
+            text_lines.append(pending_number)
+            pending_number = None
+        if timing is None:
+            continue
+        if not stripped:
+            # 空行结束文本；之后到下一个时间行之间的内容视为序号或垃圾行
+            if text_lines:
+                yield timing[0], timing[1], '\n'.join(text_lines).strip()
+                timing, text_lines = None, []
+            continue
+        if stripped.isdigit():
+            pending_number = stripped
+            continue
+        text_lines.append(stripped)
+
+    if timing is not None:
+        if pending_number is not None:
+            text_lines.append(pending_number)
+        yield timing[0], timing[1], '\n'.join(text_lines).strip()
+
+
+def format_srt_time(ms: int) -> str:
+    """将毫秒转换为SRT时间格式 (HH:MM:SS,mmm)"""
+    seconds, millis = divmod(max(0, int(ms)), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+
+def format_vtt_time(ms: int) -> str:
+    """将毫秒转换为WebVTT时间格式 (HH:MM:SS.mmm)"""
+    return format_srt_time(ms).replace(',', '.')
+
+
+def split_speaker(text: str):
+    """拆分文本开头的说话人标记，例如 '[A] Hello' -> ('A', 'Hello')"""
+    match = _SPEAKER_RE.match(text)
+    if match:
+        return match.group(1), match.group(2)
+    return None, text
+
+
+class CueStore:
+    """按开始时间排序的字幕条目集合"""
+
+    __slots__ = ('starts', 'ends', 'texts', 'speakers', 'words', '_max_ends')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        # 前缀最大结束时间：_max_ends[i] = max(ends[:i + 1])，用于查找与后续条目重叠的长条目
+        self._max_ends = array('q')
+        self.texts: List[str] = []
+        self.speakers: List[Optional[str]] = []
+        # 每个条目的词级时间 [(start_ms, end_ms, word), ...]，ASR 没有返回时为 None
+        self.words: List[Optional[List[Tuple[int, int, str]]]] = []
+
+    # ------------------------------------------------------------------ 构建
+
+    def append(self, start_ms: int, end_ms: int, text: str, speaker: str = None,
+               words: List[Tuple[int, int, str]] = None):
+        """追加一个条目（调用方保证开始时间不早于上一个条目，否则需要调用 sort）"""
+        self.starts.append(start_ms)
+        self.ends.append(end_ms)
+        self._max_ends.append(max(self._max_ends[-1], end_ms) if self._max_ends else end_ms)
+        self.texts.append(text)
+        self.speakers.append(speaker)
+        self.words.append(words)
+
+    def sort(self):
+        """按开始时间排序（稳定排序）"""
+        if all(self.starts[i] <= self.starts[i + 1] for i in range(len(self.starts) - 1)):
+            return
+        order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+        self.starts = array('q', (self.starts[i] for i in order))
+        self.ends = array('q', (self.ends[i] for i in order))
+        self.texts = [self.texts[i] for i in order]
+        self.speakers = [self.speakers[i] for i in order]
+        self.words = [self.words[i] for i in order]
+        self._update_max_ends()
+
+    def _update_max_ends(self, start_index: int = 0):
+        """重新计算 start_index 及之后的前缀最大结束时间"""
+        del self._max_ends[start_index:]
+        current = self._max_ends[-1] if self._max_ends else None
+        for end_ms in self.ends[start_index:]:
+            current = end_ms if current is None else max(current, end_ms)
+            self._max_ends.append(current)
+
+    def assign_words(self, words: Iterable[Tuple[int, int, str]]):
+        """
+        按时间把词级时间分配给条目（开始时间落在条目时间范围内的词），
+        用于 LLM 合并条目后从原始识别结果恢复词级时间
+
+        Args:
+            words: (start_ms, end_ms, word)，按开始时间排序
+        """
+        self.words = [None] * len(self.starts)
+        for word in words:
+            index = self.index_at(word[0])
+            if index is None:
+                continue
+            if self.words[index] is None:
+                self.words[index] = []
+            self.words[index].append(tuple(word))
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict]) -> 'CueStore':
+        """
+        从字幕条目字典构建，条目可以带 start_ms/end_ms，或 start_time/end_time 字符串；
+        文本为空或时间无法解析的条目会被跳过
+
+        Returns:
+            CueStore: 按开始时间排序
+        """
+        store = cls()
+        for entry in entries:
+            text = (entry.get('text') or '').strip()
+            start_ms = entry.get('start_ms')
+            end_ms = entry.get('end_ms')
+            if start_ms is None:
+                start_ms = parse_srt_time(entry.get('start_time'))
+            if end_ms is None:
+                end_ms = parse_srt_time(entry.get('end_time'))
+            if not text or start_ms is None or end_ms is None:
+                continue
+            store.append(start_ms, end_ms, text, entry.get('speaker'), entry.get('words'))
+        store.sort()
+        return store
+
+    @classmethod
+    def from_srt(cls, source: Union[str, Iterable[str]]) -> 'CueStore':
+        """
+        解析SRT字幕（字符串、文件对象或行迭代器），文本开头的 [A]/[B]... 解析为说话人
+
+        Returns:
+            CueStore: 按开始时间排序
+        """
+        store = cls()
+        if isinstance(source, str) and not source.strip():
+            return store
+        for start_ms, end_ms, text in iter_srt_cues(source):
+            speaker, text = split_speaker(text)
+            store.append(start_ms, end_ms, text, speaker)
+        store.sort()
+        return store
+
+    # ------------------------------------------------------------------ 查询
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> Cue:
+        return Cue(self.starts[index], self.ends[index], self.texts[index], self.speakers[index])
+
+    def __iter__(self):
+        return map(Cue, self.starts, self.ends, self.texts, self.speakers)
+
+    def index_at(self, time_ms: int) -> Optional[int]:
+        """
+        查找 time_ms 时刻正在显示的条目（二分查找）
+
+        Returns:
+            int: 条目下标，该时刻没有字幕时返回 None
+        """
+        index = bisect_right(self.starts, time_ms) - 1
+        # 条目时间有重叠时，向前查找仍未结束的条目；之前的条目都已结束时停止
+        while index >= 0 and self._max_ends[index] > time_ms:
+            if self.ends[index] > time_ms:
+                return index
+            index -= 1
+        return None
+
+    def cue_at(self, time_ms: int) -> Optional[Cue]:
+        """返回 time_ms 时刻正在显示的条目，没有时返回 None"""
+        index = self.index_at(time_ms)
+        return self[index] if index is not None else None
+
+    # ------------------------------------------------------------------ 变换
+
+    def shift(self, delta_ms: int, start_index: int = 0):
+        """
+        将 start_index 及之后的条目整体平移 delta_ms 毫秒（结果不早于 0）
+
+        调用方需要保证平移后仍然有序（通常是整体平移，或平移末尾的一段）。
+        """
+        for i in range(start_index, len(self.starts)):
+            self.starts[i] = max(0, self.starts[i] + delta_ms)
+            self.ends[i] = max(0, self.ends[i] + delta_ms)
+            if self.words[i]:
+                self.words[i] = [(max(0, start + delta_ms), max(0, end + delta_ms), word)
+                                 for start, end, word in self.words[i]]
+        self._update_max_ends(start_index)
+
+    def slice(self, start: int, end: int) -> 'CueStore':
+        """返回下标 [start, end) 的条目副本"""
+        store = CueStore()
+        store.starts = self.starts[start:end]
+        store.ends = self.ends[start:end]
+        store.texts = self.texts[start:end]
+        store.speakers = self.speakers[start:end]
+        store.words = self.words[start:end]
+        store._update_max_ends()
+        return store
+
+    # ------------------------------------------------------------------ 序列化
+
+    def to_entries(self) -> List[Dict]:
+        """
+        转换为字幕条目字典列表（与 parse_srt_to_entries 的格式一致，另外带 start_ms / end_ms / words）
+        """
+        return [{
+            'index': i + 1,
+            'start_time': format_srt_time(start),
+            'end_time': format_srt_time(end),
+            'start_ms': start,
+            'end_ms': end,
+            'text': text,
+            'speaker': speaker,
+            'words': self.words[i],
+        } for i, (start, end, text, speaker) in enumerate(self)]
+
+    def to_srt(self) -> str:
+        """序列化为SRT，说话人信息嵌入到文本开头，序号连续"""
+        parts = []
+        for i, (start, end, text, speaker) in enumerate(self):
+            if speaker:
+                text = f"[{speaker}] {text}"
+            parts.append(f"{i + 1}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n")
+        return "\n".join(parts)
+
+    def to_vtt(self) -> str:
+        """序列化为 WebVTT，说话人使用 <v> 标签"""
+        parts = ["WEBVTT\n"]
+        for start, end, text, speaker in self:
+            if speaker:
+                text = f"<v {speaker}>{text}"
+            parts.append(f"{format_vtt_time(start)} --> {format_vtt_time(end)}\n{text}\n")
+        return "\n".join(parts)
+
+    def to_json(self) -> str:
+        """
+        序列化为紧凑的 JSON：
+        {"version": 1, "cues": [[start_ms, end_ms, text, speaker], ...]}，
+        有词级时间的条目追加第五项 [[start_ms, end_ms, word], ...]
+        """
+        cues = []
+        for i, cue in enumerate(self):
+            item = list(cue)
+            if self.words[i]:
+                item.append([list(word) for word in self.words[i]])
+            cues.append(item)
+        return json.dumps({'version': 1, 'cues': cues}, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, content: str) -> 'CueStore':
+        """解析 to_json 的输出"""
+        store = cls()
+        for item in json.loads(content).get('cues', []):
+            words = [tuple(word) for word in item[4]] if len(item) > 4 else None
+            store.append(item[0], item[1], item[2], item[3], words)
+        store.sort()
+        return store
+
+
+# 最近读取过的字幕文件，按 (路径, 大小, mtime) 失效
+_CACHE_SIZE = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_cue_store(path: str) -> Optional[CueStore]:
+    """
+    读取字幕文件并缓存解析结果，文件被修改后自动重新解析
+
+    Returns:
+        CueStore: 文件不存在时返回 None
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (path, stat_result.st_size, stat_result.st_mtime_ns)
+    with _cache_lock:
+        store = _cache.get(key)
+        if store is not None:
+            _cache.move_to_end(key)
+            return store
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        store = CueStore.from_srt(f)
+
+    with _cache_lock:
+        for stale in [k for k in _cache if k[0] == path]:
+            del _cache[stale]
+        _cache[key] = store
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return store
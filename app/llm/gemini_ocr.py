@@ -9,6 +9,8 @@ import requests
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 
+from app.llm.http_pool import get_http_pool
+
 load_dotenv()
 
 
@@ -25,6 +27,8 @@ class GeminiOCRProvider:
         self.api_base = "https://gemini.parallelstreamllc.com/v1beta"
         self.model = "gemini-2.5-flash"
         self.timeout = 60  # 60秒超时
+        # 与作文批改共享 Gemini 转发服务的长连接池
+        self.http_pool = get_http_pool()
 
     def recognize_image_from_file(self, image_path: str, language: str = 'auto') -> Dict[str, Any]:
         """
@@ -119,7 +123,7 @@ class GeminiOCRProvider:
             }
 
             # 发送请求
-            response = requests.post(
+            response = self.http_pool.post(
                 url,
                 headers=headers,
                 json=payload,
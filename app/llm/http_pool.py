@@ -0,0 +1,148 @@
+"""
+共享的 HTTP 连接池
+所有 Gemini 请求（作文批改、OCR）复用同一个 urllib3 连接池，保持长连接，
+省去每次调用重新建立 TCP 和 TLS 连接。每个线程使用自己的 requests.Session
+（会话状态不在线程之间共享），它们挂载同一个 HTTPAdapter，因此共享底层连接。
+
+配置:
+    HTTP_POOL_HOSTS         缓存连接池的主机数（默认 8）
+    HTTP_POOL_MAXSIZE       每个主机保留的最大连接数（默认 16）
+    HTTP_POOL_BLOCK         连接数达到上限时是否等待空闲连接（默认 0，超出时临时新建连接，用完即关闭）
+    HTTP_POOL_KEEPALIVE     TCP keepalive 探测的空闲时间（秒，默认 60，0 表示不开启）
+"""
+import os
+import socket
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '8'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', '0') == '1'
+HTTP_POOL_KEEPALIVE = int(os.getenv('HTTP_POOL_KEEPALIVE', '60'))
+
+
+def _keepalive_options(idle: int):
+    """开启 TCP keepalive，避免中间设备悄悄断开空闲的长连接"""
+    if idle <= 0:
+        return list(HTTPConnection.default_socket_options)
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', max(1, idle // 4)), ('TCP_KEEPCNT', 4)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class PooledAdapter(HTTPAdapter):
+    """统计请求次数的 HTTPAdapter，连接复用率 = 1 - 新建连接数 / 请求数"""
+
+    def __init__(self, keepalive: int = None, **kwargs):
+        self.keepalive = HTTP_POOL_KEEPALIVE if keepalive is None else keepalive
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault('socket_options', _keepalive_options(self.keepalive))
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self._requests += 1
+        try:
+            return super().send(request, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def stats(self) -> Dict:
+        """
+        连接池统计
+
+        Returns:
+            Dict: requests、errors、connections（新建连接数）、reuse_rate，
+            以及每个主机的 connections、requests、idle（空闲连接数）
+        """
+        hosts = {}
+        # RecentlyUsedContainer 的 keys() 会加锁复制
+        for key in self.poolmanager.pools.keys():
+            pool = self.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle': pool.pool.qsize() if pool.pool is not None else 0,
+                'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+            }
+        with self._lock:
+            total_requests, errors = self._requests, self._errors
+        connections = sum(host['connections'] for host in hosts.values())
+        return {
+            'requests': total_requests,
+            'errors': errors,
+            'connections': connections,
+            'reuse_rate': round(1 - connections / total_requests, 4) if total_requests else None,
+            'hosts': hosts,
+        }
+
+
+class HttpPool:
+    """线程安全的共享连接池：每个线程一个 Session，所有 Session 共享同一个 PooledAdapter"""
+
+    def __init__(self, hosts: int = None, maxsize: int = None, block: bool = None, keepalive: int = None):
+        """
+        Args:
+            hosts: 缓存连接池的主机数，默认 HTTP_POOL_HOSTS
+            maxsize: 每个主机保留的最大连接数，默认 HTTP_POOL_MAXSIZE
+            block: 连接数达到上限时是否等待，默认 HTTP_POOL_BLOCK
+            keepalive: TCP keepalive 空闲时间（秒），默认 HTTP_POOL_KEEPALIVE
+        """
+        self.adapter = PooledAdapter(
+            keepalive=keepalive,
+            pool_connections=hosts or HTTP_POOL_HOSTS,
+            pool_maxsize=maxsize or HTTP_POOL_MAXSIZE,
+            pool_block=HTTP_POOL_BLOCK if block is None else block,
+        )
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        """当前线程的 Session"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self._local.session = session
+        return session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.session().post(url, **kwargs)
+
+    def stats(self) -> Dict:
+        return self.adapter.stats()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        self.adapter.close()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HttpPool:
+    """进程内共享的连接池，fork 之后在子进程中重新创建（不复用父进程的连接）"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = HttpPool()
+                _pool_pid = os.getpid()
+    return _pool
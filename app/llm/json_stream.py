@@ -0,0 +1,133 @@
+"""
+增量 JSON 数组流解析
+Gemini streamGenerateContent 返回一个逐步输出的 JSON 数组 `[{...},{...}]`，
+JsonArrayStreamDecoder 每收到一段数据只扫描新增部分，每个元素闭合时立即产出解析结果。
+
+扫描用正则跳到下一个有意义的字符（括号、引号、反斜杠），字符串内的括号不计入深度；
+跨多段数据的元素先把片段存入列表，闭合时一次拼接，整体耗时与响应大小成线性关系。
+"""
+import codecs
+import json
+import re
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, List
+
+# 字符串外：括号和引号；字符串内：引号和反斜杠
+_OUTSIDE_RE = re.compile(r'[{}\[\]"]')
+_INSIDE_RE = re.compile(r'["\\]')
+
+
+class JsonArrayStreamDecoder:
+    """顶层 JSON 数组的增量解析器，元素可以是对象或数组，数组外的内容被忽略"""
+
+    def __init__(self):
+        self._parts: List[str] = []  # 当前元素在之前各段数据中的片段
+        self._depth = 0              # 当前元素内的括号深度，0 表示在元素之间
+        self._in_array = False
+        self._in_string = False
+        self._escape = False         # 上一段数据以字符串内的反斜杠结尾
+        self.done = False            # 已读到顶层数组的 ']'
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        输入一段数据
+
+        Returns:
+            List: 本段数据中闭合的元素（已解析）
+
+        Raises:
+            json.JSONDecodeError: 闭合的元素不是合法的 JSON
+        """
+        values = []
+        if self.done or not text:
+            return values
+        pos = 0
+        start = 0 if self._depth else None  # 当前元素在本段数据中的起始位置
+        if self._escape:
+            self._escape = False
+            pos = 1
+        length = len(text)
+        while pos < length:
+            if self._in_string:
+                match = _INSIDE_RE.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == '\\':
+                    if pos == length:
+                        self._escape = True
+                        break
+                    pos += 1
+                else:
+                    self._in_string = False
+                continue
+
+            match = _OUTSIDE_RE.search(text, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+            if not self._in_array:
+                if char == '[':
+                    self._in_array = True
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    start = pos - 1
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:pos])
+                    raw = ''.join(self._parts)
+                    self._parts = []
+                    start = None
+                    values.append(json.loads(raw))
+            elif char == ']':
+                self.done = True
+                break
+
+        if self._depth and start is not None:
+            self._parts.append(text[start:])
+        return values
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[Any]:
+    """
+    逐个产出字节流中顶层 JSON 数组的元素（多字节字符可以跨段）
+
+    Args:
+        chunks: 字节块，例如 response.iter_content(chunk_size=None)
+        encoding: 字符编码
+    """
+    decoder = JsonArrayStreamDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        if not chunk:
+            continue
+        yield from decoder.feed(text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        if decoder.done:
+            return
+    yield from decoder.feed(text_decoder.decode(b'', final=True))
+
+
+async def aiter_json_array(chunks: AsyncIterable[bytes], encoding: str = 'utf-8') -> AsyncIterator[Any]:
+    """
+    iter_json_array 的异步版本
+
+    Args:
+        chunks: 异步字节块，例如 httpx 的 response.aiter_bytes()
+        encoding: 字符编码
+    """
+    decoder = JsonArrayStreamDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        for value in decoder.feed(text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk):
+            yield value
+        if decoder.done:
+            return
+    for value in decoder.feed(text_decoder.decode(b'', final=True)):
+        yield value
@@ -4,34 +4,39 @@ This module contains configuration settings for supported LLM providers,
 including model types and API keys.
 """
 
+import asyncio
 import os
+import weakref
 from typing import List, Dict, Any, Iterator
 from enum import Enum, auto
 from dotenv import load_dotenv
-from openai import OpenAI
-# from llama_index.llms.openai import OpenAI as OpenAILLM
-# from llama_index.llms.openai_like import OpenAILike
 import requests
-import dashscope
-from dashscope.audio.asr import Recognition
+import threading
 import time
 
 from http import HTTPStatus
-from dashscope.audio.asr import Transcription
+from app.llm.cue_store import CueStore
+from app.llm.http_pool import HttpPool, get_http_pool
+from app.llm.json_stream import aiter_json_array, iter_json_array
 import json
 
 
 # Load environment variables
 load_dotenv()
 
+# 异步接口同时进行的请求数上限（gather_limited 的默认值，也是异步 Gemini 客户端保留的长连接数）
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '64'))
+
 
 class GeminiClient:
     """Gemini API客户端包装器，兼容OpenAI客户端接口"""
 
-    def __init__(self, api_key: str, base_url: str, timeout: int = 120, **kwargs):
+    def __init__(self, api_key: str, base_url: str, timeout: int = 120, http_pool: HttpPool = None, **kwargs):
         self.api_key = api_key
         self.base_url = base_url
         self.timeout = timeout
+        # 所有 Gemini 请求共享长连接池
+        self.http_pool = http_pool or get_http_pool()
         self.chat = GeminiChatCompletions(self)
 
 class GeminiChatCompletions:
@@ -45,7 +50,15 @@ class GeminiChatCompletions:
                max_tokens: int = 2000, stream: bool = False, timeout: int = None, **kwargs):
         """创建chat completion，兼容OpenAI接口"""
         timeout = timeout or self.client.timeout
+        url, headers, payload = self._build_request(model, messages, temperature, max_tokens, stream)
+        if stream:
+            return self._create_stream_response(url, headers, payload, timeout)
+        else:
+            return self._create_sync_response(url, headers, payload, timeout)
 
+    def _build_request(self, model: str, messages: List[Dict[str, str]], temperature: float,
+                       max_tokens: int, stream: bool):
+        """构建请求的 URL、请求头和请求体（同步和异步客户端共用）"""
         # 转换OpenAI格式的消息为Gemini格式
         gemini_contents = self._convert_messages_to_gemini(messages)
 
@@ -63,12 +76,8 @@ class GeminiChatCompletions:
             'Content-Type': 'application/json'
         }
 
-        if stream:
-            url = f"{self.client.base_url}/models/{model}:streamGenerateContent"
-            return self._create_stream_response(url, headers, payload, timeout)
-        else:
-            url = f"{self.client.base_url}/models/{model}:generateContent"
-            return self._create_sync_response(url, headers, payload, timeout)
+        method = 'streamGenerateContent' if stream else 'generateContent'
+        return f"{self.client.base_url}/models/{model}:{method}", headers, payload
 
     def _convert_messages_to_gemini(self, messages: List[Dict[str, str]]) -> List[Dict]:
         """将OpenAI格式的消息转换为Gemini格式"""
@@ -97,7 +106,7 @@ class GeminiChatCompletions:
     def _create_sync_response(self, url: str, headers: Dict, payload: Dict, timeout: int):
         """创建同步响应"""
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+            response = self.client.http_pool.post(url, headers=headers, json=payload, timeout=timeout)
             response.raise_for_status()
 
             gemini_response = response.json()
@@ -107,60 +116,19 @@ class GeminiChatCompletions:
             raise Exception(f"Gemini API request failed: {str(e)}")
 
     def _create_stream_response(self, url: str, headers: Dict, payload: Dict, timeout: int):
-        """创建流式响应 - 处理JSON数组流"""
+        """创建流式响应 - 增量解析JSON数组流，每个对象闭合时立即产出文本"""
         try:
             # 使用真正的流式请求
-            response = requests.post(url, headers=headers, json=payload,
-                                   timeout=timeout, stream=True)
+            response = self.client.http_pool.post(url, headers=headers, json=payload,
+                                                  timeout=timeout, stream=True)
             response.raise_for_status()
 
-            # 解析JSON数组流
-            buffer = ""
-            in_array = False
-            brace_count = 0
-            current_object = ""
-
-            for chunk in response.iter_content(decode_unicode=True):
-                if chunk:
-                    buffer += chunk
-
-                    # 逐字符处理
-                    i = 0
-                    while i < len(buffer):
-                        char = buffer[i]
-
-                        if not in_array:
-                            if char == '[':
-                                in_array = True
-                        else:
-                            if char == '{':
-                                brace_count += 1
-                                current_object += char
-                            elif char == '}':
-                                brace_count -= 1
-                                current_object += char
-
-                                if brace_count == 0:
-                                    # 完成了一个JSON对象
-                                    try:
-                                        json_obj = json.loads(current_object.strip())
-                                        text_chunk = self._extract_text_from_json(json_obj)
-                                        if text_chunk:
-                                            yield GeminiStreamChunk(text_chunk)
-                                    except json.JSONDecodeError:
-                                        pass  # 忽略无效的JSON
-
-                                    current_object = ""
-                            elif brace_count > 0:
-                                current_object += char
-                            elif char == ']':
-                                # 数组结束
-                                break
-
-                        i += 1
-
-                    # 更新缓冲区，移除已处理的字符
-                    buffer = buffer[i:]
+            # chunk_size=None 按网络到达的数据块读取，不再逐字节迭代
+            with response:
+                for json_obj in iter_json_array(response.iter_content(chunk_size=None)):
+                    text_chunk = self._extract_text_from_json(json_obj)
+                    if text_chunk:
+                        yield GeminiStreamChunk(text_chunk)
 
         except Exception as e:
             raise Exception(f"Gemini streaming API request failed: {str(e)}")
@@ -207,6 +175,71 @@ class GeminiChatCompletions:
             raise Exception(f"Failed to convert Gemini response: {str(e)}")
 
 
+class AsyncGeminiClient:
+    """GeminiClient 的异步版本，兼容 AsyncOpenAI 客户端接口（await client.chat.completions.create()）
+
+    使用 httpx.AsyncClient，连接绑定创建时的事件循环，应通过 GeminiProvider.get_async_llm() 获取。
+    """
+
+    def __init__(self, api_key: str, base_url: str, timeout: int = 120, max_connections: int = None,
+                 transport=None, **kwargs):
+        # httpx 随 openai SDK 安装，首次创建异步客户端时才加载
+        import httpx
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        # 不限制连接总数，并发由调用方（gather_limited）控制；保留的长连接数与并发上限一致
+        self.http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=LLM_CONCURRENCY),
+            transport=transport,
+        )
+        self.chat = AsyncGeminiChatCompletions(self)
+
+    async def close(self):
+        await self.http_client.aclose()
+
+
+class AsyncGeminiChatCompletions(GeminiChatCompletions):
+    """Gemini Chat Completions API的异步包装器"""
+
+    async def create(self, model: str, messages: List[Dict[str, str]], temperature: float = 0.3,
+                     max_tokens: int = 2000, stream: bool = False, timeout: int = None, **kwargs):
+        """创建chat completion，兼容AsyncOpenAI接口：stream=True 时返回异步迭代器"""
+        timeout = timeout or self.client.timeout
+        url, headers, payload = self._build_request(model, messages, temperature, max_tokens, stream)
+        if stream:
+            return self._create_stream_response(url, headers, payload, timeout)
+        else:
+            return await self._create_sync_response(url, headers, payload, timeout)
+
+    async def _create_sync_response(self, url: str, headers: Dict, payload: Dict, timeout: int):
+        """创建非流式响应"""
+        try:
+            response = await self.client.http_client.post(url, headers=headers, json=payload, timeout=timeout)
+            response.raise_for_status()
+            return self._convert_gemini_to_openai_response(response.json())
+
+        except Exception as e:
+            raise Exception(f"Gemini API request failed: {str(e)}")
+
+    async def _create_stream_response(self, url: str, headers: Dict, payload: Dict, timeout: int):
+        """创建流式响应 - 每个对象闭合时立即产出文本"""
+        try:
+            async with self.client.http_client.stream('POST', url, headers=headers, json=payload,
+                                                      timeout=timeout) as response:
+                response.raise_for_status()
+                async for json_obj in aiter_json_array(response.aiter_bytes()):
+                    text_chunk = self._extract_text_from_json(json_obj)
+                    if text_chunk:
+                        yield GeminiStreamChunk(text_chunk)
+
+        except Exception as e:
+            raise Exception(f"Gemini streaming API request failed: {str(e)}")
+
+
 class GeminiResponse:
     """模拟OpenAI响应格式"""
 
@@ -313,6 +346,73 @@ class VolcanoArkModel(str, Enum):
     DEEPSEEK_V3 = 'deepseek-v3-250120'
 
 
+# 进程内的 LLM 客户端缓存，键为 (提供者, 基础 URL, API key, 超时等参数)，复用客户端的连接池
+_llm_clients: Dict[tuple, Any] = {}
+_llm_clients_lock = threading.Lock()
+_llm_clients_pid = None
+
+
+def cached_llm_client(key: tuple, factory):
+    """
+    获取缓存的客户端，不存在时用 factory 创建
+
+    fork 之后子进程中清空缓存重新创建：父进程的客户端持有父进程的连接，不能在子进程中复用。
+    参数不可哈希（例如传入了自定义 http_client）时不缓存。
+    """
+    global _llm_clients_pid
+    try:
+        hash(key)
+    except TypeError:
+        return factory()
+    with _llm_clients_lock:
+        if _llm_clients_pid != os.getpid():
+            _llm_clients.clear()
+            _llm_clients_pid = os.getpid()
+        client = _llm_clients.get(key)
+        if client is None:
+            client = _llm_clients[key] = factory()
+        return client
+
+
+# 异步客户端的连接绑定创建时的事件循环，按事件循环分别缓存，循环被回收后缓存随之释放
+_async_llm_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def cached_async_llm_client(key: tuple, factory):
+    """
+    获取当前事件循环中缓存的异步客户端，不存在时用 factory 创建（必须在协程中调用）
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        hash(key)
+    except TypeError:
+        return factory()
+    with _llm_clients_lock:
+        clients = _async_llm_clients.get(loop)
+        if clients is None:
+            clients = _async_llm_clients[loop] = {}
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = factory()
+        return client
+
+
+async def aclose_llm_clients():
+    """关闭当前事件循环中缓存的异步客户端（在 asyncio.run 的协程结束前调用）"""
+    with _llm_clients_lock:
+        clients = _async_llm_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+def reset_llm_clients():
+    """清空客户端缓存（测试中修改配置后使用）"""
+    with _llm_clients_lock:
+        _llm_clients.clear()
+        _async_llm_clients.clear()
+
+
 class ProviderBase:
     """基础提供者类，所有LLM提供者都应继承此类"""
 
@@ -325,7 +425,7 @@ class ProviderBase:
     __special_args__: Dict[str, Any] = {}  # some provider has special args
 
     def get_llm(self, **kwargs):
-        """获取OpenAI兼容的LLM客户端
+        """获取OpenAI兼容的LLM客户端（相同参数在进程内复用同一个客户端）
 
         Args:
             **kwargs: 传递给OpenAI客户端的额外参数
@@ -333,18 +433,34 @@ class ProviderBase:
         Returns:
             OpenAI: OpenAI客户端实例
         """
+        # openai SDK 导入耗时约 1 秒，首次创建客户端时才加载
+        from openai import OpenAI
+
+        client_kwargs, key = self._client_options(kwargs)
+        return cached_llm_client(key, lambda: OpenAI(**client_kwargs))
+
+    def get_async_llm(self, **kwargs):
+        """获取OpenAI兼容的异步LLM客户端（必须在协程中调用，同一事件循环内复用同一个客户端）
+
+        Args:
+            **kwargs: 传递给AsyncOpenAI客户端的额外参数
+
+        Returns:
+            AsyncOpenAI: AsyncOpenAI客户端实例
+        """
+        from openai import AsyncOpenAI
+
+        client_kwargs, key = self._client_options(kwargs)
+        return cached_async_llm_client(key, lambda: AsyncOpenAI(**client_kwargs))
+
+    def _client_options(self, kwargs: Dict[str, Any]):
+        """OpenAI兼容客户端的参数和缓存键"""
         # get openai compatible llm
-        if self.__provider__ == 'openai':
-            return OpenAI(
-                api_key=self.__api_key__,
-                **kwargs
-            )
-        else:
-            return OpenAI(
-                api_key=self.__api_key__,
-                base_url=self.__api_base__,
-                **kwargs
-            )
+        client_kwargs = dict(api_key=self.__api_key__, **kwargs)
+        if self.__provider__ != 'openai':
+            client_kwargs['base_url'] = self.__api_base__
+        key = (self.__provider__, client_kwargs.get('base_url'), self.__api_key__, tuple(sorted(kwargs.items())))
+        return client_kwargs, key
 
     # def get_llm_llama_index(self, model=None, **kwargs):
     #     """获取Llama Index兼容的LLM客户端
@@ -416,7 +532,7 @@ class GeminiProvider(ProviderBase):
     __models__ = [model.value for model in GeminiModel]
 
     def get_llm(self, timeout=120, **kwargs):
-        """获取Gemini兼容的LLM客户端
+        """获取Gemini兼容的LLM客户端（相同参数在进程内复用同一个客户端）
 
         Args:
             timeout: 超时时间（秒）
@@ -425,12 +541,31 @@ class GeminiProvider(ProviderBase):
         Returns:
             GeminiClient: 自定义的Gemini客户端包装器
         """
-        return GeminiClient(
+        key = (self.__provider__, self.__api_base__, self.__api_key__, timeout, tuple(sorted(kwargs.items())))
+        return cached_llm_client(key, lambda: GeminiClient(
             api_key=self.__api_key__,
             base_url=self.__api_base__,
             timeout=timeout,
             **kwargs
-        )
+        ))
+
+    def get_async_llm(self, timeout=120, **kwargs):
+        """获取异步的Gemini客户端（必须在协程中调用，同一事件循环内复用同一个客户端）
+
+        Args:
+            timeout: 超时时间（秒）
+            **kwargs: 传递给客户端的额外参数
+
+        Returns:
+            AsyncGeminiClient: 异步的Gemini客户端包装器
+        """
+        key = (self.__provider__, self.__api_base__, self.__api_key__, timeout, tuple(sorted(kwargs.items())))
+        return cached_async_llm_client(key, lambda: AsyncGeminiClient(
+            api_key=self.__api_key__,
+            base_url=self.__api_base__,
+            timeout=timeout,
+            **kwargs
+        ))
 
 class VolcanoArkProvider(ProviderBase):
     """VolcanoArk提供者配置"""
@@ -492,152 +627,136 @@ def validate_model(provider: str, model: str) -> bool:
     provider_instance = get_provider_config(provider)
     return model in provider_instance.__models__
 
-def generate_subtitle_with_dashscope(audio_path: str, api_key: str = None) -> str:
+def transcribe_url_with_dashscope(file_url: str, api_key: str = None, language_hints=('en',)) -> str:
     """
-    使用 dashscope SDK 的 paraformer-v2 模型生成音频字幕（SRT 格式）
+    使用 DashScope 录音文件识别（paraformer-v2，异步任务）为公开 URL 的音频生成 SRT 字幕
+    
+    接口地址读取 DASHSCOPE_HTTP_BASE_URL，可指向本地替身服务（app/llm/asr_standin.py）
     
     Args:
-        audio_path: 本地音频文件路径
+        file_url: 音频文件的公开 URL
         api_key: dashscope API key（可选，默认读取环境变量）
+        language_hints: 语言提示
     
     Returns:
         SRT 字幕内容字符串
     
     Raises:
-        Exception: 生成失败时抛出
+        Exception: 任务失败时抛出
     """
+    from dashscope.audio.asr import Transcription
+
     api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
-    dashscope.api_key = api_key
-
-    is_url = audio_path.startswith('http')
-
-    # 定义回调类，用于接收识别结果
-    class ResultCallback:
-        def __init__(self):
-            self.sentences = []
-            self.current_index = 1
-            self.debug_info = []
-            
-        def on_sentence_begin(self, result):
-            self.debug_info.append(f"on_sentence_begin: {str(result)}")
-            
-        def on_sentence_end(self, result):
-            self.debug_info.append(f"on_sentence_end: {str(result)}")
-            try:
-                # 查看 result 是否有 sentences 属性或键
-                if hasattr(result, 'sentences'):
-                    sentences = result.sentences
-                elif isinstance(result, dict) and 'sentences' in result:
-                    sentences = result['sentences']
-                else:
-                    # 尝试解析整个文本并给定一个估计的时间范围
-                    if hasattr(result, 'text') and result.text:
-                        text = result.text
-                    elif isinstance(result, dict) and 'text' in result:
-                        text = result['text']
-                    else:
-                        return
-                        
-                    if text and text.strip():
-                        # 为整段文本创建一个简单的字幕
-                        begin_time = "00:00:00,000"
-                        end_time = "00:01:00,000" # 假设 1 分钟
-                        self.sentences.append(f"{self.current_index}\n{begin_time} --> {end_time}\n{text.strip()}\n")
-                        self.current_index += 1
-                    return
-                
-                # 处理句子列表
-                for sentence in sentences:
-                    if isinstance(sentence, dict):
-                        if 'text' in sentence and sentence['text'].strip():
-                            # 尝试获取时间信息
-                            begin_time = self._get_time(sentence, 'begin_time', 0)
-                            end_time = self._get_time(sentence, 'end_time', 10000)
-                            text = sentence['text'].strip()
-                            
-                            # 添加 SRT 格式字幕条目
-                            self.sentences.append(f"{self.current_index}\n{begin_time} --> {end_time}\n{text}\n")
-                            self.current_index += 1
-            except Exception as e:
-                self.debug_info.append(f"Error in on_sentence_end: {str(e)}")
-                
-        def on_completed(self, result):
-            self.debug_info.append(f"on_completed: {str(result)}")
-            # 如果没有解析到句子，尝试从最终结果中解析
-            if not self.sentences and hasattr(result, 'text') and result.text:
-                text = result.text
-                if text and text.strip():
-                    begin_time = "00:00:00,000"
-                    end_time = "00:01:00,000"
-                    self.sentences.append(f"{self.current_index}\n{begin_time} --> {end_time}\n{text.strip()}\n")
-            
-        def on_error(self, result):
-            self.debug_info.append(f"on_error: {str(result)}")
-            raise Exception(f"Recognition error: {result}")
-            
-        def on_start(self, result):
-            self.debug_info.append(f"on_start: {str(result)}")
-            
-        def _get_time(self, sentence, key, default_ms):
-            """安全地获取时间，处理可能的错误"""
-            try:
-                if key in sentence:
-                    return self._format_time(sentence[key])
-                else:
-                    return self._format_time(default_ms)
-            except:
-                return self._format_time(default_ms)
-            
-        def _format_time(self, ms):
-            """将毫秒转换为 SRT 格式的时间 (00:00:00,000)"""
-            try:
-                if isinstance(ms, str):
-                    ms = float(ms)
-                total_seconds = int(ms / 1000)
-                ms = int(ms % 1000)
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
-            except:
-                return "00:00:00,000"
-            
-        def get_srt(self):
-            """获取完整的 SRT 字幕内容"""
-            if not self.sentences:
-                # 如果没有句子被解析，添加调试信息作为注释
-                debug_str = "\n".join([f"# {line}" for line in self.debug_info])
-                return f"1\n00:00:00,000 --> 00:00:10,000\n[未能识别有效内容]\n\n# Debug Info:\n{debug_str}"
-            
-            return "\n".join(self.sentences)
+    task_response = Transcription.async_call(
+        model='paraformer-v2',
+        file_urls=[file_url],
+        language_hints=list(language_hints),
+        api_key=api_key
+    )
+    if task_response.status_code != HTTPStatus.OK:
+        raise Exception(f"Error submitting transcription: {task_response.message}")
+
+    transcribe_response = Transcription.wait(task=task_response.output.task_id, api_key=api_key)
+    output = transcribe_response.output or {}
+    if transcribe_response.status_code != HTTPStatus.OK or output.get('task_status') != 'SUCCEEDED':
+        raise Exception(f"Transcription failed: {transcribe_response.message or output}")
+
+    cues = CueStore()
+    for result in output.get('results', []):
+        if result.get('subtask_status') != 'SUCCEEDED':
+            raise Exception(f"Transcription failed for {result.get('file_url')}: {result}")
+        transcription = requests.get(result['transcription_url'], timeout=(10, 30))
+        transcription.raise_for_status()
+        for transcript in transcription.json().get('transcripts', []):
+            for sentence in transcript.get('sentences', []):
+                text = (sentence.get('text') or '').strip()
+                if text:
+                    cues.append(int(sentence['begin_time']), int(sentence['end_time']), text)
+    cues.sort()
+    return cues.to_srt()
+
+# 本地文件识别（实时识别接口，SDK 读取文件后分块通过 WebSocket 发送）的模型和支持的音频格式
+DASHSCOPE_REALTIME_MODEL = os.getenv('DASHSCOPE_REALTIME_MODEL', 'paraformer-realtime-v2')
+DASHSCOPE_LOCAL_FORMATS = {'.mp3': 'mp3', '.wav': 'wav', '.aac': 'aac', '.opus': 'opus', '.amr': 'amr'}
+
+
+def supports_local_recognition(audio_path: str) -> bool:
+    """音频格式是否可以直接上传给 DashScope 实时识别（m4a 等格式只能走公开 URL）"""
+    return os.path.splitext(audio_path)[1].lower() in DASHSCOPE_LOCAL_FORMATS
+
+
+def transcribe_file_with_dashscope(audio_path: str, api_key: str = None, sample_rate: int = None,
+                                   language_hints=('en',)) -> CueStore:
+    """
+    使用 DashScope 实时识别直接上传本地音频，不需要公开 URL；
+    WebSocket 地址读取 DASHSCOPE_WEBSOCKET_BASE_URL，可指向本地替身服务（app/llm/asr_standin.py）
+
+    Args:
+        audio_path: 本地音频文件路径
+        api_key: dashscope API key（可选，默认读取环境变量）
+        sample_rate: 音频采样率，未知时按 16000 提交
+        language_hints: 语言提示
+
+    Returns:
+        CueStore: 字幕条目（带词级时间）
+
+    Raises:
+        ValueError: 音频格式不支持本地识别（例如 m4a）
+        Exception: 识别失败时抛出
+    """
+    if not supports_local_recognition(audio_path):
+        raise ValueError(f"Unsupported audio format for local recognition: {audio_path}")
+
+    import dashscope
+    from dashscope.audio.asr import Recognition, RecognitionCallback
+
+    dashscope.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+    recognizer = Recognition(
+        model=DASHSCOPE_REALTIME_MODEL,
+        callback=RecognitionCallback(),
+        format=DASHSCOPE_LOCAL_FORMATS[os.path.splitext(audio_path)[1].lower()],
+        sample_rate=sample_rate or 16000,
+        language_hints=list(language_hints),
+    )
+    result = recognizer.call(file=audio_path)
+    if result.status_code != HTTPStatus.OK:
+        raise Exception(f"Recognition failed: {result.message}")
+
+    cues = CueStore()
+    for sentence in result.get_sentence() or []:
+        text = (sentence.get('text') or '').strip()
+        if not text:
+            continue
+        words = [(int(word['begin_time']), int(word['end_time']), word['text'] + (word.get('punctuation') or ''))
+                 for word in sentence.get('words') or []
+                 if word.get('text') and word.get('begin_time') is not None and word.get('end_time') is not None]
+        cues.append(int(sentence['begin_time']), int(sentence['end_time']), text, words=words or None)
+    cues.sort()
+    return cues
+
+def generate_subtitle_with_dashscope(audio_path: str, api_key: str = None) -> str:
+    """
+    使用 dashscope SDK 的 paraformer 模型生成音频字幕（SRT 格式）
     
-    # 创建回调对象
-    callback = ResultCallback()
+    Args:
+        audio_path: 本地音频文件路径或公开 URL
+        api_key: dashscope API key（可选，默认读取环境变量）
     
+    Returns:
+        SRT 字幕内容字符串
+    
+    Raises:
+        Exception: 生成失败时抛出
+    """
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+
+    if audio_path.startswith('http'):
+        # 实时识别只能读取本地文件，URL 走录音文件识别
+        return transcribe_url_with_dashscope(audio_path, api_key)
+
+    print(f"Processing audio file: {audio_path}")
     try:
-        # 创建识别器对象
-        recognizer = Recognition(
-            model='paraformer-v2',  # 使用官方示例中的格式
-            format='mp3', 
-            sample_rate=16000,  # 采样率
-            callback=callback
-        )
-        
-        # 打印一些基本信息
-        print(f"Processing audio {'URL' if is_url else 'file'}: {audio_path}")
-        
-        # 根据输入类型调用不同的API
-        if is_url:
-            # 处理URL文件
-            result = recognizer.call(file=audio_path)
-        else:
-            # 处理本地文件
-            result = recognizer.call(file=audio_path)
-            
-        print(f"Recognition completed with result: {result}")
-        
-        # 返回 SRT 格式字幕
-        return callback.get_srt()
+        return transcribe_file_with_dashscope(audio_path, api_key).to_srt()
     except Exception as e:
         print(f"Error in generate_subtitle_with_dashscope: {str(e)}")
         raise Exception(f"Error generating subtitle: {str(e)}")
@@ -646,6 +765,7 @@ def sample_call():
     # 若没有将API Key配置到环境变量中，需将下面这行代码注释放开，并将apiKey替换为自己的API Key
     # import dashscope
     # dashscope.api_key = "apiKey"
+    from dashscope.audio.asr import Transcription
 
     task_response = Transcription.async_call(
         model='paraformer-v2',
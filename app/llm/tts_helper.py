@@ -5,7 +5,6 @@ Qwen-TTS API, supporting multiple languages and voices.
 """
 
 import os
-import dashscope
 from typing import Optional, Dict, Any
 import base64
 from dotenv import load_dotenv
@@ -90,6 +89,9 @@ def text_to_speech(
     if not api_key:
         raise ValueError("DASHSCOPE_API_KEY not found in environment variables")
 
+    # Import the SDK on first use to keep app startup fast
+    import dashscope
+
     dashscope.api_key = api_key
 
     try:
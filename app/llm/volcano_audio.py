@@ -1,9 +1,15 @@
+import difflib
+import heapq
+import itertools
 import os
+import random
+import threading
 import requests
 import time
 import json
 import re
 import pathlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,7 +17,10 @@ load_dotenv()
 # 导入LLM providers
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.llm.providers import get_provider_config, AliyunModel   
+from app.llm.providers import (get_provider_config, AliyunModel, DASHSCOPE_REALTIME_MODEL, supports_local_recognition,
+                               transcribe_file_with_dashscope)
+from app.llm.cue_store import CueStore, format_srt_time, parse_srt_time
+from app.subtitle_store import write_atomic, write_subtitle
 
 def log_time(func):
     def wrapper(*args, **kw):
@@ -21,36 +30,110 @@ def log_time(func):
         return result
     return wrapper
 
+# 查询任务结果的轮询参数（秒）：间隔从 INITIAL 开始指数增长到 MAX，加随机抖动，总时长不超过 TIMEOUT
+POLL_INITIAL_INTERVAL = float(os.getenv('VOLCANO_POLL_INITIAL_INTERVAL', '1'))
+POLL_MAX_INTERVAL = float(os.getenv('VOLCANO_POLL_MAX_INTERVAL', '15'))
+POLL_TIMEOUT = float(os.getenv('VOLCANO_POLL_TIMEOUT', '900'))
+# 已知音频时长时，每秒音频最多等待 RATIO 秒（不低于 TIMEOUT），长音轨不会被固定的截止时间误判为超时
+POLL_TIMEOUT_RATIO = float(os.getenv('VOLCANO_POLL_TIMEOUT_RATIO', '1'))
+# 单次 HTTP 请求的 (连接, 读取) 超时
+REQUEST_TIMEOUT = (10, 30)
+# 任务尚未完成（处理中 / 排队中）
+PENDING_CODES = (2000, 2001)
+
+
+# 识别参数，同时参与字幕存储键的计算：修改后已有字幕不再命中
+ASR_PROVIDER = 'volcano'
+VOLCANO_ASR_PARAMS = dict(
+    use_itn='True',
+    use_capitalize='True',
+    max_lines=1,
+    words_per_line=15,
+)
+DASHSCOPE_ASR_PARAMS = dict(model=DASHSCOPE_REALTIME_MODEL)
+
+# ASR 输入方式：url（默认）由火山引擎从公开 URL 下载，带说话人区分；
+# local 直接上传本地文件，识别服务随之换成 DashScope 实时识别（没有说话人区分），
+# DashScope 实时识别不支持的格式（例如 m4a）仍走公开 URL
+ASR_INPUT = os.getenv('ASR_INPUT', 'url')
+# 本地识别失败时是否退回公开 URL
+ASR_URL_FALLBACK = os.getenv('ASR_URL_FALLBACK', '1') == '1'
+
+
+def poll_timeout_for(duration_ms: int = None) -> float:
+    """
+    按音频时长计算识别任务的最长等待时间（秒）
+
+    Args:
+        duration_ms: 音频时长（毫秒），未知时为 None
+    """
+    if not duration_ms:
+        return POLL_TIMEOUT
+    return max(POLL_TIMEOUT, duration_ms / 1000 * POLL_TIMEOUT_RATIO)
+
+
+class VolcanoJobError(Exception):
+    """字幕任务提交或识别失败"""
+
+
+class VolcanoJobTimeout(VolcanoJobError):
+    """字幕任务在截止时间内没有完成"""
+
+
+def poll_delay(attempt: int) -> float:
+    """
+    第 attempt 次查询前的等待时间：指数退避 + 随机抖动（取上限的 50%~100%），
+    避免大量任务在同一时刻一起查询
+
+    Args:
+        attempt: 已经查询的次数，从 0 开始
+
+    Returns:
+        float: 等待秒数
+    """
+    ceiling = min(POLL_MAX_INTERVAL, POLL_INITIAL_INTERVAL * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
 class VolcanoAudioProvider():
     """VolcanoAudio提供者配置"""
 
     def __init__(self):
-        self.__api_base__ = 'https://openspeech.bytedance.com/api/v1/vc'
+        # 可指向本地替身服务（app/llm/asr_standin.py）做离线测试和压测
+        self.__api_base__ = os.getenv('VOLCANO_AUDIO_API_BASE', 'https://openspeech.bytedance.com/api/v1/vc').rstrip('/')
         self.__api_key__ = os.getenv("VOLCANO_AUDIO_API_KEY")
         self.__appid__ = os.getenv("VOLCANO_AUDIO_APPID")
         self.__access_token__ = os.getenv("VOLCANO_AUDIO_ACCESS_TOKEN")
 
     @log_time
-    def get_subtitles(self, file_url: str, language: str = 'en'):
+    def get_subtitles(self, file_url: str, language: str = 'en', timeout: float = None):
         """
-        获取音频字幕原始数据
+        获取音频字幕原始数据：提交任务后轮询直到完成
         
         Args:
             file_url: 音频文件的URL
             language: 语言代码，默认为英语('en')
+            timeout: 等待任务完成的最长时间（秒），默认 VOLCANO_POLL_TIMEOUT
             
         Returns:
             API返回的原始响应数据
         """
+        job_id = self.submit(file_url, language)
+        return self.wait_for_result(job_id, timeout)
+
+    def submit(self, file_url: str, language: str = 'en') -> str:
+        """
+        提交字幕任务
+        
+        Returns:
+            str: 任务 ID
+        """
         response = requests.post(
                     '{base_url}/submit'.format(base_url=self.__api_base__),
                     params=dict(
                         appid=self.__appid__,
                         language=language,
-                        use_itn='True',
-                        use_capitalize='True',
-                        max_lines=1,
-                        words_per_line=15,
+                        **VOLCANO_ASR_PARAMS,
                     ),
                     json={
                         'url': file_url,
@@ -58,34 +141,86 @@ class VolcanoAudioProvider():
                     headers={
                         'content-type': 'application/json',
                         'Authorization': 'Bearer; {}'.format(self.__access_token__)
-                    }
+                    },
+                    timeout=REQUEST_TIMEOUT
                 )
         print('Submit response = {}'.format(response.text))
         
         if response.status_code != 200:
-            raise Exception(f"Error submitting audio transcription job: {response.text}")
+            raise VolcanoJobError(f"Error submitting audio transcription job: {response.text}")
         
         response_json = response.json()
         if response_json.get('message') != 'Success':
-            raise Exception(f"Failed to submit audio transcription job: {response_json}")
+            raise VolcanoJobError(f"Failed to submit audio transcription job: {response_json}")
+
+        return response_json['id']
 
-        job_id = response_json['id']
+    def query(self, job_id: str):
+        """
+        查询一次任务状态（非阻塞）
         
+        Returns:
+            任务完成时返回 API 响应数据，仍在处理中时返回 None
+            
+        Raises:
+            VolcanoJobError: 任务失败或请求被拒绝（4xx）
+            requests.RequestException: 网络错误，调用方可以重试
+        """
         response = requests.get(
                 '{base_url}/query'.format(base_url=self.__api_base__),
                 params=dict(
                     appid=self.__appid__,
                     id=job_id,
+                    blocking=0,
                 ),
                 headers={
                 'Authorization': 'Bearer; {}'.format(self.__access_token__)
-                }
+                },
+                timeout=REQUEST_TIMEOUT
         )
-            
+        
+        if response.status_code >= 500:
+            raise requests.HTTPError(f"Error checking job status: {response.status_code} {response.text}")
         if response.status_code != 200:
-            print(f"Error checking job status: {response.text}")
-                
-        return response.json()
+            raise VolcanoJobError(f"Error checking job status: {response.text}")
+        
+        data = response.json()
+        code = data.get('code', 0)
+        if code in PENDING_CODES:
+            return None
+        if code != 0:
+            raise VolcanoJobError(f"Transcription job {job_id} failed: {data}")
+        return data
+
+    def wait_for_result(self, job_id: str, timeout: float = None):
+        """
+        轮询任务直到完成，网络错误会重试
+        
+        Args:
+            job_id: 任务 ID
+            timeout: 最长等待时间（秒），默认 VOLCANO_POLL_TIMEOUT
+            
+        Returns:
+            API返回的原始响应数据
+            
+        Raises:
+            VolcanoJobTimeout: 超过截止时间仍未完成
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else POLL_TIMEOUT)
+        attempt = 0
+        while True:
+            try:
+                data = self.query(job_id)
+                if data is not None:
+                    return data
+            except requests.RequestException as e:
+                print(f"Query for job {job_id} failed, will retry: {str(e)}")
+            
+            delay = poll_delay(attempt)
+            attempt += 1
+            if time.monotonic() + delay > deadline:
+                raise VolcanoJobTimeout(f"Transcription job {job_id} not finished after {attempt} queries")
+            time.sleep(delay)
             
     def convert_to_srt(self, subtitles_data):
         """
@@ -98,38 +233,52 @@ class VolcanoAudioProvider():
             SRT格式的字幕内容
         """
         try:
-            utterances = subtitles_data.get('utterances', [])
-            if not utterances:
+            cues = self.to_cue_store(subtitles_data)
+            if not len(cues):
                 return "1\n00:00:00,000 --> 00:00:10,000\n[未能识别有效内容]"
-            
-            srt_parts = []
-            for i, utterance in enumerate(utterances):
-                # 确保有文本内容
-                text = utterance.get('text', '').strip()
-                if not text:
-                    continue
-                
-                # 获取开始和结束时间（毫秒）
-                # API返回的时间单位是毫秒
-                start_ms = int(float(utterance.get('start_time', 0)))
-                end_ms = int(float(utterance.get('end_time', 0)))
-                
-                # 转换为SRT时间格式 (HH:MM:SS,mmm)
-                start_time = self._format_time(start_ms)
-                end_time = self._format_time(end_ms)
-                
-                # 添加SRT条目
-                srt_parts.append(f"{i+1}\n{start_time} --> {end_time}\n{text}\n")
-            
-            if not srt_parts:
-                return "1\n00:00:00,000 --> 00:00:10,000\n[未能识别有效内容]"
-                
-            return "\n".join(srt_parts)
+            return cues.to_srt()
             
         except Exception as e:
             print(f"Error converting to SRT: {str(e)}")
             return "1\n00:00:00,000 --> 00:00:10,000\n[字幕转换错误]"
     
+    def to_cue_store(self, subtitles_data):
+        """
+        将Volcano API返回的 utterances 转换为 CueStore（API返回的时间单位是毫秒），跳过空文本
+        
+        Returns:
+            CueStore: 字幕条目
+        """
+        cues = CueStore()
+        for utterance in subtitles_data.get('utterances', []):
+            text = utterance.get('text', '').strip()
+            if not text:
+                continue
+            cues.append(int(float(utterance.get('start_time', 0))), int(float(utterance.get('end_time', 0))), text,
+                        words=self._utterance_words(utterance) or None)
+        cues.sort()
+        return cues
+    
+    def extract_words(self, subtitles_data):
+        """
+        提取 API 返回的词级时间
+        
+        Returns:
+            List[Tuple]: (start_ms, end_ms, word)，按开始时间排序；API 没有返回时为空列表
+        """
+        words = []
+        for utterance in subtitles_data.get('utterances', []):
+            words.extend(self._utterance_words(utterance))
+        return sorted(words)
+    
+    def _utterance_words(self, utterance):
+        words = []
+        for word in utterance.get('words') or []:
+            text = (word.get('text') or '').strip()
+            if text and word.get('start_time') is not None and word.get('end_time') is not None:
+                words.append((int(float(word['start_time'])), int(float(word['end_time'])), text))
+        return words
+    
     def _format_time(self, ms):
         """
         将毫秒转换为SRT时间格式 (HH:MM:SS,mmm)
@@ -143,23 +292,132 @@ class VolcanoAudioProvider():
         try:
             if isinstance(ms, str):
                 ms = float(ms)
-                
-            # 确保ms是一个非负数
-            ms = max(0, ms)
-            
-            # 转换为时、分、秒和毫秒
-            total_seconds = int(ms / 1000)
-            milliseconds = int(ms % 1000)
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            
-            # 格式化为 HH:MM:SS,mmm
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+            return format_srt_time(ms)
         except Exception as e:
             print(f"Error formatting time: {str(e)}")
             return "00:00:00,000"
 
+class VolcanoJobPoller:
+    """
+    多路复用的任务轮询器
+    
+    一个后台线程按各任务的下次查询时间（最小堆）轮流查询所有已提交的任务，
+    每个任务返回一个 Future；批量生成字幕时不需要为每个音轨阻塞一个线程。
+    """
+
+    def __init__(self, provider: VolcanoAudioProvider = None, timeout: float = None):
+        """
+        Args:
+            provider: 字幕服务提供者，默认新建 VolcanoAudioProvider
+            timeout: 每个任务的最长等待时间（秒），默认 VOLCANO_POLL_TIMEOUT
+        """
+        self.provider = provider or VolcanoAudioProvider()
+        self.timeout = timeout if timeout is not None else POLL_TIMEOUT
+        self._condition = threading.Condition()
+        self._heap = []  # (下次查询时间, 序号, job_id, 已查询次数, 截止时间, Future)
+        self._counter = itertools.count()
+        self._pid = None
+
+    def submit(self, file_url: str, language: str = 'en', timeout: float = None) -> Future:
+        """
+        提交字幕任务并开始跟踪
+        
+        Args:
+            file_url: 音频文件的URL
+            language: 语言代码
+            timeout: 最长等待时间（秒），默认使用轮询器的设置
+            
+        Returns:
+            Future: 结果为 API 返回的原始响应数据
+        """
+        return self.track(self.provider.submit(file_url, language), timeout)
+
+    def track(self, job_id: str, timeout: float = None) -> Future:
+        """
+        跟踪已提交的任务
+        
+        Args:
+            job_id: 任务 ID
+            timeout: 最长等待时间（秒），默认使用轮询器的设置
+            
+        Returns:
+            Future: 结果为 API 返回的原始响应数据，失败或超时时为 VolcanoJobError
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        now = time.monotonic()
+        deadline = now + (timeout if timeout is not None else self.timeout)
+        with self._condition:
+            self._ensure_thread()
+            heapq.heappush(self._heap, (now + poll_delay(0), next(self._counter), job_id, 0, deadline, future))
+            self._condition.notify()
+        return future
+
+    def pending(self) -> int:
+        """正在跟踪的任务数"""
+        with self._condition:
+            return len(self._heap)
+
+    def _ensure_thread(self):
+        # fork 之后子进程中没有轮询线程，需要重新启动（调用方持有锁）
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._heap = []
+        thread = threading.Thread(target=self._run, name='volcano-poller')
+        thread.daemon = True
+        thread.start()
+
+    def _due_jobs(self):
+        """等待并取出所有到期的任务"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap))
+                    return due
+                self._condition.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _run(self):
+        while True:
+            for _, _, job_id, attempt, deadline, future in self._due_jobs():
+                try:
+                    data = self.provider.query(job_id)
+                except requests.RequestException as e:
+                    print(f"Query for job {job_id} failed, will retry: {str(e)}")
+                    data = None
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+
+                if data is not None:
+                    future.set_result(data)
+                    continue
+
+                next_at = time.monotonic() + poll_delay(attempt + 1)
+                if next_at > deadline:
+                    future.set_exception(VolcanoJobTimeout(
+                        f"Transcription job {job_id} not finished after {attempt + 1} queries"))
+                    continue
+                with self._condition:
+                    heapq.heappush(self._heap, (next_at, next(self._counter), job_id, attempt + 1, deadline, future))
+
+
+_default_poller = None
+_default_poller_lock = threading.Lock()
+
+
+def get_job_poller() -> VolcanoJobPoller:
+    """进程内共享的任务轮询器"""
+    global _default_poller
+    with _default_poller_lock:
+        if _default_poller is None:
+            _default_poller = VolcanoJobPoller()
+        return _default_poller
+
+
 def parse_srt_to_entries(srt_content):
     """
     解析SRT字幕内容为结构化数据（支持说话人标记）
@@ -168,36 +426,9 @@ def parse_srt_to_entries(srt_content):
         srt_content: SRT格式字幕内容
         
     Returns:
-        List[Dict]: 字幕条目列表，每个条目包含index、start_time、end_time、text、speaker
+        List[Dict]: 字幕条目列表，每个条目包含index、start_time、end_time、start_ms、end_ms、text、speaker
     """
-    entries = []
-    if not srt_content or not srt_content.strip():
-        return entries
-    
-    # SRT格式正则表达式
-    pattern = r'(\d+)\n([\d:,]+)\s+-->\s+([\d:,]+)\n((?:.*\n?)*?)(?=\n\d+\n|$)'
-    matches = re.findall(pattern, srt_content.strip() + '\n', re.MULTILINE)
-    
-    for match in matches:
-        index, start_time, end_time, text = match
-        text_content = text.strip()
-        speaker = None
-        
-        # 检查文本是否包含说话人标记
-        speaker_match = re.match(r'\[([ABC])\]\s*(.*)', text_content)
-        if speaker_match:
-            speaker = speaker_match.group(1)
-            text_content = speaker_match.group(2)
-        
-        entries.append({
-            'index': int(index),
-            'start_time': start_time.strip(),
-            'end_time': end_time.strip(), 
-            'text': text_content,
-            'speaker': speaker
-        })
-    
-    return entries
+    return CueStore.from_srt(srt_content).to_entries()
 
 def entries_to_srt(entries):
     """
@@ -209,48 +440,77 @@ def entries_to_srt(entries):
     Returns:
         str: SRT格式字幕内容，说话人信息嵌入到文本中
     """
-    srt_parts = []
-    for i, entry in enumerate(entries):
-        if entry['text'].strip():  # 只保留有文本内容的条目
-            text_content = entry['text'].strip()
-            
-            # 如果有说话人信息，将其嵌入到文本开头
-            if entry.get('speaker'):
-                text_content = f"[{entry['speaker']}] {text_content}"
-            
-            srt_parts.append(f"{i+1}\n{entry['start_time']} --> {entry['end_time']}\n{text_content}\n")
-    
-    return "\n".join(srt_parts)
+    # 只保留有文本内容的条目
+    return CueStore.from_entries(entries).to_srt()
 
-def optimize_subtitles_with_llm(srt_content, max_retries=2):
+# 长音轨分窗口优化：每个窗口的条目数、相邻窗口重叠的条目数、同时进行的 LLM 调用数
+LLM_WINDOW_SIZE = int(os.getenv('LLM_WINDOW_SIZE', '40'))
+LLM_WINDOW_OVERLAP = int(os.getenv('LLM_WINDOW_OVERLAP', '6'))
+LLM_OPTIMIZE_CONCURRENCY = int(os.getenv('LLM_OPTIMIZE_CONCURRENCY', '4'))
+
+SPEAKER_LABELS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# 优化器版本：修改提示词或窗口策略时递增，已缓存的优化字幕随之失效
+OPTIMIZER_REVISION = 'v1'
+
+
+def optimizer_version() -> str:
+    """当前优化器版本（模型、窗口参数、修订号）"""
+    return (f"{AliyunModel.QWEN_PLUS_LATEST.value}:windowed-{LLM_WINDOW_SIZE}-{LLM_WINDOW_OVERLAP}:"
+            f"{OPTIMIZER_REVISION}")
+
+
+def uses_local_asr(audio_path: str = None, asr_input: str = None) -> bool:
     """
-    使用LLM优化字幕，将碎片化的短句合并为完整的语义单元
-    
+    是否上传本地文件识别：ASR_INPUT=local 且音频格式支持 DashScope 实时识别
+
     Args:
-        srt_content: 原始SRT字幕内容
-        max_retries: 最大重试次数
-        
+        audio_path: 音频文件路径或文件名，None 时只看输入方式
+        asr_input: 输入方式，默认读取 ASR_INPUT
+    """
+    if (asr_input or ASR_INPUT) != 'local':
+        return False
+    return audio_path is None or supports_local_recognition(audio_path)
+
+
+def asr_provider(audio_path: str = None) -> str:
+    """当前 ASR 输入方式下（指定音频时按它的格式）优先使用的识别服务"""
+    return 'dashscope' if uses_local_asr(audio_path) else ASR_PROVIDER
+
+
+def subtitle_cache_params(language: str = 'en', inline_optimization: bool = False,
+                          optimized_from: str = None, asr: str = None):
+    """
+    字幕存储键的生成参数部分
+
+    Args:
+        language: 识别语言
+        inline_optimization: 原始字幕生成时是否已经过 LLM 优化（generate_subtitle_for_mp3 的默认行为）
+        optimized_from: 生成 .optimized.srt 时，作为输入的原始字幕内容的 sha256
+        asr: 实际使用的识别服务，默认 asr_provider()
+
     Returns:
-        str: 优化后的SRT字幕内容
+        Dict: ASR 服务及参数，以及经过优化时的优化器版本
     """
-    if not srt_content or not srt_content.strip():
-        return srt_content
+    asr = asr or asr_provider()
+    params = {'asr': asr, 'language': language,
+              'asr_params': DASHSCOPE_ASR_PARAMS if asr == 'dashscope' else VOLCANO_ASR_PARAMS}
+    if inline_optimization:
+        params['inline_optimization'] = True
+    if optimized_from:
+        params['optimized_from'] = optimized_from
+    if inline_optimization or optimized_from:
+        params['optimizer'] = optimizer_version()
+    return params
+
+
+def _build_optimization_prompt(entries):
+    """构建字幕优化提示词"""
+    text_for_llm = "原始字幕条目:\n"
+    for i, entry in enumerate(entries):
+        text_for_llm += f"{i+1}. [{entry['start_time']} --> {entry['end_time']}] {entry['text']}\n"
     
-    try:
-        # 解析原始字幕
-        entries = parse_srt_to_entries(srt_content)
-        if len(entries) < 2:  # 如果字幕条目太少，不需要优化
-            return srt_content
-            
-        print(f"Original subtitle entries: {len(entries)}")
-        
-        # 准备给LLM的文本格式
-        text_for_llm = "原始字幕条目:\n"
-        for i, entry in enumerate(entries):
-            text_for_llm += f"{i+1}. [{entry['start_time']} --> {entry['end_time']}] {entry['text']}\n"
-        
-        # 构建LLM提示词
-        prompt = f"""你是一个专业的英语字幕优化专家。请将下面碎片化的英语字幕优化成自然流畅的对话字幕。
+    return f"""你是一个专业的英语字幕优化专家。请将下面碎片化的英语字幕优化成自然流畅的对话字幕。
 
 【核心要求】:
 1. 将相邻的短句合并为完整的语义单元，但不要跨越不同说话人
@@ -285,52 +545,493 @@ def optimize_subtitles_with_llm(srt_content, max_retries=2):
 
 请输出优化后的字幕条目:"""
 
+
+def _optimize_window(client, entries, max_retries=2):
+    """
+    用一次 LLM 调用优化一个窗口的字幕条目
+
+    输出被 max_tokens 截断（finish_reason == 'length'）或时间格式无法解析时视为失败并重试。
+
+    Returns:
+        List[Dict]: 优化后的条目（附带 start_ms / end_ms），失败时返回 None
+    """
+    prompt = _build_optimization_prompt(entries)
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.chat.completions.create(
+                model=AliyunModel.QWEN_PLUS_LATEST.value,  # 使用较便宜的模型
+                messages=[
+                    {"role": "system", "content": "你是一个专业的英语字幕优化专家，擅长将碎片化的字幕合并为完整句子。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,  # 低温度确保一致性
+                max_tokens=2000
+            )
+            
+            choice = response.choices[0]
+            print(f"LLM response received (attempt {attempt + 1})")
+            
+            # 解析LLM的响应
+            optimized_entries = parse_llm_response(choice.message.content)
+            for entry in optimized_entries:
+                entry['start_ms'] = parse_srt_time(entry['start_time'])
+                entry['end_ms'] = parse_srt_time(entry['end_time'])
+            
+            if getattr(choice, 'finish_reason', None) == 'length':
+                print(f"LLM response truncated on attempt {attempt + 1}")
+            elif not optimized_entries or any(e['start_ms'] is None or e['end_ms'] is None for e in optimized_entries):
+                print(f"Failed to parse LLM response on attempt {attempt + 1}")
+            else:
+                return optimized_entries
+            
+            if attempt < max_retries:
+                time.sleep(1)  # 等待1秒后重试
+                
+        except Exception as e:
+            print(f"LLM call failed on attempt {attempt + 1}: {str(e)}")
+            if attempt < max_retries:
+                time.sleep(2)  # 等待2秒后重试
+    return None
+
+
+def split_into_windows(entries, size=None, overlap=None):
+    """
+    将字幕条目切分为相互重叠的窗口
+
+    Returns:
+        List[Tuple[int, int]]: 每个窗口在 entries 中的 [start, end) 下标
+    """
+    size = size or LLM_WINDOW_SIZE
+    overlap = overlap if overlap is not None else LLM_WINDOW_OVERLAP
+    overlap = max(0, min(overlap, size // 2))
+    step = size - overlap
+    
+    windows = []
+    start = 0
+    while True:
+        end = min(start + size, len(entries))
+        windows.append((start, end))
+        if end >= len(entries):
+            return windows
+        start += step
+
+
+def _seam_cut_ms(entries, overlap_start, overlap_end, previous_cues=(), cues=()):
+    """
+    选取两个窗口的接缝位置：两个窗口的优化条目都不跨越的条目边界中，
+    重叠区内静音间隔最长的（相同时取最早的），句子最可能在这里结束
+
+    LLM 会把多个原始条目合并成一条；接缝落在合并条目中间时，
+    两边窗口各取一部分会重复或丢失内容，因此跳过被任一窗口切断的边界。
+    重叠区内没有这样的边界时，退回前一窗口的结束位置（前一窗口的条目不会跨过它）。
+
+    Args:
+        entries: 原始条目
+        overlap_start: 后一个窗口的开始下标
+        overlap_end: 前一个窗口的结束下标
+        previous_cues: 前一个窗口的优化条目
+        cues: 后一个窗口的优化条目
+
+    Returns:
+        Tuple[int, bool]: 接缝时间（毫秒），开始时间早于它的优化条目归前一个窗口，其余归后一个窗口；
+        以及是否没有两边都不切断的边界
+    """
+    def boundary(i):
+        start_ms = parse_srt_time(entries[i]['start_time'])
+        prev_end_ms = parse_srt_time(entries[i - 1]['end_time'])
+        if start_ms is None or prev_end_ms is None:
+            return None
+        return start_ms - prev_end_ms, start_ms
+
+    def crossed(time_ms):
+        return any(cue['start_ms'] < time_ms < cue['end_ms'] for cue in itertools.chain(previous_cues, cues))
+
+    candidates = []
+    for i in range(max(overlap_start, 1), overlap_end):
+        found = boundary(i)
+        if found is not None:
+            candidates.append((-found[0], i, found[1]))
+    candidates.sort()
+    for _, _, time_ms in candidates:
+        if not crossed(time_ms):
+            return time_ms, False
+    if overlap_end < len(entries):
+        found = boundary(overlap_end)
+        if found is not None and not crossed(found[1]):
+            return found[1], False
+
+    # 两边都切断时仍按静音间隔选取，由 stitch_windows 去掉被前一窗口条目覆盖的部分
+    if candidates:
+        return candidates[0][2], True
+    return parse_srt_time(entries[(overlap_start + overlap_end) // 2]['start_time']) or 0, True
+
+
+def _speaker_at(cues, time_ms):
+    """返回 time_ms 时刻所在（或之前最近）的优化条目的说话人"""
+    speaker = None
+    for cue in cues:
+        if cue['start_ms'] > time_ms:
+            break
+        speaker = cue['speaker']
+    return speaker
+
+
+def _remap_speakers(previous_cues, cues, overlap_times, known_labels):
+    """
+    按重叠区的多数投票将窗口内的说话人标记映射到全局标记
+
+    每个窗口的 LLM 调用都从 [A] 开始编号，同一个人在不同窗口里可能是不同标记。
+    对重叠区每个原始条目，统计 (本窗口标记 -> 前一窗口标记) 的票数，按票数从高到低
+    （相同时按标记排序）一一对应；重叠区里没有出现的标记依次对应最近出现过、
+    尚未被占用的全局标记（known_labels，按最近出现排序），都用完后才分配新标记。
+    """
+    votes = {}
+    for time_ms in overlap_times:
+        ours, theirs = _speaker_at(cues, time_ms), _speaker_at(previous_cues, time_ms)
+        if ours and theirs:
+            votes[(ours, theirs)] = votes.get((ours, theirs), 0) + 1
+    
+    mapping, taken = {}, set()
+    for (ours, theirs), _ in sorted(votes.items(), key=lambda item: (-item[1], item[0])):
+        if ours not in mapping and theirs not in taken:
+            mapping[ours] = theirs
+            taken.add(theirs)
+    
+    used = set(known_labels) | taken
+    candidates = [label for label in known_labels if label not in taken]
+    for label in sorted({cue['speaker'] for cue in cues if cue['speaker']}):
+        if label in mapping:
+            continue
+        if candidates:
+            mapping[label] = candidates.pop(0)
+        else:
+            mapping[label] = next((l for l in SPEAKER_LABELS if l not in used), label)
+            used.add(mapping[label])
+    
+    for cue in cues:
+        if cue['speaker']:
+            cue['speaker'] = mapping[cue['speaker']]
+
+
+def stitch_windows(entries, windows, window_results):
+    """
+    拼接各窗口的优化结果
+
+    - 接缝位置由 _seam_cut_ms 决定，不切断任一窗口合并出的条目；结果只取决于输入，与各窗口完成的先后顺序无关
+    - 说话人标记按重叠区多数投票与前一窗口保持一致
+    - 优化失败的窗口使用原始条目，不会丢失内容
+
+    Args:
+        entries: 原始条目
+        windows: split_into_windows 的结果
+        window_results: 每个窗口的优化条目，失败为 None
+
+    Returns:
+        List[Dict]: 拼接后的条目
+    """
+    stitched = []
+    previous_cues = []
+    last_seen = {}  # 全局说话人标记 -> 最近一次出现的窗口序号和位置
+    for k, ((start, end), cues) in enumerate(zip(windows, window_results)):
+        if cues is None:
+            cues = [dict(entry, start_ms=parse_srt_time(entry['start_time']) or 0,
+                         end_ms=parse_srt_time(entry['end_time']) or 0) for entry in entries[start:end]]
+        
+        lower = None
+        if k > 0:
+            prev_start, prev_end = windows[k - 1]
+            overlap_times = [parse_srt_time(entry['start_time']) or 0 for entry in entries[start:prev_end]]
+            known_labels = sorted(last_seen, key=lambda label: last_seen[label], reverse=True)
+            _remap_speakers(previous_cues, cues, overlap_times, known_labels)
+            lower, crossed = _seam_cut_ms(entries, start, prev_end, previous_cues, cues)
+            # 前一个窗口中开始时间不早于接缝的条目归本窗口
+            while stitched and stitched[-1]['start_ms'] >= lower:
+                stitched.pop()
+            if crossed and stitched:
+                # 前一窗口保留跨过接缝的条目，本窗口跳过与它重叠的条目
+                lower = max(lower, stitched[-1]['end_ms'])
+        
+        stitched.extend(cue for cue in cues if lower is None or cue['start_ms'] >= lower)
+        for position, cue in enumerate(cues):
+            if cue['speaker']:
+                last_seen[cue['speaker']] = (k, position)
+        previous_cues = cues
+    return stitched
+
+
+def _optimize_entries(client, entries, max_retries=2, concurrency=None):
+    """
+    分窗口并发优化一组字幕条目并拼接
+
+    Returns:
+        List[Dict]: 优化后的条目，所有窗口都失败时返回 None
+    """
+    windows = split_into_windows(entries)
+    concurrency = concurrency or LLM_OPTIMIZE_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(windows))),
+                            thread_name_prefix='llm-window') as executor:
+        window_results = list(executor.map(
+            lambda window: _optimize_window(client, entries[window[0]:window[1]], max_retries),
+            windows
+        ))
+    
+    if all(result is None for result in window_results):
+        return None
+    
+    failed = sum(1 for result in window_results if result is None)
+    if failed:
+        print(f"LLM optimization failed for {failed}/{len(windows)} windows, keeping original entries there")
+    return stitch_windows(entries, windows, window_results)
+
+
+def optimize_subtitles_with_llm(srt_content, max_retries=2):
+    """
+    使用LLM优化字幕，将碎片化的短句合并为完整的语义单元
+    
+    条目较多时切分为相互重叠的窗口（LLM_WINDOW_SIZE / LLM_WINDOW_OVERLAP），
+    在有界线程池中并发优化后拼接，耗时取决于窗口大小而不是音轨长度，
+    也不会因为输出超过 max_tokens 而丢失字幕末尾。
+    
+    Args:
+        srt_content: 原始SRT字幕内容
+        max_retries: 每个窗口的最大重试次数
+        
+    Returns:
+        str: 优化后的SRT字幕内容
+    """
+    if not srt_content or not srt_content.strip():
+        return srt_content
+    
+    try:
+        # 解析原始字幕
+        entries = parse_srt_to_entries(srt_content)
+        if len(entries) < 2:  # 如果字幕条目太少，不需要优化
+            return srt_content
+        
+        print(f"Original subtitle entries: {len(entries)}")
+        
         # 获取LLM配置并调用
         provider = get_provider_config('aliyun')
         client = provider.get_llm()
         
-        for attempt in range(max_retries + 1):
-            try:
-                response = client.chat.completions.create(
-                    model=AliyunModel.QWEN_PLUS_LATEST.value,  # 使用较便宜的模型
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的英语字幕优化专家，擅长将碎片化的字幕合并为完整句子。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1,  # 低温度确保一致性
-                    max_tokens=2000
-                )
-                
-                llm_response = response.choices[0].message.content
-                print(f"LLM response received (attempt {attempt + 1})")
-                
-                # 解析LLM的响应
-                optimized_entries = parse_llm_response(llm_response)
-                if optimized_entries:
-                    optimized_srt = entries_to_srt(optimized_entries)
-                    print(f"Optimized subtitle entries: {len(optimized_entries)}")
-                    return optimized_srt
-                else:
-                    print(f"Failed to parse LLM response on attempt {attempt + 1}")
-                    if attempt < max_retries:
-                        time.sleep(1)  # 等待1秒后重试
-                    continue
-                    
-            except Exception as e:
-                print(f"LLM call failed on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries:
-                    time.sleep(2)  # 等待2秒后重试
-                    continue
-                else:
-                    break
+        optimized_entries = _optimize_entries(client, entries, max_retries)
+        if optimized_entries is None:
+            print("LLM optimization failed, returning original subtitles")
+            return srt_content
         
-        print("LLM optimization failed, returning original subtitles")
-        return srt_content
+        print(f"Optimized subtitle entries: {len(optimized_entries)}")
+        return entries_to_srt(optimized_entries)
         
     except Exception as e:
         print(f"Error in optimize_subtitles_with_llm: {str(e)}")
         return srt_content
 
+# 增量重新优化：变化条目前后各带的上下文条目数；变化的条目超过该比例时整体重新优化
+LLM_INCREMENTAL_CONTEXT = int(os.getenv('LLM_INCREMENTAL_CONTEXT', '3'))
+LLM_INCREMENTAL_MAX_RATIO = float(os.getenv('LLM_INCREMENTAL_MAX_RATIO', '0.5'))
+
+# 优化字幕的来源快照：生成 xxx.optimized.srt 时使用的原始字幕
+OPTIMIZATION_SOURCE_SUFFIX = '.optimized.src.srt'
+
+
+def optimization_source_path(optimized_path):
+    """优化字幕对应的来源快照路径：xxx.optimized.srt -> xxx.optimized.src.srt"""
+    if optimized_path.endswith('.optimized.srt'):
+        return optimized_path[:-len('.optimized.srt')] + OPTIMIZATION_SOURCE_SUFFIX
+    return os.path.splitext(optimized_path)[0] + OPTIMIZATION_SOURCE_SUFFIX
+
+
+def load_previous_optimization(optimized_path):
+    """
+    读取已有的优化字幕和它的来源快照
+
+    Returns:
+        Tuple[str, str]: (来源快照, 优化字幕)，任一不存在时返回 (None, None)
+    """
+    try:
+        with open(optimization_source_path(optimized_path), 'r', encoding='utf-8') as f:
+            source = f.read()
+        with open(optimized_path, 'r', encoding='utf-8') as f:
+            optimized = f.read()
+    except FileNotFoundError:
+        return None, None
+    return source, optimized
+
+
+def is_optimization_stale(srt_path, optimized_path):
+    """
+    优化字幕是否落后于原始字幕（原始字幕重新生成过）
+
+    没有来源快照的优化字幕（旧版本生成）视为最新。
+    """
+    source, _ = load_previous_optimization(optimized_path)
+    if source is None:
+        return False
+    try:
+        with open(srt_path, 'r', encoding='utf-8') as f:
+            return f.read() != source
+    except FileNotFoundError:
+        return False
+
+
+def save_optimized_subtitle(optimized_path, optimized_srt, source_srt):
+    """
+    保存优化字幕和来源快照
+
+    先写优化字幕再写快照：中途中断时快照仍是旧的，下次只会多重新优化一些条目，
+    不会把过期的优化字幕误认为最新。
+    """
+    write_subtitle(optimized_path, optimized_srt)
+    write_atomic(optimization_source_path(optimized_path), source_srt)
+
+
+def _changed_spans(old_entries, new_entries, context):
+    """
+    对比新旧原始字幕条目，返回新条目中变化的区间（前后各带 context 个上下文条目）
+
+    只删除了条目时新条目中没有对应的区间；此时至少带上前后各一个条目，
+    否则替换范围为空，被删除条目对应的旧优化条目会原样保留。
+
+    Returns:
+        List[List[int]]: 新条目下标区间 [start, end)，可能相互重叠
+    """
+    def key(entry):
+        return entry['start_ms'], entry['end_ms'], entry['text'], entry['speaker']
+    
+    matcher = difflib.SequenceMatcher(None, [key(e) for e in old_entries], [key(e) for e in new_entries],
+                                      autojunk=False)
+    spans = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        padding = context if j1 < j2 else max(context, 1)
+        spans.append([max(0, j1 - padding), min(len(new_entries), j2 + padding)])
+    return spans
+
+
+def _snap_spans(spans, new_entries, optimized_cues):
+    """
+    合并重叠的区间，并扩大区间使其边界不切断已有的优化条目
+
+    一条优化条目通常由多个原始条目合并而成；区间边界落在它中间时，
+    重新优化的结果会和保留的这条优化条目重复或缺失内容。
+
+    Returns:
+        List[List[int]]: 按开始下标排序、互不重叠的区间
+    """
+    starts = [entry['start_ms'] for entry in new_entries]
+    count = len(new_entries)
+    while True:
+        merged = []
+        for start, end in sorted(spans):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        
+        changed = False
+        for span in merged:
+            start, end = span
+            lower = starts[start] if start > 0 else None
+            upper = starts[end] if end < count else None
+            for cue in optimized_cues:
+                if lower is not None and cue['start_ms'] < lower < cue['end_ms']:
+                    while start > 0 and starts[start] > cue['start_ms']:
+                        start -= 1
+                if upper is not None and cue['start_ms'] < upper < cue['end_ms']:
+                    while end < count and starts[end] < cue['end_ms']:
+                        end += 1
+            if [start, end] != span:
+                span[:] = [start, end]
+                changed = True
+        spans = merged
+        if not changed:
+            return spans
+
+
+def optimize_subtitles_incremental(srt_content, previous_source, previous_optimized, max_retries=2):
+    """
+    原始字幕重新生成后增量地重新优化
+
+    对比新的原始字幕和上次优化时的原始字幕（来源快照），只把变化的条目
+    （前后各带 LLM_INCREMENTAL_CONTEXT 个上下文条目）交给 LLM，结果拼回上次的优化字幕；
+    说话人标记按上下文与已有的优化字幕对齐。没有变化时直接返回上次的优化字幕，
+    变化超过 LLM_INCREMENTAL_MAX_RATIO 时整体重新优化。
+    
+    Args:
+        srt_content: 新的原始SRT字幕内容
+        previous_source: 上次优化时使用的原始字幕
+        previous_optimized: 上次的优化结果
+        max_retries: 每个窗口的最大重试次数
+        
+    Returns:
+        str: 优化后的SRT字幕内容
+    """
+    if not previous_source or not previous_optimized:
+        return optimize_subtitles_with_llm(srt_content, max_retries)
+    
+    try:
+        new_entries = parse_srt_to_entries(srt_content)
+        optimized = parse_srt_to_entries(previous_optimized)
+        if len(new_entries) < 2 or not optimized:
+            return optimize_subtitles_with_llm(srt_content, max_retries)
+        
+        spans = _changed_spans(parse_srt_to_entries(previous_source), new_entries, LLM_INCREMENTAL_CONTEXT)
+        if not spans:
+            print("Subtitle unchanged since last optimization")
+            return previous_optimized
+        
+        spans = _snap_spans(spans, new_entries, optimized)
+        changed = sum(end - start for start, end in spans)
+        if changed > len(new_entries) * LLM_INCREMENTAL_MAX_RATIO:
+            print(f"{changed}/{len(new_entries)} entries changed, re-optimizing the whole subtitle")
+            return optimize_subtitles_with_llm(srt_content, max_retries)
+        print(f"Re-optimizing {changed}/{len(new_entries)} entries in {len(spans)} spans")
+        
+        provider = get_provider_config('aliyun')
+        client = provider.get_llm()
+        
+        # 所有区间的窗口放进同一个线程池
+        span_entries = [new_entries[start:end] for start, end in spans]
+        span_windows = [split_into_windows(entries) for entries in span_entries]
+        tasks = [(k, window) for k, windows in enumerate(span_windows) for window in windows]
+        with ThreadPoolExecutor(max_workers=max(1, min(LLM_OPTIMIZE_CONCURRENCY, len(tasks))),
+                                thread_name_prefix='llm-window') as executor:
+            results = iter(list(executor.map(
+                lambda task: _optimize_window(client, span_entries[task[0]][task[1][0]:task[1][1]], max_retries),
+                tasks
+            )))
+        
+        starts = [entry['start_ms'] for entry in new_entries]
+        replaced = []
+        spliced = []
+        for k, (start, end) in enumerate(spans):
+            window_results = [next(results) for _ in span_windows[k]]
+            # 优化失败的窗口保留原始条目
+            cues = stitch_windows(span_entries[k], span_windows[k], window_results)
+            
+            lower = starts[start] if start > 0 else float('-inf')
+            # 已有标记：区间之前出现过的按最近出现排序，其后是区间之后按出现顺序
+            last_seen = {cue['speaker']: position for position, cue in enumerate(optimized)
+                         if cue['speaker'] and cue['start_ms'] < lower}
+            known_labels = sorted(last_seen, key=last_seen.get, reverse=True)
+            for cue in optimized:
+                if cue['speaker'] and cue['speaker'] not in known_labels:
+                    known_labels.append(cue['speaker'])
+            _remap_speakers(optimized, cues, starts[start:end], known_labels)
+            
+            replaced.append((lower, starts[end] if end < len(new_entries) else float('inf')))
+            spliced.extend(cues)
+        
+        kept = [cue for cue in optimized
+                if not any(lower <= cue['start_ms'] < upper for lower, upper in replaced)]
+        return entries_to_srt(kept + spliced)
+        
+    except Exception as e:
+        print(f"Error in optimize_subtitles_incremental: {str(e)}")
+        return optimize_subtitles_with_llm(srt_content, max_retries)
+
+
 def parse_llm_response(llm_response):
     """
     解析LLM返回的字幕优化结果（支持说话人标记）
@@ -376,29 +1077,70 @@ def parse_llm_response(llm_response):
     
     return entries
 
-def generate_subtitle_for_mp3(audio_url, output_path=None, language="en", enable_llm_optimization=True):
+def transcribe_audio(audio_url=None, audio_path=None, language="en", duration_ms=None, sample_rate=None,
+                     asr_input=None):
+    """
+    识别音频：ASR_INPUT=local 且格式支持时上传本地文件，失败时退回公开 URL；否则直接使用公开 URL
+
+    Args:
+        audio_url: 音频公开 URL，None 表示不使用 URL
+        audio_path: 本地音频文件路径
+        language: 语言代码
+        duration_ms: 音频时长（毫秒），用于计算 URL 识别任务的等待时间
+        sample_rate: 音频采样率，本地识别时提交
+        asr_input: 输入方式（'local' / 'url'），默认读取 ASR_INPUT
+
+    Returns:
+        Tuple[CueStore, str]: 字幕条目和实际使用的识别服务（'dashscope' / 'volcano'）
+
+    Raises:
+        Exception: 识别失败，或两种输入都不可用
+    """
+    if audio_path and uses_local_asr(audio_path, asr_input):
+        try:
+            return transcribe_file_with_dashscope(audio_path, sample_rate=sample_rate,
+                                                  language_hints=(language,)), 'dashscope'
+        except Exception as e:
+            if not (audio_url and ASR_URL_FALLBACK):
+                raise
+            print(f"Local ASR failed for {audio_path}, falling back to public URL: {str(e)}")
+    elif audio_path and (asr_input or ASR_INPUT) == 'local' and not (audio_url and ASR_URL_FALLBACK):
+        # 格式不支持本地识别，不必先发起一次注定失败的调用
+        raise ValueError(f"Unsupported audio format for local recognition: {audio_path}")
+    if not audio_url:
+        raise ValueError("No audio URL for ASR")
+    provider = VolcanoAudioProvider()
+    subtitles_data = provider.get_subtitles(audio_url, language, timeout=poll_timeout_for(duration_ms))
+    return provider.to_cue_store(subtitles_data), ASR_PROVIDER
+
+
+def generate_subtitle_for_mp3(audio_url, output_path=None, language="en", enable_llm_optimization=True,
+                              duration_ms=None, audio_path=None, sample_rate=None, transcription=None):
     """
     为MP3文件生成SRT字幕并保存到指定路径
     
     Args:
-        audio_url: 音频文件URL
+        audio_url: 音频文件URL（本地识别失败时的备选，可以为 None）
         output_path: 字幕文件保存路径，如果为None则仅返回字幕内容而不保存
         language: 语言代码，默认为英语
         enable_llm_optimization: 是否启用LLM优化，默认True
+        duration_ms: 音频时长（毫秒），已知时按时长放宽识别任务的等待时间
+        audio_path: 本地音频文件路径，提供时直接上传文件识别
+        sample_rate: 音频采样率
+        transcription: 提供时写入实际使用的识别服务 {'asr': ...}，用于计算字幕存储键
         
     Returns:
         生成的SRT字幕内容
     """
-    provider = VolcanoAudioProvider()
-    
     try:
         # 获取字幕数据
-        subtitles_data = provider.get_subtitles(audio_url, language)
-        
-        print(subtitles_data)
+        cues, asr = transcribe_audio(audio_url, audio_path, language, duration_ms, sample_rate)
+        if transcription is not None:
+            transcription['asr'] = asr
         
         # 转换为SRT格式
-        srt_content = provider.convert_to_srt(subtitles_data)
+        srt_content = cues.to_srt() if len(cues) else "1\n00:00:00,000 --> 00:00:10,000\n[未能识别有效内容]"
+        words = sorted(word for cue_words in cues.words if cue_words for word in cue_words)
         
         # 如果启用LLM优化，则进行字幕优化
         if enable_llm_optimization and srt_content and language == "en":
@@ -415,9 +1157,8 @@ def generate_subtitle_for_mp3(audio_url, output_path=None, language="en", enable
             # 确保目录存在
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # 写入SRT文件
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(srt_content)
+            # 写入SRT文件和 WebVTT / JSON（字幕可能是存储的硬链接，必须整体替换）
+            write_subtitle(output_path, srt_content, words=words)
             
             print(f"SRT subtitle saved to: {output_path}")
         
@@ -427,7 +1168,8 @@ def generate_subtitle_for_mp3(audio_url, output_path=None, language="en", enable
         print(f"Error generating subtitle: {str(e)}")
         return None
 
-def get_or_generate_subtitle(audio_url, book_name, disc_no, track_name, base_dir="app/static/subtitles", enable_llm_optimization=True):
+def get_or_generate_subtitle(audio_url, book_name, disc_no, track_name, base_dir="app/static/subtitles", enable_llm_optimization=True,
+                             duration_ms=None, audio_path=None, sample_rate=None, transcription=None):
     """
     获取或生成字幕，如果字幕文件不存在则生成新的
     
@@ -437,6 +1179,10 @@ def get_or_generate_subtitle(audio_url, book_name, disc_no, track_name, base_dir
         disc_no: 光盘编号
         track_name: 音轨名称
         base_dir: 字幕文件基础目录
+        duration_ms: 音频时长（毫秒），用于计算识别任务的等待时间
+        audio_path: 本地音频文件路径，提供时直接上传文件识别，audio_url 作为备选
+        sample_rate: 音频采样率
+        transcription: 提供时写入实际使用的识别服务
         
     Returns:
         字幕文件路径
@@ -454,8 +1200,10 @@ def get_or_generate_subtitle(audio_url, book_name, disc_no, track_name, base_dir
             return f.read()
     
     # 生成新的字幕
-    print(f"Generating subtitle for: {audio_url}")
-    srt_content = generate_subtitle_for_mp3(audio_url, subtitle_path, enable_llm_optimization=enable_llm_optimization)
+    print(f"Generating subtitle for: {audio_path or audio_url}")
+    srt_content = generate_subtitle_for_mp3(audio_url, subtitle_path, enable_llm_optimization=enable_llm_optimization,
+                                            duration_ms=duration_ms, audio_path=audio_path, sample_rate=sample_rate,
+                                            transcription=transcription)
     
     return srt_content
 
@@ -0,0 +1,122 @@
+"""
+媒体文件发送
+为 /audio 和 /subtitles 提供 Range（206）、强 ETag、条件请求和缓存头支持，
+生产环境可以把实际的文件传输交给前置的 nginx
+"""
+import mimetypes
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file as werkzeug_send_file
+
+# 音频文件基本不会原地修改，允许浏览器长时间缓存；过期后通过 ETag 重新验证
+AUDIO_MAX_AGE = int(os.getenv('AUDIO_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+# 字幕可能被重新生成/优化，每次都向服务器验证（命中时返回 304，没有响应体）
+SUBTITLE_MAX_AGE = int(os.getenv('SUBTITLE_CACHE_MAX_AGE', '0'))
+
+# 文件发送方式:
+#   direct     - 由 Flask/gunicorn worker 直接发送（默认，适合开发环境）
+#   x-accel    - 返回 X-Accel-Redirect，由 nginx 的 internal location 发送文件
+#   x-sendfile - 返回 X-Sendfile，适用于 Apache mod_xsendfile / lighttpd
+MEDIA_DELIVERY_MODE = os.getenv('MEDIA_DELIVERY_MODE', 'direct').lower()
+# nginx internal location 的前缀，指向 app/static 目录，例如:
+#   location /_protected/ { internal; alias /var/www/read-ai/current/app/static/; }
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/_protected').rstrip('/')
+DELIVERY_MODES = ('direct', 'x-accel', 'x-sendfile')
+
+if MEDIA_DELIVERY_MODE not in DELIVERY_MODES:
+    raise ValueError(f"不支持的 MEDIA_DELIVERY_MODE: {MEDIA_DELIVERY_MODE}，可选值: {', '.join(DELIVERY_MODES)}")
+
+
+def resolve_media_path(root: str, filename: str) -> Optional[str]:
+    """
+    将 URL 中的相对路径解析为 root 下的文件路径
+
+    Args:
+        root: 媒体根目录
+        filename: URL 中的相对路径
+
+    Returns:
+        文件的绝对路径；路径越界（如包含 ..）或文件不存在时返回 None
+    """
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """
+    基于文件大小和 mtime 生成强 ETag，不需要读取文件内容
+
+    Args:
+        stat_result: os.stat 的结果
+
+    Returns:
+        str: ETag 值（不含引号）
+    """
+    return f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+
+def send_media(root: str, path: str, max_age: int = 0, mode: str = None):
+    """
+    发送媒体文件
+
+    - Range 请求返回 206 Partial Content，拖动进度条时只传输需要的字节
+    - If-None-Match / If-Modified-Since 命中时返回 304
+    - 不带 Range 的完整请求使用 WSGI file_wrapper，gunicorn 下走 sendfile 零拷贝
+    - x-accel / x-sendfile 模式下 worker 只负责校验路径，文件由前置服务器发送
+
+    Args:
+        root: 媒体根目录（AUDIO_ROOT / SUBTITLE_ROOT）
+        path: resolve_media_path 返回的文件路径
+        max_age: Cache-Control max-age（秒），0 表示每次都需要重新验证
+        mode: 发送方式，默认使用 MEDIA_DELIVERY_MODE
+
+    Returns:
+        Flask Response
+    """
+    mode = mode or MEDIA_DELIVERY_MODE
+    if mode == 'x-accel':
+        return _accel_redirect(root, path, max_age)
+
+    stat_result = os.stat(path)
+    if mode == 'x-sendfile':
+        return werkzeug_send_file(
+            path,
+            request.environ,
+            use_x_sendfile=True,
+            conditional=True,
+            etag=file_etag(stat_result),
+            last_modified=stat_result.st_mtime,
+            max_age=max_age
+        )
+
+    return send_file(
+        path,
+        conditional=True,
+        etag=file_etag(stat_result),
+        last_modified=stat_result.st_mtime,
+        max_age=max_age
+    )
+
+
+def _accel_redirect(root: str, path: str, max_age: int):
+    """
+    返回 X-Accel-Redirect 响应，nginx 会在 internal location 中发送文件，
+    Range、ETag 和条件请求都由 nginx 处理；Content-Type 和 Cache-Control 会被 nginx 保留
+    """
+    relative_path = os.path.relpath(path, root).replace(os.sep, '/')
+    internal_uri = f"{MEDIA_ACCEL_PREFIX}/{quote(os.path.basename(root))}/{quote(relative_path)}"
+
+    response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = internal_uri
+    if max_age > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
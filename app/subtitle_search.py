@@ -0,0 +1,265 @@
+"""
+字幕全文检索
+SQLite FTS5 索引音频库中所有字幕条目，字幕流水线写入字幕时增量更新，
+按 bm25 相关度返回 教材/光盘/音轨 和条目时间，老师可以直接找到某句话出现在哪个音轨。
+每个音轨只索引一份字幕：有优化字幕时用优化字幕（句子完整），否则用原始字幕。
+
+用法:
+    python -m app.subtitle_search reindex
+    python -m app.subtitle_search search "turn left"
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+
+from app.db import get_connection, transaction
+from app.llm.cue_store import CueStore
+
+SCHEMA = ('subtitle_search', """
+CREATE TABLE IF NOT EXISTS subtitle_search_tracks (
+    id INTEGER PRIMARY KEY,
+    book TEXT NOT NULL,
+    disc TEXT NOT NULL,
+    track TEXT NOT NULL,
+    source TEXT NOT NULL,
+    optimized INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    UNIQUE (book, disc, track)
+);
+CREATE TABLE IF NOT EXISTS subtitle_search_cues (
+    id INTEGER PRIMARY KEY,
+    track_id INTEGER NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    speaker TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subtitle_search_cues_track ON subtitle_search_cues (track_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS subtitle_search_fts USING fts5(
+    text, content='subtitle_search_cues', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS subtitle_search_cues_ai AFTER INSERT ON subtitle_search_cues BEGIN
+    INSERT INTO subtitle_search_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS subtitle_search_cues_ad AFTER DELETE ON subtitle_search_cues BEGIN
+    INSERT INTO subtitle_search_fts (subtitle_search_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+""")
+
+MAX_LIMIT = 100
+
+
+def _fts_phrase(text: str) -> str:
+    """整句作为 FTS5 短语（转义双引号）"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class SubtitleSearchIndex:
+    """字幕全文索引，字幕路径均为相对字幕根目录的 book/disc/xxx.srt"""
+
+    def __init__(self, subtitle_root: str, db_path: str = None):
+        """
+        Args:
+            subtitle_root: 字幕根目录
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+        """
+        self.subtitle_root = subtitle_root
+        self.db_path = db_path
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    def _parse_path(self, srt_path: str) -> Optional[Dict]:
+        """拆分字幕路径，不在字幕根目录下或不是 book/disc/xxx.srt 时返回 None"""
+        relative_path = os.path.relpath(os.path.abspath(srt_path), os.path.abspath(self.subtitle_root))
+        parts = relative_path.replace(os.sep, '/').split('/')
+        if len(parts) != 3 or parts[0] == '..' or not parts[2].endswith('.srt'):
+            return None
+        name = parts[2][:-len('.srt')]
+        if name.endswith('.optimized.src'):
+            return None
+        optimized = name.endswith('.optimized')
+        return {
+            'book': parts[0],
+            'disc': parts[1],
+            'track': name[:-len('.optimized')] if optimized else name,
+            'source': '/'.join(parts),
+            'optimized': optimized,
+        }
+
+    # ------------------------------------------------------------------ 更新
+
+    def index_file(self, srt_path: str, cues: CueStore = None) -> bool:
+        """
+        索引一个字幕文件；音轨已经索引了优化字幕时忽略原始字幕
+
+        Args:
+            srt_path: 字幕文件路径
+            cues: 已解析的条目，默认读取文件
+
+        Returns:
+            bool: 是否更新了索引
+        """
+        info = self._parse_path(srt_path)
+        if info is None:
+            return False
+        if not info['optimized'] and os.path.exists(srt_path[:-len('.srt')] + '.optimized.srt'):
+            return False
+        try:
+            stat_result = os.stat(srt_path)
+        except FileNotFoundError:
+            return False
+        if cues is None:
+            with open(srt_path, 'r', encoding='utf-8-sig', newline='') as f:
+                cues = CueStore.from_srt(f)
+
+        conn = self._conn()
+        with transaction(conn):
+            self._delete_track(conn, info['book'], info['disc'], info['track'])
+            cursor = conn.execute(
+                'INSERT INTO subtitle_search_tracks (book, disc, track, source, optimized, size, mtime_ns) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (info['book'], info['disc'], info['track'], info['source'], int(info['optimized']),
+                 stat_result.st_size, stat_result.st_mtime_ns)
+            )
+            conn.executemany(
+                'INSERT INTO subtitle_search_cues (track_id, start_ms, end_ms, speaker, text) VALUES (?, ?, ?, ?, ?)',
+                [(cursor.lastrowid, cue.start_ms, cue.end_ms, cue.speaker, cue.text) for cue in cues]
+            )
+        return True
+
+    def _delete_track(self, conn, book: str, disc: str, track: str):
+        row = conn.execute(
+            'SELECT id FROM subtitle_search_tracks WHERE book = ? AND disc = ? AND track = ?', (book, disc, track)
+        ).fetchone()
+        if row is not None:
+            conn.execute('DELETE FROM subtitle_search_cues WHERE track_id = ?', (row['id'],))
+            conn.execute('DELETE FROM subtitle_search_tracks WHERE id = ?', (row['id'],))
+
+    def sync(self) -> Dict:
+        """
+        与字幕目录完全同步：索引新增或修改过的字幕（例如 rsync 同步进来的），删除已不存在的音轨
+
+        Returns:
+            Dict: indexed（重新索引的音轨数）、removed（删除的音轨数）
+        """
+        # 每个音轨选一份字幕：优化字幕优先
+        sources = {}
+        for dirpath, _, filenames in os.walk(self.subtitle_root):
+            for filename in filenames:
+                info = self._parse_path(os.path.join(dirpath, filename))
+                if info is None:
+                    continue
+                key = (info['book'], info['disc'], info['track'])
+                if info['optimized'] or key not in sources:
+                    sources[key] = info
+
+        conn = self._conn()
+        indexed = {
+            (row['book'], row['disc'], row['track']): row
+            for row in conn.execute('SELECT book, disc, track, source, size, mtime_ns FROM subtitle_search_tracks')
+        }
+
+        updated = 0
+        for key, info in sources.items():
+            path = os.path.join(self.subtitle_root, info['source'])
+            stat_result = os.stat(path)
+            row = indexed.get(key)
+            if (row is not None and row['source'] == info['source'] and row['size'] == stat_result.st_size
+                    and row['mtime_ns'] == stat_result.st_mtime_ns):
+                continue
+            if self.index_file(path):
+                updated += 1
+
+        removed = [key for key in indexed if key not in sources]
+        if removed:
+            with transaction(conn):
+                for key in removed:
+                    self._delete_track(conn, *key)
+        return {'indexed': updated, 'removed': len(removed)}
+
+    # ------------------------------------------------------------------ 查询
+
+    def search(self, query: str, book: str = None, limit: int = 20) -> List[Dict]:
+        """
+        按相关度（bm25）检索字幕条目
+
+        先按整句短语匹配；没有结果且包含多个词时，退回到所有词都出现（不要求相邻）。
+
+        Args:
+            query: 检索的句子或词
+            book: 只检索指定教材
+            limit: 最多返回的条目数（不超过 MAX_LIMIT）
+
+        Returns:
+            List[Dict]: book、disc、track、subtitle（字幕相对路径）、optimized、
+            start_ms、end_ms、speaker、text、score（越小越相关）
+        """
+        query = ' '.join((query or '').split())
+        if not query:
+            return []
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        results = self._match(_fts_phrase(query), book, limit)
+        words = query.split(' ')
+        if not results and len(words) > 1:
+            results = self._match(' '.join(_fts_phrase(word) for word in words), book, limit)
+        return results
+
+    def _match(self, expression: str, book: Optional[str], limit: int) -> List[Dict]:
+        sql = ('SELECT t.book, t.disc, t.track, t.source, t.optimized, c.start_ms, c.end_ms, c.speaker, c.text, '
+               'bm25(subtitle_search_fts) AS score '
+               'FROM subtitle_search_fts '
+               'JOIN subtitle_search_cues c ON c.id = subtitle_search_fts.rowid '
+               'JOIN subtitle_search_tracks t ON t.id = c.track_id '
+               'WHERE subtitle_search_fts MATCH ?')
+        params = [expression]
+        if book:
+            sql += ' AND t.book = ?'
+            params.append(book)
+        sql += ' ORDER BY score, t.book, t.disc, t.track, c.start_ms LIMIT ?'
+        params.append(limit)
+        return [{
+            'book': row['book'],
+            'disc': row['disc'],
+            'track': row['track'],
+            'subtitle': row['source'],
+            'optimized': bool(row['optimized']),
+            'start_ms': row['start_ms'],
+            'end_ms': row['end_ms'],
+            'speaker': row['speaker'],
+            'text': row['text'],
+            'score': round(row['score'], 4),
+        } for row in self._conn().execute(sql, params)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="字幕全文检索索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("reindex", help="与字幕目录同步索引")
+    search_parser = subparsers.add_parser("search", help="检索字幕")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--book")
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    from app import subtitle_index
+
+    if args.command == "reindex":
+        started = time.time()
+        result = subtitle_index.sync()
+        print(f"Indexed: {result['indexed']}  removed: {result['removed']}  "
+              f"elapsed: {time.time() - started:.1f}s")
+        return 0
+
+    for hit in subtitle_index.search(args.query, book=args.book, limit=args.limit):
+        seconds = hit['start_ms'] / 1000
+        print(f"{hit['book']}/{hit['disc']}/{hit['track']}  {int(seconds // 60):02d}:{seconds % 60:06.3f}  "
+              f"{'[' + hit['speaker'] + '] ' if hit['speaker'] else ''}{hit['text']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
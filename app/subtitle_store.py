@@ -0,0 +1,522 @@
+"""
+字幕内容寻址存储
+字幕按 (音频内容 sha256, ASR 服务及参数, 优化器版本) 的哈希保存一份，
+book/disc 下的字幕文件只是指向存储的硬链接：重命名音频或把同一张光盘上传到另一本教材时
+直接复用已有字幕，不再重新调用付费的 ASR 和 LLM。支持引用计数报告和淘汰。
+
+写入 SRT 时同时生成同名的 WebVTT（.vtt）和紧凑 JSON（.json，整数毫秒、说话人、词级时间），
+播放器直接使用 JSON，不需要在浏览器里解析 SRT。
+
+用法:
+    python -m app.subtitle_store report
+    python -m app.subtitle_store evict --max-mb 500 --unused-days 90
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.db import DATA_ROOT, get_connection, transaction
+from app.llm.cue_store import CueStore
+
+STORE_ROOT = os.getenv('SUBTITLE_STORE_DIR', os.path.join(DATA_ROOT, 'subtitle_store'))
+
+# 字幕类型 -> 文件后缀
+KINDS = {
+    'srt': '.srt',
+    'optimized': '.optimized.srt',
+}
+
+SCHEMA = ('subtitle_store', """
+CREATE TABLE IF NOT EXISTS subtitle_artifacts (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    audio_sha256 TEXT NOT NULL,
+    params TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subtitle_refs (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subtitle_refs_key ON subtitle_refs (key);
+""")
+
+
+def write_atomic(path: str, content: str):
+    """
+    先写临时文件再重命名
+
+    中断时不会留下半截字幕；字幕文件可能是内容寻址存储的硬链接，
+    必须整体替换而不能原地改写，否则会连带修改存储中的内容。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def copy_atomic(source: str, dest: str):
+    """复制到临时文件再原子替换 dest"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def link_or_copy(source: str, dest: str):
+    """用硬链接原子替换 dest，不支持硬链接（跨文件系统）时退回复制"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.link"
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def file_sha256(path: str) -> Optional[str]:
+    """计算文件内容的 sha256，文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+# 字幕格式：后缀和 MIME 类型；vtt 和 json 由同名的 SRT 派生
+SUBTITLE_FORMATS = {
+    'srt': ('.srt', 'application/x-subrip'),
+    'vtt': ('.vtt', 'text/vtt'),
+    'json': ('.json', 'application/json'),
+}
+
+
+def format_path(srt_path: str, fmt: str) -> str:
+    """SRT 对应的派生格式文件路径，例如 01.optimized.srt -> 01.optimized.json"""
+    return os.path.splitext(srt_path)[0] + SUBTITLE_FORMATS[fmt][0]
+
+
+def _read_words(json_path: str) -> List[Tuple[int, int, str]]:
+    """读取 JSON 字幕中的词级时间，文件不存在或格式不正确时返回空列表"""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            cues = CueStore.from_json(f.read())
+    except (FileNotFoundError, ValueError, IndexError, TypeError):
+        return []
+    return [word for words in cues.words if words for word in words]
+
+
+# 字幕写入后的回调，例如更新全文检索索引；参数为 (srt_path, cues)
+_write_hooks: List[Callable[[str, CueStore], None]] = []
+
+
+def add_write_hook(hook: Callable[[str, CueStore], None]):
+    """注册字幕写入回调，每次写入或复用 SRT 后调用"""
+    _write_hooks.append(hook)
+
+
+def notify_subtitle_written(srt_path: str, cues: CueStore = None):
+    """
+    通知回调 SRT 已写入；回调出错只打印，不影响字幕写入
+
+    Args:
+        srt_path: SRT 文件路径
+        cues: 已解析的条目，回调可以直接使用，不必重新读取文件
+    """
+    for hook in _write_hooks:
+        try:
+            hook(srt_path, cues)
+        except Exception as e:
+            print(f"Subtitle write hook failed for {srt_path}: {e}")
+
+
+def known_words(srt_path: str, cues: CueStore) -> List[Tuple[int, int, str]]:
+    """
+    已知的词级时间：先取字幕自身的 JSON，优化字幕没有时取原始字幕的 JSON
+    （LLM 合并条目后按时间重新分配）
+
+    只保留仍与新条目文本一致的词：按时间分配给条目后，条目文本必须包含该条目的每个词，
+    否则该条目不带词级时间（字幕内容变了，旧的词级时间不再可信）
+
+    Args:
+        srt_path: SRT 文件路径
+        cues: 即将写入的条目
+
+    Returns:
+        List[Tuple[int, int, str]]: 可以沿用的词级时间
+    """
+    words = _read_words(format_path(srt_path, 'json'))
+    if not words and srt_path.endswith('.optimized.srt'):
+        words = _read_words(srt_path[:-len('.optimized.srt')] + '.json')
+    if not words:
+        return []
+    matched = cues.slice(0, len(cues))
+    matched.assign_words(words)
+    return [word for text, cue_words in zip(matched.texts, matched.words) if cue_words
+            and all(_normalize_word(word[2]) in text.lower() for word in cue_words)
+            for word in cue_words]
+
+
+# 词级时间两端可能带的标点
+_PUNCTUATION = '.,!?;:"\'()[]-…，。！？；：、“”‘’（）'
+
+
+def _normalize_word(word: str) -> str:
+    """去掉词两端的空白和标点，用于和条目文本比较"""
+    return word.strip().strip(_PUNCTUATION).lower()
+
+
+def _load_srt(srt_path: str) -> CueStore:
+    """读取 SRT 文件为新的 CueStore（不会修改 load_cue_store 的缓存）"""
+    with open(srt_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return CueStore.from_srt(f)
+
+
+def write_sidecars(srt_path: str, cues: CueStore = None, words: Iterable = None):
+    """
+    由 SRT 生成同名的 .vtt 和 .json
+
+    Args:
+        srt_path: SRT 文件路径
+        cues: 已解析的条目，默认读取 srt_path
+        words: 词级时间 (start_ms, end_ms, word)，按时间分配给条目
+    """
+    if cues is None:
+        cues = _load_srt(srt_path)
+    if words:
+        cues.assign_words(words)
+    write_atomic(format_path(srt_path, 'vtt'), cues.to_vtt())
+    write_atomic(format_path(srt_path, 'json'), cues.to_json())
+    notify_subtitle_written(srt_path, cues)
+
+
+def refresh_sidecars(srt_path: str):
+    """按 SRT 重新生成派生文件，沿用仍与字幕文本一致的词级时间"""
+    cues = _load_srt(srt_path)
+    write_sidecars(srt_path, cues, known_words(srt_path, cues))
+
+
+def write_subtitle(srt_path: str, srt_content: str, words: Iterable = None):
+    """
+    写入 SRT 字幕，同时生成 WebVTT 和 JSON
+
+    Args:
+        srt_path: SRT 文件路径
+        srt_content: SRT 内容
+        words: ASR 返回的词级时间 (start_ms, end_ms, word)；None 时沿用已有 JSON 中仍与新字幕文本一致的词级时间
+    """
+    write_atomic(srt_path, srt_content)
+    cues = CueStore.from_srt(srt_content)
+    write_sidecars(srt_path, cues, known_words(srt_path, cues) if words is None else words)
+
+
+def ensure_sidecar(srt_path: str, fmt: str) -> Optional[str]:
+    """
+    返回 SRT 派生格式文件的路径，不存在或落后于 SRT 时重新生成
+
+    派生文件总是在 SRT 之后写入；SRT 被替换、链接或复制时 ctime 会更新，
+    因此派生文件的 mtime 早于 SRT 的 ctime 即视为过期（例如 rsync 同步进来的文件）。
+
+    Returns:
+        str: 文件路径，SRT 不存在时返回 None
+    """
+    try:
+        srt_stat = os.stat(srt_path)
+    except FileNotFoundError:
+        return None
+    path = format_path(srt_path, fmt)
+    try:
+        fresh = os.stat(path).st_mtime_ns >= srt_stat.st_ctime_ns
+    except FileNotFoundError:
+        fresh = False
+    if not fresh:
+        refresh_sidecars(srt_path)
+    return path
+
+
+def artifact_key(audio_sha256: str, kind: str, params: Dict) -> str:
+    """由音频哈希、字幕类型和生成参数计算存储键"""
+    payload = json.dumps({'audio': audio_sha256, 'kind': kind, 'params': params},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SubtitleStore:
+    """字幕内容寻址存储，audio 路径均为相对音频根目录的 book/disc/filename"""
+
+    def __init__(self, audio_store, store_root: str = None, db_path: str = None):
+        """
+        Args:
+            audio_store: AudioStore，提供音频内容哈希和字幕根目录
+            store_root: 存储目录，默认读取 SUBTITLE_STORE_DIR（data/subtitle_store）
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+        """
+        self.audio_store = audio_store
+        self.subtitle_root = audio_store.subtitle_root
+        self.store_root = store_root or STORE_ROOT
+        self.db_path = db_path
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    def _artifact_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.store_root, key[:2], f"{key}{KINDS[kind]}")
+
+    def _subtitle_relpath(self, audio_path: str, kind: str) -> str:
+        return f"{os.path.splitext(audio_path)[0]}{KINDS[kind]}"
+
+    def subtitle_path(self, audio_path: str, kind: str) -> str:
+        """音轨对应的字幕文件路径"""
+        return os.path.join(self.subtitle_root, self._subtitle_relpath(audio_path, kind))
+
+    def key_for(self, audio_path: str, kind: str, params: Dict) -> Optional[str]:
+        """
+        计算音轨字幕的存储键
+
+        Returns:
+            str: 存储键，音频不存在时返回 None
+        """
+        audio_sha256 = self.audio_store.ensure_hash(audio_path)
+        return artifact_key(audio_sha256, kind, params) if audio_sha256 else None
+
+    # ------------------------------------------------------------------ 读写
+
+    def materialize(self, audio_path: str, kind: str, params: Dict) -> bool:
+        """
+        存储中已有相同音频、相同参数生成的字幕时，把它链接到音轨的字幕路径
+
+        Args:
+            audio_path: 音轨 book/disc/filename
+            kind: 'srt' 或 'optimized'
+            params: 生成参数（ASR 服务及参数、优化器版本等）
+
+        Returns:
+            bool: 是否命中
+        """
+        key = self.key_for(audio_path, kind, params)
+        if key is None:
+            return False
+        artifact = self._artifact_path(key, kind)
+        if not os.path.exists(artifact):
+            return False
+
+        subtitle_path = self.subtitle_path(audio_path, kind)
+        link_or_copy(artifact, subtitle_path)
+        refresh_sidecars(subtitle_path)
+        self._add_ref(audio_path, kind, key)
+        print(f"Subtitle store hit: {self._subtitle_relpath(audio_path, kind)} <- {key[:12]}")
+        return True
+
+    def adopt(self, audio_path: str, kind: str, params: Dict) -> Optional[str]:
+        """
+        将刚生成的字幕文件收入存储，字幕路径改为指向存储的硬链接
+
+        Returns:
+            str: 存储键；字幕或音频不存在时返回 None
+        """
+        subtitle_path = self.subtitle_path(audio_path, kind)
+        if not os.path.exists(subtitle_path):
+            return None
+        audio_sha256 = self.audio_store.ensure_hash(audio_path)
+        if not audio_sha256:
+            return None
+
+        key = artifact_key(audio_sha256, kind, params)
+        artifact = self._artifact_path(key, kind)
+        if os.path.exists(artifact):
+            # 其他音轨已经生成过：丢弃这份，指向已有的；内容可能不同，重新生成派生文件并通知回调
+            link_or_copy(artifact, subtitle_path)
+            refresh_sidecars(subtitle_path)
+        else:
+            link_or_copy(subtitle_path, artifact)
+            notify_subtitle_written(subtitle_path)
+
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO subtitle_artifacts (key, kind, audio_sha256, params, size, created_at, last_used_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET last_used_at = excluded.last_used_at',
+            (key, kind, audio_sha256, json.dumps(params, sort_keys=True, ensure_ascii=False),
+             os.path.getsize(artifact), now, now)
+        )
+        self._add_ref(audio_path, kind, key)
+        return key
+
+    def _add_ref(self, audio_path: str, kind: str, key: str):
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                'INSERT INTO subtitle_refs (path, key, created_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET key = excluded.key, created_at = excluded.created_at',
+                (self._subtitle_relpath(audio_path, kind), key, now)
+            )
+            conn.execute('UPDATE subtitle_artifacts SET last_used_at = ? WHERE key = ?', (now, key))
+
+    # ------------------------------------------------------------------ 维护
+
+    def _ref_alive(self, path: str, kind: str, key: str) -> bool:
+        """字幕文件仍是存储项的链接（或复制出的相同内容）时引用有效；被删除或重新生成后失效"""
+        artifact = self._artifact_path(key, kind)
+        try:
+            subtitle_stat = os.stat(os.path.join(self.subtitle_root, path))
+            artifact_stat = os.stat(artifact)
+        except FileNotFoundError:
+            return False
+        if (subtitle_stat.st_dev, subtitle_stat.st_ino) == (artifact_stat.st_dev, artifact_stat.st_ino):
+            return True
+        # 不支持硬链接时 link_or_copy 退回复制，比较内容
+        if subtitle_stat.st_size != artifact_stat.st_size:
+            return False
+        return file_sha256(os.path.join(self.subtitle_root, path)) == file_sha256(artifact)
+
+    def _prune_refs(self):
+        """删除字幕文件已不存在、或已被替换为其他内容的引用"""
+        conn = self._conn()
+        dead = [row['path'] for row in conn.execute(
+                    'SELECT r.path, r.key, a.kind FROM subtitle_refs r '
+                    'LEFT JOIN subtitle_artifacts a ON a.key = r.key')
+                if row['kind'] is None or not self._ref_alive(row['path'], row['kind'], row['key'])]
+        if dead:
+            conn.executemany('DELETE FROM subtitle_refs WHERE path = ?', [(path,) for path in dead])
+
+    def report(self) -> Dict:
+        """
+        引用计数报告
+
+        Returns:
+            Dict: artifacts（每个存储项的类型、大小、引用数、引用路径、最后使用时间）、
+            total_bytes、exclusive_bytes（只被存储持有、淘汰后能释放的字节数）、references
+        """
+        self._prune_refs()
+        conn = self._conn()
+        refs = {}
+        for row in conn.execute('SELECT path, key FROM subtitle_refs ORDER BY path'):
+            refs.setdefault(row['key'], []).append(row['path'])
+
+        artifacts = []
+        total_bytes = exclusive_bytes = 0
+        for row in conn.execute('SELECT * FROM subtitle_artifacts ORDER BY last_used_at DESC'):
+            path = self._artifact_path(row['key'], row['kind'])
+            try:
+                links = os.stat(path).st_nlink
+            except FileNotFoundError:
+                continue
+            total_bytes += row['size']
+            if links == 1:
+                exclusive_bytes += row['size']
+            artifacts.append({
+                'key': row['key'],
+                'kind': row['kind'],
+                'audio_sha256': row['audio_sha256'],
+                'params': json.loads(row['params']),
+                'size': row['size'],
+                'refcount': len(refs.get(row['key'], [])),
+                'paths': refs.get(row['key'], []),
+                'last_used_at': row['last_used_at'],
+            })
+        return {
+            'artifacts': artifacts,
+            'total_bytes': total_bytes,
+            'exclusive_bytes': exclusive_bytes,
+            'references': sum(len(paths) for paths in refs.values()),
+        }
+
+    def evict(self, max_bytes: int = None, unused_days: float = None) -> Dict:
+        """
+        淘汰存储项
+
+        - 没有被任何字幕文件引用、且超过 unused_days 天未使用的存储项被删除
+        - 存储占用超过 max_bytes 时，按最后使用时间从旧到新删除没有引用的存储项；
+          有引用的存储项与字幕文件共享数据，删除也不会释放空间，因此不会被淘汰
+
+        Returns:
+            Dict: evicted（删除的存储项数）、freed_bytes
+        """
+        report = self.report()
+        candidates = sorted((a for a in report['artifacts'] if a['refcount'] == 0),
+                            key=lambda a: a['last_used_at'])
+        total = report['total_bytes']
+        cutoff = time.time() - unused_days * 86400 if unused_days is not None else None
+
+        evicted, freed = 0, 0
+        conn = self._conn()
+        for artifact in candidates:
+            too_old = cutoff is not None and artifact['last_used_at'] < cutoff
+            too_big = max_bytes is not None and total > max_bytes
+            if not (too_old or too_big):
+                continue
+            path = self._artifact_path(artifact['key'], artifact['kind'])
+            if os.path.exists(path):
+                os.remove(path)
+            conn.execute('DELETE FROM subtitle_artifacts WHERE key = ?', (artifact['key'],))
+            total -= artifact['size']
+            freed += artifact['size']
+            evicted += 1
+
+        if evicted:
+            print(f"Subtitle store evicted {evicted} artifacts, freed {freed} bytes")
+        return {'evicted': evicted, 'freed_bytes': freed}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="字幕内容寻址存储维护工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="引用计数报告")
+    report_parser.add_argument("--json", action='store_true', help="输出 JSON")
+    evict_parser = subparsers.add_parser("evict", help="淘汰没有引用的存储项")
+    evict_parser.add_argument("--max-mb", type=float, help="存储占用上限（MB）")
+    evict_parser.add_argument("--unused-days", type=float, help="超过该天数未使用的存储项被删除")
+    args = parser.parse_args(argv)
+
+    from app import subtitle_artifacts as store
+
+    if args.command == "report":
+        report = store.report()
+        if args.json:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+            return 0
+        for artifact in report['artifacts']:
+            print(f"{artifact['key'][:12]}  {artifact['kind']:<9}  {artifact['size']:>8}  "
+                  f"refs={artifact['refcount']}  {', '.join(artifact['paths'])}")
+        print(f"Artifacts: {len(report['artifacts'])}  references: {report['references']}  "
+              f"total: {report['total_bytes']} bytes  exclusive: {report['exclusive_bytes']} bytes")
+        return 0
+
+    if args.max_mb is None and args.unused_days is None:
+        parser.error("evict 需要 --max-mb 或 --unused-days")
+    result = store.evict(
+        max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None,
+        unused_days=args.unused_days,
+    )
+    print(f"Evicted: {result['evicted']}  freed: {result['freed_bytes']} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
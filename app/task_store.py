@@ -0,0 +1,245 @@
+"""
+后台任务状态存储
+字幕优化等任务的状态保存在 SQLite（WAL）中，所有 gunicorn worker 共享，重启后仍然有效；
+claim 是原子操作，同一个任务同一时间只会有一个 worker 在处理。
+认领的任务（无论在执行器中排队还是正在执行）由后台线程定期刷新心跳，只有进程退出后才会过期
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from app.db import get_connection
+
+# processing 状态超过该时间没有心跳，视为所在 worker 已崩溃，可以被重新认领
+STALE_AFTER = int(os.getenv('TASK_STALE_AFTER', '600'))
+
+SCHEMA = ('task_store', """
+CREATE TABLE IF NOT EXISTS tasks (
+    kind TEXT NOT NULL,
+    task_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    error TEXT,
+    result TEXT,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    PRIMARY KEY (kind, task_key)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (kind, status, updated_at);
+""")
+
+STALE_ERROR = '任务超时，处理该任务的 worker 可能已退出'
+
+
+def _owner() -> str:
+    """每次认领生成唯一的 owner，任务被其他 worker 接管后原 owner 的心跳和结果都不再生效"""
+    return f"{os.getpid()}:{uuid.uuid4().hex}"
+
+
+class TaskStore:
+    """跨 worker 的任务状态存储，状态为 processing / completed / failed"""
+
+    def __init__(self, kind: str, db_path: str = None, stale_after: int = None):
+        """
+        Args:
+            kind: 任务类型，例如 'subtitle_optimization'
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+            stale_after: processing 状态的过期时间（秒）
+        """
+        self.kind = kind
+        self.db_path = db_path
+        self.stale_after = stale_after if stale_after is not None else STALE_AFTER
+        # 本进程内任务结束时唤醒 wait_finished，其他 worker 的结果靠定期查询数据库
+        self._changed = threading.Condition()
+        self._version = 0
+        # 本进程认领、尚未结束的任务 {task_key: owner}，由心跳线程定期刷新
+        self._owned: Dict[str, str] = {}
+        self._owned_lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._heartbeat_pid = None
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    def claim(self, task_key: str) -> bool:
+        """
+        原子地认领任务
+
+        任务不存在、已结束（completed/failed）或 processing 已过期时认领成功；
+        其他 worker 正在处理时返回 False。
+
+        Args:
+            task_key: 任务唯一标识
+
+        Returns:
+            bool: 是否认领成功
+        """
+        now = time.time()
+        owner = _owner()
+        cursor = self._conn().execute(
+            "INSERT INTO tasks (kind, task_key, status, owner, started_at, updated_at) "
+            "VALUES (?, ?, 'processing', ?, ?, ?) "
+            "ON CONFLICT(kind, task_key) DO UPDATE SET "
+            "status = 'processing', owner = excluded.owner, error = NULL, result = NULL, "
+            "started_at = excluded.started_at, updated_at = excluded.updated_at, finished_at = NULL "
+            "WHERE tasks.status != 'processing' OR tasks.updated_at < ?",
+            (self.kind, task_key, owner, now, now, now - self.stale_after)
+        )
+        if cursor.rowcount != 1:
+            return False
+        with self._owned_lock:
+            self._ensure_heartbeat()
+            self._owned[task_key] = owner
+        return True
+
+    def heartbeat(self, task_key: str) -> bool:
+        """
+        刷新本进程认领的任务的心跳（后台线程定期调用；任务从执行器队列中取出开始执行时也调用一次）
+
+        Returns:
+            bool: 任务仍由本进程持有时返回 True；已被其他 worker 接管或已结束时返回 False
+        """
+        owner = self._owned.get(task_key)
+        if owner is None:
+            return False
+        cursor = self._conn().execute(
+            "UPDATE tasks SET updated_at = ? "
+            "WHERE kind = ? AND task_key = ? AND status = 'processing' AND owner = ?",
+            (time.time(), self.kind, task_key, owner)
+        )
+        if cursor.rowcount == 1:
+            return True
+        with self._owned_lock:
+            if self._owned.get(task_key) == owner:
+                del self._owned[task_key]
+        print(f"Lost ownership of {self.kind} task {task_key}")
+        return False
+
+    def _ensure_heartbeat(self):
+        """启动心跳线程（调用方持有 _owned_lock）；fork 出的子进程不继承父进程认领的任务"""
+        if self._heartbeat_pid != os.getpid():
+            self._owned.clear()
+            self._heartbeat_thread = None
+            self._heartbeat_pid = os.getpid()
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop,
+                                                      name=f"task-heartbeat-{self.kind}", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        """每 stale_after/4 秒刷新一次本进程持有的任务，没有任务时退出"""
+        interval = self.stale_after / 4
+        while True:
+            time.sleep(interval)
+            with self._owned_lock:
+                if not self._owned:
+                    self._heartbeat_thread = None
+                    return
+                task_keys = list(self._owned)
+            for task_key in task_keys:
+                try:
+                    self.heartbeat(task_key)
+                except sqlite3.Error as e:
+                    print(f"Task heartbeat failed for {task_key}: {str(e)}")
+
+    def complete(self, task_key: str, result: Dict = None):
+        """标记任务完成"""
+        self._finish(task_key, 'completed', result=result)
+
+    def fail(self, task_key: str, error: str):
+        """标记任务失败"""
+        self._finish(task_key, 'failed', error=error)
+
+    def _finish(self, task_key: str, status: str, result: Dict = None, error: str = None):
+        """只有认领该任务的 owner 能写入结果，任务已被其他 worker 接管时忽略"""
+        with self._owned_lock:
+            owner = self._owned.pop(task_key, None)
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE tasks SET status = ?, result = ?, error = ?, updated_at = ?, finished_at = ? "
+            "WHERE kind = ? AND task_key = ? AND owner = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, now, now, self.kind, task_key, owner)
+        )
+        if cursor.rowcount != 1:
+            print(f"Ignored {status} result for {self.kind} task {task_key}: not owned by this worker")
+            return
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def get(self, task_key: str) -> Optional[Dict]:
+        """
+        查询任务状态
+
+        Returns:
+            Dict: status、error、result、started_at、finished_at；任务不存在时返回 None。
+            过期的 processing 任务以 failed 状态返回
+        """
+        row = self._conn().execute(
+            "SELECT * FROM tasks WHERE kind = ? AND task_key = ?", (self.kind, task_key)
+        ).fetchone()
+        if row is None:
+            return None
+
+        task = {
+            'status': row['status'],
+            'error': row['error'],
+            'result': json.loads(row['result']) if row['result'] else {},
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        if task['status'] == 'processing' and row['updated_at'] < time.time() - self.stale_after:
+            task['status'] = 'failed'
+            task['error'] = STALE_ERROR
+        return task
+
+    def wait_finished(self, task_key: str, timeout: float, poll_interval: float = 2.0) -> Optional[Dict]:
+        """
+        等待任务结束（completed/failed）
+
+        同一进程内完成的任务会立即唤醒；其他 worker 完成的任务最多延迟 poll_interval 秒被发现。
+
+        Args:
+            task_key: 任务唯一标识
+            timeout: 最长等待时间（秒）
+            poll_interval: 查询数据库的间隔（秒）
+
+        Returns:
+            Dict: 最后一次查询到的任务状态（超时时 status 仍为 processing）；任务不存在时返回 None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self._version
+            task = self.get(task_key)
+            if task is None or task['status'] != 'processing':
+                return task
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return task
+            with self._changed:
+                if self._version == version:
+                    self._changed.wait(min(poll_interval, remaining))
+
+    def expire_stale(self) -> int:
+        """
+        将过期的 processing 任务标记为 failed
+
+        Returns:
+            int: 过期的任务数
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE tasks SET status = 'failed', error = ?, updated_at = ?, finished_at = ? "
+            "WHERE kind = ? AND status = 'processing' AND updated_at < ?",
+            (STALE_ERROR, now, now, self.kind, now - self.stale_after)
+        )
+        if cursor.rowcount:
+            print(f"Expired {cursor.rowcount} stale {self.kind} tasks")
+        return cursor.rowcount
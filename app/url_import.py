@@ -0,0 +1,340 @@
+"""
+URL 音频导入
+后台下载管理器：连接/读取超时、全局并发上限、失败后使用 HTTP Range 断点续传、
+校验大小和 sha256。任务状态保存在 SQLite 中，任意 gunicorn worker 都可以查询进度；
+worker 退出后遗留的任务由其他 worker 启动时接管（recover）
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import requests
+
+from app.audio_probe import detect_truncation
+from app.db import get_connection, transaction
+from app.ingest import AudioStore
+
+CONNECT_TIMEOUT = float(os.getenv('URL_IMPORT_CONNECT_TIMEOUT', '10'))
+READ_TIMEOUT = float(os.getenv('URL_IMPORT_READ_TIMEOUT', '30'))
+# 所有 worker 同时下载的任务数上限
+MAX_CONCURRENCY = int(os.getenv('URL_IMPORT_CONCURRENCY', '2'))
+MAX_ATTEMPTS = int(os.getenv('URL_IMPORT_MAX_ATTEMPTS', '5'))
+# 重试间隔（秒），按次数指数增长，最长 30 秒
+RETRY_BACKOFF = float(os.getenv('URL_IMPORT_RETRY_BACKOFF', '2'))
+MAX_BYTES = int(os.getenv('URL_IMPORT_MAX_BYTES', str(500 * 1024 * 1024)))
+# 超过该时间没有进度更新的下载视为所在 worker 已退出，不再占用并发名额
+STALE_AFTER = 120
+# 名额被其他 worker 占满时的最长等待时间（秒）；本进程的下载结束时会立即唤醒
+SLOT_WAIT = 5
+CHUNK_SIZE = 64 * 1024
+
+SCHEMA = ('url_import', """
+CREATE TABLE IF NOT EXISTS url_import_jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    bytes_downloaded INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    expected_sha256 TEXT,
+    expected_size INTEGER,
+    sha256 TEXT,
+    deduplicated INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_url_import_jobs_status ON url_import_jobs (status);
+""")
+
+ACTIVE_STATUSES = ('downloading', 'verifying')
+PENDING_STATUSES = ('queued',) + ACTIVE_STATUSES
+
+
+class DownloadError(Exception):
+    """下载失败；retryable 为 False 时不再重试（例如 404）"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class UrlImportManager:
+    """URL 导入管理器，每个 worker 一个实例，并发上限通过数据库在所有 worker 之间共享"""
+
+    def __init__(self, audio_store: AudioStore, on_complete: Callable[[Dict], None] = None,
+                 db_path: str = None, max_concurrency: int = None):
+        """
+        Args:
+            audio_store: 音频入库存储，下载完成后由它负责原子重命名和去重
+            on_complete: 导入成功后的回调，参数为任务字典（例如刷新音频库索引）
+            db_path: 数据库文件路径，默认使用 app.db.DB_PATH
+            max_concurrency: 全局并发下载上限
+        """
+        self.audio_store = audio_store
+        self.on_complete = on_complete
+        self.db_path = db_path
+        self.max_concurrency = max_concurrency or MAX_CONCURRENCY
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='url-import')
+        self._session = requests.Session()
+        self._slot_released = threading.Condition()
+
+    def _conn(self):
+        return get_connection(self.db_path, SCHEMA)
+
+    # ------------------------------------------------------------------ 接口
+
+    def submit(self, url: str, relative_path: str, expected_sha256: str = None,
+               expected_size: int = None) -> str:
+        """
+        提交导入任务，立即返回任务 ID
+
+        Args:
+            url: 音频 URL
+            relative_path: 保存路径 book/disc/filename
+            expected_sha256: 期望的 sha256（可选），不一致时任务失败
+            expected_size: 期望的文件大小（可选）
+
+        Returns:
+            str: 任务 ID
+        """
+        if not url.lower().startswith(('http://', 'https://')):
+            raise ValueError("只支持 http/https URL")
+        self.audio_store.resolve(relative_path)
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO url_import_jobs (id, url, path, status, expected_sha256, expected_size, '
+            'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, url, relative_path, 'queued',
+             expected_sha256.lower() if expected_sha256 else None, expected_size, now, now)
+        )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        查询任务状态
+
+        Returns:
+            Dict: 任务字典，包含 status、bytes_downloaded、total_bytes、progress 等；不存在时返回 None
+        """
+        row = self._conn().execute('SELECT * FROM url_import_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['deduplicated'] = bool(job['deduplicated'])
+        job['progress'] = (
+            round(job['bytes_downloaded'] / job['total_bytes'], 4) if job['total_bytes'] else None
+        )
+        return job
+
+    def recover(self) -> int:
+        """
+        接管所在 worker 已退出的任务（启动时调用）
+
+        queued/downloading/verifying 状态超过 STALE_AFTER 秒没有更新的任务在本 worker 重新排队，
+        重试次数已用完的标记为失败。多个 worker 同时启动时每个任务只会被一个 worker 接管。
+
+        Returns:
+            int: 重新排队的任务数
+        """
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT id, attempts, updated_at FROM url_import_jobs WHERE status IN "
+            f"({', '.join('?' * len(PENDING_STATUSES))}) AND updated_at < ?",
+            (*PENDING_STATUSES, time.time() - STALE_AFTER)
+        ).fetchall()
+
+        requeued = 0
+        for row in rows:
+            exhausted = row['attempts'] >= MAX_ATTEMPTS
+            cursor = conn.execute(
+                "UPDATE url_import_jobs SET status = ?, error = COALESCE(?, error), updated_at = ? "
+                "WHERE id = ? AND updated_at = ?",
+                ('failed' if exhausted else 'queued',
+                 '下载中断：处理该任务的 worker 已退出' if exhausted else None,
+                 time.time(), row['id'], row['updated_at'])
+            )
+            if cursor.rowcount != 1:
+                continue
+            if not exhausted:
+                self._executor.submit(self._run, row['id'])
+                requeued += 1
+        if rows:
+            print(f"URL import recovery: {requeued} requeued, {len(rows) - requeued} failed or taken")
+        return requeued
+
+    # ------------------------------------------------------------------ 内部实现
+
+    def _update(self, job_id: str, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f"{key} = ?" for key in fields)
+        self._conn().execute(
+            f'UPDATE url_import_jobs SET {columns} WHERE id = ?', (*fields.values(), job_id)
+        )
+
+    def _acquire_slot(self, job_id: str) -> bool:
+        """在所有 worker 之间原子地占用一个下载名额"""
+        conn = self._conn()
+        with transaction(conn):
+            running = conn.execute(
+                f"SELECT COUNT(*) FROM url_import_jobs WHERE status IN "
+                f"({', '.join('?' * len(ACTIVE_STATUSES))}) AND updated_at > ?",
+                (*ACTIVE_STATUSES, time.time() - STALE_AFTER)
+            ).fetchone()[0]
+            if running >= self.max_concurrency:
+                # 排队中的任务同样刷新 updated_at，避免被当作遗留任务接管
+                conn.execute("UPDATE url_import_jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+                return False
+            conn.execute(
+                "UPDATE url_import_jobs SET status = 'downloading', updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+        return True
+
+    def _run(self, job_id: str):
+        job = self.get(job_id)
+        with self._slot_released:
+            while not self._acquire_slot(job_id):
+                # 其他 worker 释放名额时无法通知，最多等待 SLOT_WAIT 秒后重新检查
+                self._slot_released.wait(SLOT_WAIT)
+        try:
+            self._download_and_ingest(job)
+        finally:
+            with self._slot_released:
+                self._slot_released.notify_all()
+
+    def _download_and_ingest(self, job: Dict):
+        job_id = job['id']
+
+        dest = self.audio_store.resolve(job['path'])
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        part_path = os.path.join(os.path.dirname(dest), f".import-{job_id}.part")
+
+        try:
+            sha256, size = self._download(job, part_path)
+
+            self._update(job_id, status='verifying')
+            if job['expected_size'] is not None and size != job['expected_size']:
+                raise DownloadError(f"文件大小不一致: 期望 {job['expected_size']}，实际 {size}", retryable=False)
+            if job['expected_sha256'] and sha256 != job['expected_sha256']:
+                raise DownloadError(f"sha256 校验失败: {sha256}", retryable=False)
+
+            result = self.audio_store.ingest_file(part_path, job['path'], sha256=sha256)
+            self._update(job_id, status='completed', sha256=sha256,
+                         deduplicated=int(result['deduplicated']), error=None)
+            print(f"URL import completed: {job['url']} -> {job['path']}")
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e))
+            print(f"URL import failed: {job['url']}: {str(e)}")
+            return
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+        if self.on_complete:
+            try:
+                self.on_complete(self.get(job_id))
+            except Exception as e:
+                print(f"URL import on_complete callback failed: {str(e)}")
+
+    def _download(self, job: Dict, part_path: str):
+        """
+        下载到 part 文件，网络错误时带 Range 头断点续传
+
+        Returns:
+            tuple: (sha256, size)
+        """
+        hasher = hashlib.sha256()
+        offset = 0
+        total = None
+        last_error = None
+
+        with open(part_path, 'wb') as f:
+            # 接管的遗留任务从上次的重试次数继续计数
+            for attempt in range(job['attempts'] + 1, MAX_ATTEMPTS + 1):
+                self._update(job['id'], attempts=attempt)
+                headers = {'Range': f'bytes={offset}-'} if offset else {}
+                try:
+                    with self._session.get(job['url'], stream=True, headers=headers,
+                                           timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+                        if offset and response.status_code == 200:
+                            # 服务器不支持 Range，从头开始
+                            print(f"Server ignored Range header, restarting: {job['url']}")
+                            offset = 0
+                            hasher = hashlib.sha256()
+                            f.seek(0)
+                            f.truncate()
+                        elif response.status_code not in (200, 206):
+                            raise DownloadError(
+                                f"下载失败，状态码: {response.status_code}",
+                                retryable=response.status_code in (408, 429) or response.status_code >= 500
+                            )
+
+                        total = _parse_total_size(response, offset) or total
+                        if total and total > MAX_BYTES:
+                            raise DownloadError(f"文件过大: {total} 字节", retryable=False)
+
+                        last_report = time.monotonic()
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            offset += len(chunk)
+                            if offset > MAX_BYTES:
+                                raise DownloadError(f"文件超过 {MAX_BYTES} 字节", retryable=False)
+                            if time.monotonic() - last_report >= 1:
+                                self._update(job['id'], bytes_downloaded=offset, total_bytes=total)
+                                last_report = time.monotonic()
+
+                    if total is not None and offset < total:
+                        raise DownloadError(f"连接提前关闭: {offset}/{total} 字节")
+
+                    f.flush()
+                    if total is None:
+                        # 没有 Content-Length/Content-Range 时无法从协议上判断连接是否提前关闭，检查音频本身是否完整
+                        reason = detect_truncation(part_path, job['path'])
+                        if reason:
+                            raise DownloadError(f"下载的音频不完整: {reason}")
+                    os.fsync(f.fileno())
+                    self._update(job['id'], bytes_downloaded=offset, total_bytes=total or offset)
+                    return hasher.hexdigest(), offset
+
+                except (requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError, DownloadError) as e:
+                    if isinstance(e, DownloadError) and not e.retryable:
+                        raise
+                    last_error = e
+                    f.flush()
+                    self._update(job['id'], bytes_downloaded=offset, total_bytes=total,
+                                 error=f"第 {attempt} 次下载中断: {str(e)}")
+                    print(f"URL import attempt {attempt} failed at {offset} bytes: {str(e)}")
+                    if attempt < MAX_ATTEMPTS:
+                        time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), 30))
+
+        raise DownloadError(f"重试 {MAX_ATTEMPTS} 次后仍然失败: {str(last_error)}", retryable=False)
+
+
+def _parse_total_size(response: requests.Response, offset: int) -> Optional[int]:
+    """从 Content-Range（206）或 Content-Length（200）中解析文件总大小"""
+    content_range = response.headers.get('Content-Range')
+    if response.status_code == 206 and content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        # 带 Content-Encoding 时 Content-Length 是压缩后的长度，无法用于校验
+        if response.headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        return offset + int(content_length)
+    return None
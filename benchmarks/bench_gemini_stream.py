@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Gemini 流式响应解析性能测试
+对比旧的逐字符解析（GeminiChatCompletions._create_stream_response 原实现）和增量解析器
+JsonArrayStreamDecoder，在不同大小的 streamGenerateContent 响应上的耗时，
+同时输出解析出的对象数（文本中含有括号时旧实现会错切对象）
+
+用法:
+    python benchmarks/bench_gemini_stream.py
+    python benchmarks/bench_gemini_stream.py --chunk-size 64 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.llm.json_stream import JsonArrayStreamDecoder  # noqa: E402
+
+
+def legacy_parse(chunks):
+    """原 _create_stream_response 的解析循环，返回解析成功的对象数"""
+    buffer = ""
+    in_array = False
+    brace_count = 0
+    current_object = ""
+    count = 0
+    for chunk in chunks:
+        buffer += chunk
+        i = 0
+        while i < len(buffer):
+            char = buffer[i]
+            if not in_array:
+                if char == '[':
+                    in_array = True
+            else:
+                if char == '{':
+                    brace_count += 1
+                    current_object += char
+                elif char == '}':
+                    brace_count -= 1
+                    current_object += char
+                    if brace_count == 0:
+                        try:
+                            json.loads(current_object.strip())
+                            count += 1
+                        except json.JSONDecodeError:
+                            pass
+                        current_object = ""
+                elif brace_count > 0:
+                    current_object += char
+                elif char == ']':
+                    break
+            i += 1
+        buffer = buffer[i:]
+    return count
+
+
+def decoder_parse(chunks):
+    decoder = JsonArrayStreamDecoder()
+    return sum(len(decoder.feed(chunk)) for chunk in chunks)
+
+
+def make_stream(objects, text_size, braces=False):
+    """生成 streamGenerateContent 风格的响应：每个对象带一段文本"""
+    text = ("Correct: 'I has' -> 'I have'. " * (text_size // 30 + 1))[:text_size]
+    if braces:
+        text = text.replace("'I have'.", "'I have' :-}")
+    items = [json.dumps({'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}]})
+             for _ in range(objects)]
+    return '[' + ',\r\n'.join(items) + ']'
+
+
+def bench(label, func, chunks, payload_bytes, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(chunks)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<40} {best * 1000:9.1f} ms  {payload_bytes / best / 1024 / 1024:8.2f} MB/s  objects={result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini 流式响应解析性能测试")
+    parser.add_argument("--chunk-size", type=int, default=512, help="每次读取的字符数，默认 512")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    args = parser.parse_args()
+
+    # 旧实现逐字符拼接 current_object，每段数据还要重新切片缓冲区
+    for objects, text_size in ((50, 200), (20, 20_000), (4, 200_000)):
+        stream = make_stream(objects, text_size)
+        chunks = [stream[i:i + args.chunk_size] for i in range(0, len(stream), args.chunk_size)]
+        print(f"\n{objects} objects x {text_size} chars ({len(stream) / 1024:.0f} KB)")
+        bench("legacy char loop", legacy_parse, chunks, len(stream), args.repeat)
+        bench("JsonArrayStreamDecoder", decoder_parse, chunks, len(stream), args.repeat)
+
+    # 文本中的括号不成对时旧实现把一个对象切成多段，解析失败的部分被静默丢弃
+    stream = make_stream(50, 200, braces=True)
+    chunks = [stream[i:i + args.chunk_size] for i in range(0, len(stream), args.chunk_size)]
+    print("\n50 objects with unbalanced braces inside strings")
+    bench("legacy char loop", legacy_parse, chunks, len(stream), args.repeat)
+    bench("JsonArrayStreamDecoder", decoder_parse, chunks, len(stream), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
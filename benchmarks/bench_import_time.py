@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+冷启动导入耗时测试
+在新的解释器中用 `python -X importtime` 导入应用模块（gunicorn 启动和 max_requests 回收 worker 时的开销），
+输出累计耗时和自身耗时最多的模块；超过预算，或者导入了应当延迟加载的 SDK 时以非零状态退出，可以放进 CI。
+
+用法:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --module app.llm --budget-ms 300 --repeat 7
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只应在第一次调用时加载的 SDK
+LAZY_MODULES = ('openai', 'dashscope', 'llama_index')
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure(module: str):
+    """
+    在新进程中导入模块
+
+    Returns:
+        Tuple[int, Dict[str, Tuple[int, int]]]: 顶层模块的累计耗时（微秒），{模块: (自身耗时, 累计耗时)}
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, timeout=120
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules[module][1], modules
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="冷启动导入耗时测试")
+    parser.add_argument("--module", default="app", help="要导入的模块，默认 app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', '600')),
+                        help="累计耗时中位数的上限（毫秒），默认 600 或 IMPORT_TIME_BUDGET_MS")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="输出自身耗时最多的模块数")
+    args = parser.parse_args(argv)
+
+    totals = []
+    modules = {}
+    for _ in range(args.repeat):
+        total, modules = measure(args.module)
+        totals.append(total)
+    median_ms = statistics.median(totals) / 1000
+
+    print(f"import {args.module}: median {median_ms:.1f} ms, min {min(totals) / 1000:.1f} ms "
+          f"({args.repeat} runs, budget {args.budget_ms:.0f} ms)")
+    print(f"\nTop {args.top} modules by self time (last run):")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = sorted(name for name in modules if name.split('.')[0] in LAZY_MODULES and '.' not in name)
+    if loaded:
+        print(f"\nFAIL: {', '.join(loaded)} imported at startup (should load on first use)")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"\nFAIL: import time {median_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SRT 解析性能测试
+对比旧的正则解析（parse_srt_to_entries 原实现）和流式解析器 iter_srt_cues 在几 MB 字幕上的吞吐量，
+同时输出解析出的条目数（CRLF 和缺少空行的文件旧正则无法正确切分）。
+"legacy regex" 只做切分，得到的是字符串；"legacy CueStore.from_srt" 是原来的完整流程
+（切分后再解析时间、拆出说话人），与新的 CueStore.from_srt 对比才是同样的工作量
+
+用法:
+    python benchmarks/bench_srt_parser.py
+    python benchmarks/bench_srt_parser.py --size-mb 8 --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.llm.cue_store import (CueStore, format_srt_time, iter_srt_cues, parse_srt_time,  # noqa: E402
+                               split_speaker)
+
+LEGACY_PATTERN = r'(\d+)\n([\d:,]+)\s+-->\s+([\d:,]+)\n((?:.*\n?)*?)(?=\n\d+\n|$)'
+
+
+def legacy_parse(srt_content):
+    """原 parse_srt_to_entries 使用的正则解析"""
+    return re.findall(LEGACY_PATTERN, srt_content.strip() + '\n', re.MULTILINE)
+
+
+def legacy_from_srt(srt_content):
+    """原 CueStore.from_srt：正则切分后逐条解析时间和说话人"""
+    store = CueStore()
+    for _, start_time, end_time, text in legacy_parse(srt_content):
+        start_ms, end_ms = parse_srt_time(start_time), parse_srt_time(end_time)
+        if start_ms is None or end_ms is None:
+            continue
+        speaker, text = split_speaker(text.strip())
+        store.append(start_ms, end_ms, text, speaker)
+    store.sort()
+    return store
+
+
+def make_srt(size_bytes, newline='\n'):
+    """生成指定大小的 SRT（两行文本，带说话人标记）"""
+    parts = []
+    total = 0
+    i = 0
+    while total < size_bytes:
+        start = i * 2500
+        cue = (f"{i + 1}{newline}{format_srt_time(start)} --> {format_srt_time(start + 2000)}{newline}"
+               f"[{'AB'[i % 2]}] Excuse me, is this the way to the library?{newline}"
+               f"Yes, go straight and turn left at the second corner.{newline}{newline}")
+        parts.append(cue)
+        total += len(cue)
+        i += 1
+    return ''.join(parts), i
+
+
+def bench(label, func, payload_bytes, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<34} {best * 1000:9.1f} ms  {payload_bytes / best / 1024 / 1024:8.1f} MB/s  cues={result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT 解析性能测试")
+    parser.add_argument("--size-mb", type=float, default=4, help="字幕文件大小（MB），默认 4")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    srt, cue_count = make_srt(size)
+    srt_crlf, _ = make_srt(size, newline='\r\n')
+    print(f"SRT size: {len(srt) / 1024 / 1024:.1f} MB, {cue_count} cues\n")
+
+    bench("legacy regex (LF)", lambda: len(legacy_parse(srt)), len(srt), args.repeat)
+    bench("iter_srt_cues (LF)", lambda: sum(1 for _ in iter_srt_cues(srt)), len(srt), args.repeat)
+    bench("legacy CueStore.from_srt (LF)", lambda: len(legacy_from_srt(srt)), len(srt), args.repeat)
+    bench("CueStore.from_srt (LF)", lambda: len(CueStore.from_srt(srt)), len(srt), args.repeat)
+    # 旧正则不识别 \r\n，结果为 0 条
+    bench("legacy regex (CRLF)", lambda: len(legacy_parse(srt_crlf)), len(srt_crlf), args.repeat)
+    bench("iter_srt_cues (CRLF)", lambda: sum(1 for _ in iter_srt_cues(srt_crlf)), len(srt_crlf), args.repeat)
+
+    # 条目之间缺少空行时，旧正则把后续所有条目并入第一条的文本
+    malformed = srt.replace('\n\n', '\n')
+    bench("legacy regex (no blank lines)", lambda: len(legacy_parse(malformed)), len(malformed), args.repeat)
+    bench("iter_srt_cues (no blank lines)", lambda: sum(1 for _ in iter_srt_cues(malformed)),
+          len(malformed), args.repeat)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.srt', encoding='utf-8', delete=False) as f:
+        f.write(srt_crlf)
+    try:
+        def from_file():
+            with open(f.name, 'r', encoding='utf-8-sig', newline='') as fp:
+                return len(CueStore.from_srt(fp))
+        bench("CueStore.from_srt (file, CRLF)", from_file, len(srt_crlf), args.repeat)
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@ shared_directory = os.path.join(deploy_directory, "shared")
 logs_directory = os.path.join(shared_directory, "logs")
 audios_directory = os.path.join(shared_directory, "audios")
 subtitles_directory = os.path.join(shared_directory, "subtitles")
+data_directory = os.path.join(shared_directory, "data")  # SQLite 数据库（音频库索引等）
 migrations_directory = os.path.join(shared_directory, "migrations")
 
 worker_num = 2
@@ -56,6 +57,7 @@ def setup(ctx):
     ctx.c.run(f"sudo mkdir -p {app_directory}")
     ctx.c.run(f"sudo mkdir -p {shared_directory}")
     ctx.c.run(f"sudo mkdir -p {logs_directory}")
+    ctx.c.run(f"sudo mkdir -p {data_directory}")
     ctx.c.run(f"sudo chown -R {remote_user}:{remote_user} {deploy_directory}")
 
 
@@ -110,7 +112,7 @@ def deploy(ctx):
     tar_file = f'{app_version}.tar.gz'
 
     # ctx.c.local(f"pip freeze > requirements.txt.lock")
-    ctx.c.local(f"tar czf ./tmp/{tar_file} --exclude=./log --exclude=./.git --exclude=./tmp --exclude=./app/static/audios --exclude=./app/static/subtitles . ")
+    ctx.c.local(f"tar czf ./tmp/{tar_file} --exclude=./log --exclude=./.git --exclude=./tmp --exclude=./app/static/audios --exclude=./app/static/subtitles --exclude=./data . ")
     ctx.c.put(f"./tmp/{tar_file}", app_directory)
     ctx.c.run(f"mkdir -p {version_directory}")
     ctx.c.run(f"tar xzf {os.path.join(app_directory, tar_file)} -C {version_directory}")
@@ -121,6 +123,8 @@ def deploy(ctx):
     ctx.c.run(f"ln -s {logs_directory} {os.path.join(deploy_directory, 'current', 'log')}")
     ctx.c.run(f"ln -s {audios_directory} {os.path.join(deploy_directory, 'current', 'app', 'static', 'audios')}")
     ctx.c.run(f"ln -s {subtitles_directory} {os.path.join(deploy_directory, 'current', 'app', 'static', 'subtitles')}")
+    ctx.c.run(f"mkdir -p {data_directory}")
+    ctx.c.run(f"ln -s {data_directory} {os.path.join(deploy_directory, 'current', 'data')}")
 
 @task(pre=[setup_connection])
 def seed(ctx):
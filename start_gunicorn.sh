@@ -12,6 +12,9 @@ MAX_REQUESTS=${6:-1000}
 MAX_REQUESTS_JITTER=${7:-50}
 LOG_LEVEL=${8:-'debug'}
 APP_NAME=${9:-'read-ai'}
+# 每个 worker 的线程数：每个 SSE 状态推送连接占用一个线程，最多 OPTIMIZATION_EVENTS_MAX_STREAMS（默认 4）个，
+# 超出的客户端收到 503 后改用轮询，其余线程留给普通请求
+THREADS=${10:-8}
 
 # Set PATH to include local bin
 export PATH=/home/$(whoami)/.local/bin:$PATH
@@ -32,6 +35,8 @@ echo "Starting gunicorn server..."
         (
             exec gunicorn app:app \
                 -w $WORKER_NUM \
+                --worker-class gthread \
+                --threads $THREADS \
                 -b $ADDRESS:$PORT \
                 --timeout $TIMEOUT \
                 --keep-alive $KEEPALIVE \
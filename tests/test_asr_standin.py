@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import dashscope
+import pytest
+from werkzeug.serving import make_server
+
+from app.llm import volcano_audio
+from app.llm.asr_standin import RealtimeServer, StandinConfig, create_app
+from app.llm.providers import transcribe_url_with_dashscope
+from app.llm.volcano_audio import VolcanoAudioProvider, VolcanoJobError
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    """在随机端口启动替身服务（HTTP 和实时识别 WebSocket），返回 (基础 URL, 配置)"""
+    config = StandinConfig(pending_polls=2)
+    server = make_server('127.0.0.1', 0, create_app(config), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    realtime = RealtimeServer(config)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setenv('VOLCANO_AUDIO_API_BASE', f"{base_url}/api/v1/vc")
+    monkeypatch.setenv('DASHSCOPE_API_KEY', 'test-key')
+    monkeypatch.setattr(dashscope, 'base_http_api_url', f"{base_url}/api/v1")
+    monkeypatch.setattr(dashscope, 'base_websocket_api_url', realtime.start())
+    monkeypatch.setattr(volcano_audio, 'POLL_INITIAL_INTERVAL', 0.01)
+    yield base_url, config
+    realtime.stop()
+    server.shutdown()
+
+
+def test_volcano_contract_pending_then_done():
+    """测试火山引擎接口：提交后先返回处理中，再返回识别结果；注入的失败返回 503"""
+    client = create_app(StandinConfig(pending_polls=1, repeat=2)).test_client()
+    job_id = client.post('/api/v1/vc/submit', json={'url': 'http://x/a.mp3'}).get_json()['id']
+
+    assert client.get(f'/api/v1/vc/query?id={job_id}&blocking=0').get_json()['code'] == 2000
+    done = client.get(f'/api/v1/vc/query?id={job_id}&blocking=0').get_json()
+    assert done['code'] == 0
+    assert len(done['utterances']) == 8
+    assert done['utterances'][4]['start_time'] > done['utterances'][3]['end_time']
+
+    failing = create_app(StandinConfig(failure_rate=1.0)).test_client()
+    assert failing.post('/api/v1/vc/submit', json={'url': 'http://x/a.mp3'}).status_code == 503
+
+
+def test_providers_run_against_standin(standin):
+    """测试火山引擎和 DashScope 识别通过基础 URL 覆盖走替身服务，得到 SRT"""
+    _, config = standin
+    provider = VolcanoAudioProvider()
+    srt = provider.convert_to_srt(provider.get_subtitles('http://x/a.mp3'))
+    assert srt.startswith('1\n00:00:00,500 --> 00:00:02,600\nExcuse me')
+
+    assert transcribe_url_with_dashscope('http://x/a.mp3', api_key='dummy') == srt
+
+    config.job_failure_rate = 1.0
+    with pytest.raises(VolcanoJobError):
+        provider.get_subtitles('http://x/b.mp3')
+
+
+def test_local_asr_falls_back_to_public_url(standin, tmp_path, monkeypatch):
+    """测试本地文件无法直接识别（m4a）时不发起本地识别，直接使用公开 URL；关闭备选时直接报错"""
+    _, config = standin
+    audio_path = tmp_path / 'a.m4a'
+    audio_path.write_bytes(b'audio')
+    monkeypatch.setattr(volcano_audio, 'ASR_INPUT', 'local')
+    assert volcano_audio.asr_provider('a.m4a') == 'volcano'
+    assert volcano_audio.asr_provider('a.mp3') == 'dashscope'
+
+    cues, asr = volcano_audio.transcribe_audio('http://x/a.m4a', str(audio_path))
+    assert asr == 'volcano'
+    assert cues.texts[0].startswith('Excuse me')
+    assert config.stats['realtime_sessions'] == 0
+
+    monkeypatch.setattr(volcano_audio, 'ASR_URL_FALLBACK', False)
+    with pytest.raises(ValueError):
+        volcano_audio.transcribe_audio('http://x/a.m4a', str(audio_path))
+
+
+@pytest.mark.parametrize('name', ['a.mp3', 'a.wav'])
+def test_local_asr_runs_against_standin(standin, tmp_path, monkeypatch, name):
+    """测试本地文件识别（DashScope 实时识别 WebSocket）走替身服务，得到带词级时间的条目"""
+    _, config = standin
+    audio_path = tmp_path / name
+    audio_path.write_bytes(b'\xff\xfb\x90\x00' + b'\x00' * 4096)
+    monkeypatch.setattr(volcano_audio, 'ASR_INPUT', 'local')
+
+    cues, asr = volcano_audio.transcribe_audio(None, str(audio_path))
+    assert asr == 'dashscope'
+    assert cues.texts == [u['text'] for u in config.utterances]
+    assert cues.words[0][0] == (500, 733, 'Excuse')
+    assert config.stats['realtime_sessions'] == 1
+
+    # 实时识别失败且没有公开 URL 时直接报错
+    config.job_failure_rate = 1.0
+    with pytest.raises(Exception, match='Recognition failed'):
+        volcano_audio.transcribe_audio(None, str(audio_path))
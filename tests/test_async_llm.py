@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app.llm as llm
+from app.llm.providers import (AliyunProvider, AsyncGeminiClient, GeminiProvider, aclose_llm_clients,
+                               get_provider_config, reset_llm_clients)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.setattr(AliyunProvider, '__api_key__', 'test-key')
+    monkeypatch.setattr(GeminiProvider, '__api_key__', 'test-key')
+    reset_llm_clients()
+    yield
+    reset_llm_clients()
+
+
+def gemini_body(text):
+    return {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+
+
+def gemini_client(handler):
+    return AsyncGeminiClient(api_key='test-key', base_url='https://gemini.test/v1beta',
+                             transport=httpx.MockTransport(handler))
+
+
+def test_async_gemini_client_create_and_stream():
+    """测试异步 Gemini 客户端的普通请求和流式请求"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path.endswith(':streamGenerateContent'):
+            body = '[' + ',\r\n'.join(json.dumps(gemini_body(text)) for text in ('Hello', ', {world}')) + ']'
+            return httpx.Response(200, content=body.encode())
+        return httpx.Response(200, json=gemini_body('Hi'))
+
+    async def run():
+        client = gemini_client(handler)
+        messages = [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': 'Hello'}]
+        response = await client.chat.completions.create(model='gemini-test', messages=messages)
+        stream = await client.chat.completions.create(model='gemini-test', messages=messages, stream=True)
+        chunks = [chunk.choices[0].delta.content async for chunk in stream]
+        await client.close()
+        return response.choices[0].message.content, chunks
+
+    content, chunks = asyncio.run(run())
+    assert content == 'Hi'
+    assert chunks == ['Hello', ', {world}']
+    assert requests[0].url.path == '/v1beta/models/gemini-test:generateContent'
+    assert requests[0].headers['x-goog-api-key'] == 'test-key'
+    assert json.loads(requests[0].content)['contents'] == [{'parts': [{'text': 'Be brief.\n\nHello'}]}]
+
+
+def test_async_gemini_client_wraps_http_errors():
+    """测试 HTTP 错误与同步客户端一样包装为异常"""
+    async def run():
+        client = gemini_client(lambda request: httpx.Response(500, json={}))
+        try:
+            await client.chat.completions.create(model='gemini-test', messages=[{'role': 'user', 'content': 'x'}])
+        finally:
+            await client.close()
+
+    with pytest.raises(Exception, match='Gemini API request failed'):
+        asyncio.run(run())
+
+
+def test_get_async_llm_reuses_clients_within_event_loop():
+    """测试同一事件循环内复用异步客户端，新的事件循环重新创建"""
+    async def clients():
+        aliyun, gemini = get_provider_config('aliyun'), get_provider_config('gemini')
+        result = (aliyun.get_async_llm(), gemini.get_async_llm())
+        assert aliyun.get_async_llm() is result[0]
+        assert gemini.get_async_llm() is result[1]
+        assert gemini.get_async_llm(timeout=30) is not result[1]
+        await aclose_llm_clients()
+        return result
+
+    first = asyncio.run(clients())
+    second = asyncio.run(clients())
+    assert first[0] is not second[0]
+    assert first[1] is not second[1]
+    assert type(first[0]).__name__ == 'AsyncOpenAI'
+
+
+def test_generate_texts_fans_out_with_concurrency_limit(monkeypatch):
+    """测试批量生成时并发请求不超过上限，结果按输入顺序返回"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        prompt = json.loads(request.content)['contents'][0]['parts'][0]['text']
+        return httpx.Response(200, json=gemini_body(prompt.upper()))
+
+    monkeypatch.setattr(GeminiProvider, 'get_async_llm', lambda self: gemini_client(handler))
+    prompts = [f'prompt {i}' for i in range(40)]
+    results = asyncio.run(llm.generate_texts(prompts, provider='gemini', concurrency=8))
+    assert results == [prompt.upper() for prompt in prompts]
+    assert peak == 8
+
+
+def test_generate_text_uses_async_openai_client(monkeypatch):
+    """测试 OpenAI 兼容提供者通过 AsyncOpenAI 请求，不阻塞事件循环"""
+    from openai import AsyncOpenAI
+
+    def handler(request):
+        assert request.url.path == '/v1/chat/completions'
+        return httpx.Response(200, json={
+            'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'qwen-max',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': 'pong'}}],
+        })
+
+    monkeypatch.setattr(AliyunProvider, 'get_async_llm', lambda self: AsyncOpenAI(
+        api_key='test-key', base_url='https://aliyun.test/v1',
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))))
+    assert asyncio.run(llm.generate_text('ping')) == 'pong'
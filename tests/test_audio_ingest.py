@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from app.ingest import AudioStore
+
+
+def _make_store(tmp_path):
+    return AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'),
+                      db_path=str(tmp_path / 'store.sqlite3'))
+
+
+def test_ingest_deduplicates_identical_audio(tmp_path):
+    """测试相同内容的音频只保存一份，并复用已有字幕"""
+    store = _make_store(tmp_path)
+    content = os.urandom(3 * 1024 * 1024 + 17)
+
+    first = store.ingest_stream(io.BytesIO(content), 'ET3/disc1/01 Hello.mp3')
+    assert first['sha256'] == hashlib.sha256(content).hexdigest()
+    assert first['size'] == len(content)
+    assert first['deduplicated'] is False
+
+    subtitle_dir = tmp_path / 'subtitles' / 'ET3' / 'disc1'
+    subtitle_dir.mkdir(parents=True)
+    (subtitle_dir / '01 Hello.srt').write_text('1\n00:00:00,000 --> 00:00:01,000\nHello\n')
+
+    second = store.ingest_chunks([content[:1000], content[1000:]], 'ET4/disc2/Track 1.mp3')
+    assert second['deduplicated'] is True
+    first_stat = os.stat(tmp_path / 'audios' / 'ET3' / 'disc1' / '01 Hello.mp3')
+    second_stat = os.stat(tmp_path / 'audios' / 'ET4' / 'disc2' / 'Track 1.mp3')
+    assert first_stat.st_ino == second_stat.st_ino
+
+    assert store.reuse_subtitles('ET4/disc2/Track 1.mp3') is True
+    reused = tmp_path / 'subtitles' / 'ET4' / 'disc2' / 'Track 1.srt'
+    assert reused.read_text().endswith('Hello\n')
+
+    # 不留下临时文件
+    assert sorted(os.listdir(tmp_path / 'audios' / 'ET4' / 'disc2')) == ['Track 1.mp3']
+
+
+def test_ingest_rejects_path_traversal(tmp_path):
+    """测试非法路径被拒绝"""
+    store = _make_store(tmp_path)
+    with pytest.raises(ValueError):
+        store.ingest_stream(io.BytesIO(b'data'), '../outside.mp3')
+
+
+def test_ensure_hash_for_synced_files(tmp_path):
+    """测试 rsync 同步进来的文件按需计算哈希"""
+    store = _make_store(tmp_path)
+    disc = tmp_path / 'audios' / 'ET3' / 'disc1'
+    disc.mkdir(parents=True)
+    (disc / '02.mp3').write_bytes(b'abc')
+
+    assert store.ensure_hash('ET3/disc1/02.mp3') == hashlib.sha256(b'abc').hexdigest()
+    assert store.ensure_hash('ET3/disc1/missing.mp3') is None
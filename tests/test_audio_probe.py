@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+
+from app import audio_probe
+from app.audio_probe import AudioProbe, probe_file
+from app.library import LibraryIndex
+
+# MPEG-1 Layer III，128 kbps，44.1 kHz，立体声；每帧 417 字节
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def _write_mp3(path, frames=300):
+    """写入带 ID3v2 标签的固定码率 MP3"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10)
+        f.write(MP3_FRAME * frames)
+
+
+def _atom(kind, payload):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def test_probe_cbr_mp3(tmp_path):
+    """测试按帧头和音频数据大小计算固定码率 MP3 的时长"""
+    path = str(tmp_path / '01.mp3')
+    _write_mp3(path)
+    meta = probe_file(path)
+    assert meta['prober'] == 'header'
+    assert meta['codec'] == 'mp3'
+    assert meta['bitrate'] == 128000
+    assert (meta['sample_rate'], meta['channels']) == (44100, 2)
+    assert meta['duration_ms'] == 300 * 417 * 8 * 1000 // 128000
+
+
+def test_probe_m4a_movie_header(tmp_path):
+    """测试从 moov/mvhd 读取 M4A 时长"""
+    mvhd = _atom(b'mvhd', b'\x00' * 4 + b'\x00' * 8 + struct.pack('>II', 1000, 65000) + b'\x00' * 80)
+    path = tmp_path / '01.m4a'
+    path.write_bytes(_atom(b'ftyp', b'M4A \x00\x00\x00\x00') + _atom(b'moov', mvhd))
+    meta = probe_file(str(path))
+    assert meta['duration_ms'] == 65000
+
+
+def test_probe_caches_by_size_and_mtime(tmp_path, monkeypatch):
+    """测试每个文件只探测一次，文件变化后重新探测"""
+    audio_root = tmp_path / 'audios'
+    _write_mp3(str(audio_root / 'ET3' / 'disc1' / '01.mp3'))
+    _write_mp3(str(audio_root / 'ET3' / 'disc1' / '02.mp3'), frames=600)
+    (audio_root / 'ET3' / 'disc1' / '03.mp3').write_bytes(b'not audio')
+    monkeypatch.setattr(audio_probe, 'FFPROBE_PATH', None)
+
+    probed = []
+    original = audio_probe._probe_batch
+    monkeypatch.setattr(audio_probe, '_probe_batch', lambda paths: probed.extend(paths) or original(paths))
+
+    index = LibraryIndex(str(audio_root), str(tmp_path / 'subtitles'), db_path=str(tmp_path / 'library.sqlite3'),
+                         sync_interval=3600, prober=AudioProbe(str(audio_root), db_path=str(tmp_path / 'library.sqlite3')))
+    # 首次请求只扫描目录，元数据在后台线程中探测
+    assert [t['duration_ms'] for t in index.get_tracks('ET3', 'disc1')] == [None, None, None]
+    index._sync_thread.join()
+    tracks = index.get_tracks('ET3', 'disc1')
+    assert [t['duration_ms'] for t in tracks] == [7818, 15637, None]
+    assert tracks[0]['codec'] == 'mp3'
+    assert index.get_durations() == {'ET3': {'disc1': {'01.mp3': 7818, '02.mp3': 15637}}}
+    assert len(probed) == 3
+
+    # 已缓存（包括无法解析的文件）时不重新探测，同步也不更新 generation
+    probed.clear()
+    index.refresh_disc('ET3', 'disc1')
+    assert probed == []
+    generation = index._generation()
+    assert index.sync() is False and index.sync() is False
+    assert probed == [] and index._generation() == generation
+
+    # 新增的文件无法解析：探测一次，列表不变时不更新 generation
+    (audio_root / 'ET3' / 'disc1' / '04.mp3').write_bytes(b'still not audio')
+    index.refresh_disc('ET3', 'disc1')
+    generation = index._generation()
+    probed.clear()
+    assert index.sync() is False
+    assert probed == [] and index._generation() == generation
+
+    # 文件被替换后只重新探测该文件
+    path = str(audio_root / 'ET3' / 'disc1' / '01.mp3')
+    _write_mp3(path, frames=150)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    index.refresh_disc('ET3', 'disc1')
+    assert probed == [path]
+    assert index.get_tracks('ET3', 'disc1')[0]['duration_ms'] == 3909
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from app import batch_subtitles
+from app.batch_subtitles import BatchSubtitleGenerator, public_audio_url
+from app.llm import volcano_audio
+from app.llm.cue_store import CueStore
+from app.task_store import TaskStore
+
+SRT = "1\n00:00:00,000 --> 00:00:01,000\nhello\n\n"
+
+
+class FakePoller:
+    """立即返回识别结果的 ASR 轮询器，disc2/02.mp3 识别失败"""
+
+    def __init__(self):
+        self.urls = []
+        self.timeouts = []
+
+    def submit(self, url, timeout=None):
+        self.urls.append(url)
+        self.timeouts.append(timeout)
+        future = Future()
+        if url.endswith('disc2/02.mp3'):
+            future.set_exception(RuntimeError('ASR 任务失败'))
+        else:
+            future.set_result({'utterances': [{'text': 'hello', 'start_time': 0, 'end_time': 1000}]})
+        return future
+
+
+@pytest.fixture
+def library(tmp_path):
+    for disc in ('disc1', 'disc2'):
+        os.makedirs(tmp_path / 'audios' / 'ET3' / disc)
+        for track in ('01.mp3', '02.mp3'):
+            (tmp_path / 'audios' / 'ET3' / disc / track).write_bytes(b'audio')
+    (tmp_path / 'audios' / 'ET3' / 'disc1' / 'notes.txt').write_text('x')
+    return tmp_path
+
+
+def test_batch_generates_missing_and_resumes(library, monkeypatch):
+    """测试只为缺失的字幕调用 ASR/LLM，重新执行时全部跳过"""
+    llm_calls = []
+    poller = FakePoller()
+
+    def fake_llm(srt):
+        llm_calls.append(srt)
+        return srt.replace('hello', 'Hello.')
+
+    monkeypatch.setattr(batch_subtitles, 'optimize_subtitles_with_llm', fake_llm)
+
+    subtitles = library / 'subtitles' / 'ET3' / 'disc1'
+    os.makedirs(subtitles)
+    (subtitles / '01.srt').write_text(SRT)
+    (subtitles / '01.optimized.srt').write_text(SRT)
+
+    tasks = TaskStore('subtitle_optimization', db_path=str(library / 'tasks.sqlite3'))
+    discs_done = []
+    generator = BatchSubtitleGenerator(str(library / 'audios'), str(library / 'subtitles'), concurrency=3,
+                                       asr_concurrency=2, poller=poller, asr_input='url',
+                                       audio_base_url='https://example.com/audios', task_store=tasks,
+                                       on_disc_done=lambda book, disc: discs_done.append(disc))
+
+    summary = generator.run(['ET3'])
+    assert summary['total'] == 4
+    assert summary['srt'] == {'skipped': 1, 'generated': 2, 'failed': 1}
+    assert summary['optimized'] == {'skipped': 1, 'generated': 2, 'failed': 1}
+    assert [f['track'] for f in summary['failed']] == ['ET3/disc2/02.mp3']
+    assert len(poller.urls) == 3 and len(llm_calls) == 2
+    assert sorted(discs_done) == ['disc1', 'disc2']
+    assert (library / 'subtitles' / 'ET3' / 'disc2' / '01.optimized.srt').read_text().endswith('Hello.\n')
+    assert tasks.get('ET3_disc2_01.mp3')['status'] == 'completed'
+
+    # 续跑：只有失败的音轨会再次调用 ASR
+    poller.urls.clear()
+    summary = generator.run(['ET3/disc2'])
+    assert poller.urls == ['https://example.com/audios/ET3/disc2/02.mp3']
+    assert summary['srt'] == {'skipped': 1, 'failed': 1}
+
+
+def test_find_tracks_validates_targets(library):
+    """测试目标校验和 URL 编码"""
+    generator = BatchSubtitleGenerator(str(library / 'audios'), str(library / 'subtitles'))
+    assert generator.find_tracks(['ET3/disc1']) == [('ET3', 'disc1', '01.mp3'), ('ET3', 'disc1', '02.mp3')]
+    with pytest.raises(ValueError):
+        generator.find_tracks(['ET4'])
+    with pytest.raises(ValueError):
+        generator.find_tracks(['ET3/../..'])
+    assert public_audio_url('ET3', 'disc1', '04 曲目 4.mp3', 'https://a/b/') == \
+        'https://a/b/ET3/disc1/04%20%E6%9B%B2%E7%9B%AE%204.mp3'
+
+
+def test_batch_uploads_local_files(library, monkeypatch):
+    """测试本地识别模式直接上传文件，不经过轮询器，词级时间写入 JSON"""
+    uploaded = []
+
+    def fake_transcribe(audio_url, audio_path, duration_ms=None, sample_rate=None, asr_input=None):
+        uploaded.append(os.path.relpath(audio_path, str(library / 'audios')))
+        cues = CueStore()
+        cues.append(0, 1000, 'hello', words=[(0, 800, 'hello')])
+        return cues, 'dashscope'
+
+    monkeypatch.setattr(batch_subtitles, 'transcribe_audio', fake_transcribe)
+    poller = FakePoller()
+    generator = BatchSubtitleGenerator(str(library / 'audios'), str(library / 'subtitles'), poller=poller,
+                                       optimize=False, asr_input='local')
+    summary = generator.run(['ET3/disc1'])
+    assert summary['srt'] == {'generated': 2}
+    assert sorted(uploaded) == ['ET3/disc1/01.mp3', 'ET3/disc1/02.mp3']
+    assert poller.urls == []
+    assert '[0,800,"hello"]' in (library / 'subtitles' / 'ET3' / 'disc1' / '01.json').read_text()
+
+
+def test_batch_local_input_overrides_module_default(library, monkeypatch):
+    """测试批量任务的 asr_input='local' 传到 transcribe_audio，即使全局 ASR_INPUT 是 url 也上传本地文件"""
+    uploaded = []
+
+    def fake_dashscope(audio_path, sample_rate=None, language_hints=None):
+        uploaded.append(os.path.basename(audio_path))
+        cues = CueStore()
+        cues.append(0, 1000, 'hello')
+        return cues
+
+    def no_url_asr():
+        raise AssertionError('不应使用公开 URL 识别')
+
+    monkeypatch.setattr(volcano_audio, 'ASR_INPUT', 'url')
+    monkeypatch.setattr(batch_subtitles, 'ASR_INPUT', 'url')
+    monkeypatch.setattr(volcano_audio, 'transcribe_file_with_dashscope', fake_dashscope)
+    monkeypatch.setattr(volcano_audio, 'VolcanoAudioProvider', no_url_asr)
+    poller = FakePoller()
+    generator = BatchSubtitleGenerator(str(library / 'audios'), str(library / 'subtitles'), poller=poller,
+                                       optimize=False, asr_input='local')
+    summary = generator.run(['ET3/disc1'])
+    assert summary['srt'] == {'generated': 2}
+    assert sorted(uploaded) == ['01.mp3', '02.mp3']
+    assert poller.urls == []
+
+
+def test_preferred_asr_follows_input_and_format(monkeypatch):
+    """测试默认使用火山引擎公开 URL 识别；local 模式下只有支持本地识别的格式换成 DashScope"""
+    if 'ASR_INPUT' not in os.environ:
+        assert volcano_audio.ASR_INPUT == 'url'
+    monkeypatch.setattr(batch_subtitles, 'ASR_INPUT', 'url')
+    assert BatchSubtitleGenerator('/tmp/a', '/tmp/s')._preferred_asr('a.mp3') == 'volcano'
+    generator = BatchSubtitleGenerator('/tmp/a', '/tmp/s', asr_input='local')
+    assert generator._preferred_asr('a.mp3') == 'dashscope'
+    assert generator._preferred_asr('a.m4a') == 'volcano'
+
+
+def test_importing_app_does_not_recover_tasks(monkeypatch):
+    """测试导入 app（命令行工具）时不接管遗留任务，Web 进程在第一个请求前接管一次"""
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, '-c', 'import app.batch_subtitles, app; print(app._recovered)'],
+                               cwd=root, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip().splitlines()[-1] == 'False'
+
+    import app as app_module
+    calls = []
+    monkeypatch.setattr(app_module, '_recovered', False)
+    monkeypatch.setattr(app_module.url_importer, 'recover', lambda: calls.append('imports'))
+    monkeypatch.setattr(app_module.optimization_tasks, 'expire_stale', lambda: calls.append('tasks'))
+    client = app_module.app.test_client()
+    client.get('/api/check-optimized-subtitle')
+    client.get('/api/check-optimized-subtitle')
+    assert calls == ['imports', 'tasks']
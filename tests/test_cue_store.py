@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from app.llm.cue_store import CueStore, format_srt_time, iter_srt_cues, load_cue_store, parse_srt_time
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+[A] Hello there.
+
+2
+00:00:03,000 --> 00:00:04,000
+[B] Hi!
+
+3
+01:02:03,004 --> 01:02:05,000
+Bye.
+"""
+
+
+def test_parse_lookup_and_roundtrip():
+    """测试解析、按时间二分查找和序列化回 SRT"""
+    cues = CueStore.from_srt(SRT)
+    assert len(cues) == 3
+    assert cues.starts.typecode == 'q'
+    assert cues[0] == (1000, 2500, 'Hello there.', 'A')
+    assert cues[2].start_ms == parse_srt_time('01:02:03,004') == 3723004
+
+    assert cues.cue_at(999) is None
+    assert cues.cue_at(1000).text == 'Hello there.'
+    assert cues.cue_at(2700) is None
+    assert cues.index_at(3500) == 1
+    assert cues.cue_at(10 ** 9) is None
+
+    assert cues.to_srt() == SRT
+    assert CueStore.from_entries(cues.to_entries()).to_srt() == SRT
+
+
+def test_shift_and_sort():
+    """测试整体平移时间轴和乱序条目排序"""
+    cues = CueStore.from_entries([
+        {'start_ms': 5000, 'end_ms': 6000, 'text': 'b'},
+        {'start_time': '00:00:01,000', 'end_time': '00:00:02,000', 'text': 'a', 'speaker': 'A'},
+        {'start_time': 'bad', 'end_time': '00:00:02,000', 'text': 'dropped'},
+        {'start_ms': 7000, 'end_ms': 8000, 'text': '  '},
+    ])
+    assert [cue.text for cue in cues] == ['a', 'b']
+
+    cues.shift(-1500)
+    assert list(cues.starts) == [0, 3500]
+    assert cues.cue_at(4000).text == 'b'
+    assert format_srt_time(3723004) == '01:02:03,004'
+
+
+def test_lookup_finds_earlier_long_cue():
+    """测试条目时间重叠时，较早开始的长条目在后续短条目结束后仍能找到"""
+    cues = CueStore.from_entries([
+        {'start_ms': 3000, 'end_ms': 4000, 'text': 'c'},
+        {'start_ms': 0, 'end_ms': 10000, 'text': 'long'},
+        {'start_ms': 1000, 'end_ms': 2000, 'text': 'b'},
+    ])
+    assert cues.cue_at(1500).text == 'b'
+    assert cues.cue_at(3500).text == 'c'
+    assert cues.cue_at(5000).text == 'long'
+    assert cues.cue_at(10000) is None
+
+    cues.append(12000, 13000, 'd')
+    assert cues.cue_at(11000) is None and cues.cue_at(12500).text == 'd'
+
+    # 平移末尾一段后，前面的长条目不再覆盖这些时刻
+    cues.shift(-1500, 3)
+    assert cues.cue_at(9000).text == 'long'
+    assert cues.cue_at(10500).text == 'd'
+
+    tail = cues.slice(2, 4)
+    assert tail.cue_at(5000) is None and tail.cue_at(3500).text == 'c'
+
+
+def test_load_cue_store_cache_invalidation(tmp_path):
+    """测试缓存在文件修改后失效"""
+    path = tmp_path / 'a.srt'
+    path.write_text(SRT, encoding='utf-8')
+    first = load_cue_store(str(path))
+    assert load_cue_store(str(path)) is first
+
+    path.write_text(SRT.replace('Bye.', 'Goodbye.'), encoding='utf-8')
+    os.utime(path, ns=(1, 1))
+    assert load_cue_store(str(path))[2].text == 'Goodbye.'
+    assert load_cue_store(str(tmp_path / 'missing.srt')) is None
+
+
+def test_streaming_parser_tolerates_malformed_input(tmp_path):
+    """测试 CRLF、BOM、序号缺失/不连续、缺少空行、多行文本和文件对象输入"""
+    messy = ('﻿1\r\n00:00:01,000 --> 00:00:02,000\r\n[A] Hello\r\n\r\n'
+             '7\r\n00:00:03,000 --> 00:00:04,000 X1:0 X2:10\r\nline one\r\n2024\r\nline two\r\n'
+             '9\r\n00:00:05,000 --> 00:00:06,000\r\nno blank line before me\r\n\r\n\r\n'
+             '00:00:07.5 --> 00:00:08,000\r\nno index\r\n'
+             '10\r\nbroken --> timing\r\nskipped\r\n\r\n'
+             '11\r\n00:00:09,000 --> 00:00:10,000\r\n42')
+    expected = [(1000, 2000, 'Hello'), (3000, 4000, 'line one\n2024\nline two'),
+                (5000, 6000, 'no blank line before me'), (7500, 8000, 'no index'), (9000, 10000, '42')]
+
+    cues = CueStore.from_srt(messy)
+    assert [(c.start_ms, c.end_ms, c.text) for c in cues] == expected
+    assert cues[0].speaker == 'A'
+
+    path = tmp_path / 'messy.srt'
+    path.write_bytes(messy.encode('utf-8'))
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        assert [(c.start_ms, c.end_ms, c.text) for c in CueStore.from_srt(f)] == expected
+    assert list(iter_srt_cues(iter(SRT.splitlines(keepends=True))))[1] == (3000, 4000, '[B] Hi!')
+
+
+def test_vtt_and_json_serialization():
+    """测试 WebVTT / JSON 序列化，以及词级时间按时间分配给合并后的条目"""
+    cues = CueStore.from_srt(SRT)
+    assert cues.to_vtt().startswith('WEBVTT\n\n00:00:01.000 --> 00:00:02.500\n<v A>Hello there.\n')
+
+    cues.assign_words([(1000, 1400, 'Hello'), (1500, 2400, 'there.'), (3000, 3500, 'Hi!'), (2600, 2700, 'um')])
+    restored = CueStore.from_json(cues.to_json())
+    assert list(restored) == list(cues)
+    assert restored.words == [[(1000, 1400, 'Hello'), (1500, 2400, 'there.')], [(3000, 3500, 'Hi!')], None]
+    assert '"cues":[[1000,2500,"Hello there.","A",[[1000,1400,"Hello"]' in cues.to_json()
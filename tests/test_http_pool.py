@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+from flask import Flask, jsonify
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app.llm.gemini_ocr import GeminiOCRProvider
+from app.llm.http_pool import HttpPool
+from app.llm.providers import GeminiClient
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+@pytest.fixture
+def gemini_server():
+    """在随机端口启动返回固定内容的 generateContent 接口（支持 HTTP/1.1 长连接）"""
+    app = Flask(__name__)
+
+    @app.route('/v1beta/models/<model>:generateContent', methods=['POST'])
+    def generate(model):
+        return jsonify({'candidates': [{'content': {'parts': [{'text': f'hi from {model}'}]}}]})
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1beta"
+    server.shutdown()
+
+
+def test_gemini_requests_reuse_pooled_connections(gemini_server, monkeypatch):
+    """测试作文批改和 OCR 共享连接池，多线程并发时连接数不超过池大小"""
+    pool = HttpPool(maxsize=2, block=True)
+    client = GeminiClient(api_key='dummy', base_url=gemini_server, http_pool=pool)
+
+    def call():
+        for _ in range(5):
+            response = client.chat.completions.create(model='m', messages=[{'role': 'user', 'content': 'x'}])
+            assert response.choices[0].message.content == 'hi from m'
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    monkeypatch.setenv('GOOGLE_API_KEY', 'dummy')
+    ocr = GeminiOCRProvider()
+    ocr.api_base, ocr.model, ocr.http_pool = gemini_server, 'ocr', pool
+    assert ocr.recognize_image_from_base64('aGk=')['text'] == 'hi from ocr'
+
+    stats = pool.stats()
+    assert stats['requests'] == 21 and stats['errors'] == 0
+    assert stats['connections'] <= 2
+    assert stats['reuse_rate'] >= 0.9
+    host = stats['hosts'][gemini_server.rsplit('/', 1)[0]]
+    assert host['requests'] == 21 and host['idle'] <= 2
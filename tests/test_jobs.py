@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from app.jobs import (BoundedExecutor, QueueFullError, parse_priority,
+                      PRIORITY_INTERACTIVE, PRIORITY_PREFETCH)
+
+
+def _blocked_executor(max_queue=10):
+    """单线程执行器，第一个任务阻塞到 release 被设置"""
+    executor = BoundedExecutor('test', max_workers=1, max_queue=max_queue)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    executor.submit(blocker, name='blocker')
+    assert started.wait(5)
+    return executor, release
+
+
+def test_priority_order_and_introspection():
+    """测试正在播放的任务先于预取任务执行，并可查询排队状态"""
+    executor, release = _blocked_executor()
+    order = []
+
+    executor.submit(order.append, 'prefetch-1', priority=PRIORITY_PREFETCH)
+    executor.submit(order.append, 'prefetch-2', priority=PRIORITY_PREFETCH)
+    last = executor.submit(order.append, 'playing', priority=PRIORITY_INTERACTIVE)
+
+    stats = executor.stats()
+    assert [job['name'] for job in stats['running']] == ['blocker']
+    assert [job['priority'] for job in stats['queued']] == [PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_PREFETCH]
+
+    release.set()
+    prefetch_done = executor.submit(order.append, 'tail', priority=PRIORITY_PREFETCH)
+    assert prefetch_done.done.wait(5) and last.done.wait(5)
+    assert order == ['playing', 'prefetch-1', 'prefetch-2', 'tail']
+    assert executor.stats()['finished'][0]['status'] == 'completed'
+
+
+def test_queue_limit_and_reprioritize():
+    """测试队列上限，以及相同 key 的任务重复提交时提升优先级而不是新增任务"""
+    executor, release = _blocked_executor(max_queue=2)
+    order = []
+
+    executor.submit(order.append, 'a', priority=PRIORITY_PREFETCH, key='a')
+    b = executor.submit(order.append, 'b', priority=PRIORITY_PREFETCH, key='b')
+    with pytest.raises(QueueFullError):
+        executor.submit(order.append, 'c')
+
+    assert executor.submit(order.append, 'b', priority=PRIORITY_INTERACTIVE, key='b') is b
+    assert len(executor.stats()['queued']) == 2
+
+    release.set()
+    assert b.done.wait(5)
+    executor.submit(order.append, 'end', priority=PRIORITY_PREFETCH).done.wait(5)
+    assert order == ['b', 'a', 'end']
+
+
+def test_failed_job_and_parse_priority():
+    """测试任务异常记录为 failed，以及优先级参数解析"""
+    executor = BoundedExecutor('test', max_workers=1, max_queue=1)
+
+    def boom():
+        raise RuntimeError('boom')
+
+    job = executor.submit(boom)
+    assert job.done.wait(5)
+    assert job.status == 'failed' and job.error == 'boom'
+
+    assert parse_priority('prefetch') == PRIORITY_PREFETCH
+    assert parse_priority('3') == 3
+    with pytest.raises(ValueError):
+        parse_priority('urgent')
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from app.llm.json_stream import JsonArrayStreamDecoder, iter_json_array
+
+OBJECTS = [
+    {'candidates': [{'content': {'parts': [{'text': 'Use {braces} and [brackets] freely.'}]}}]},
+    {'candidates': [{'content': {'parts': [{'text': 'Escaped \\"quote\\" and backslash \\\\ } {'}]}}]},
+    {'candidates': [{'content': {'parts': [{'text': '中文内容：批改意见'}]}}], 'usageMetadata': {'total': 3}},
+]
+STREAM = '[' + ',\r\n'.join(json.dumps(obj, ensure_ascii=False) for obj in OBJECTS) + ']'
+
+
+def test_decoder_handles_braces_inside_strings_at_any_split():
+    """测试字符串内的括号和转义字符不影响计数，任意位置切分结果都相同"""
+    for split in range(len(STREAM) + 1):
+        decoder = JsonArrayStreamDecoder()
+        values = decoder.feed(STREAM[:split]) + decoder.feed(STREAM[split:])
+        assert values == OBJECTS, split
+        assert decoder.done
+
+
+def test_decoder_yields_each_object_when_it_closes():
+    """测试每个对象闭合时立即产出，不等待数组结束"""
+    decoder = JsonArrayStreamDecoder()
+    first = json.dumps(OBJECTS[0])
+    assert decoder.feed('[' + first[:-1]) == []
+    assert decoder.feed('}') == [OBJECTS[0]]
+    assert decoder.feed(',' + json.dumps(OBJECTS[1])) == [OBJECTS[1]]
+    assert not decoder.done
+
+
+def test_iter_json_array_decodes_split_multibyte_characters():
+    """测试字节流中被切开的多字节字符"""
+    data = STREAM.encode('utf-8')
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert list(iter_json_array(chunks)) == OBJECTS
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = """
+import sys
+import app
+loaded = [name for name in ('openai', 'dashscope', 'llama_index') if name in sys.modules]
+print(','.join(loaded))
+"""
+
+
+def test_import_app_does_not_load_llm_sdks():
+    """测试导入应用时不加载 LLM SDK，也不需要 API Key"""
+    env = {key: value for key, value in os.environ.items() if not key.endswith('_API_KEY')}
+    completed = subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == ''
+
+
+def test_default_llm_is_created_on_first_use(monkeypatch):
+    """测试 default_llm 在第一次访问时才创建，并复用缓存的客户端"""
+    import app.llm as llm
+    from app.llm.providers import AliyunProvider, reset_llm_clients
+    monkeypatch.setattr(AliyunProvider, '__api_key__', 'test-key')
+    reset_llm_clients()
+    assert llm.get_default_llm() is llm.get_default_llm()
+    assert llm.default_llm is llm.get_default_llm()
+    reset_llm_clients()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+from app.library import LibraryIndex
+
+
+def _touch(path, content=b'ID3'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _bump_mtime(path):
+    """网络存储/部分文件系统的 mtime 精度较低，测试中手动推进目录 mtime"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_library_index_incremental_sync(tmp_path):
+    """测试音频库索引的构建和增量更新"""
+    audio_root = tmp_path / 'audios'
+    subtitle_root = tmp_path / 'subtitles'
+    _touch(str(audio_root / 'ET3' / 'disc1' / '02 b.mp3'))
+    _touch(str(audio_root / 'ET3' / 'disc1' / '01 a.mp3'))
+    _touch(str(audio_root / 'ET3' / 'disc1' / 'notes.txt'))
+    _touch(str(subtitle_root / 'ET3' / 'disc1' / '01 a.srt'))
+
+    index = LibraryIndex(str(audio_root), str(subtitle_root),
+                         db_path=str(tmp_path / 'library.sqlite3'), sync_interval=3600)
+
+    assert index.get_tree() == {'ET3': {'disc1': ['01 a.mp3', '02 b.mp3']}}
+    tracks = index.get_tracks('ET3', 'disc1')
+    assert [t['has_subtitle'] for t in tracks] == [True, False]
+
+    # 没有变化时不重新扫描
+    assert index.sync() is False
+
+    # 新增音轨和字幕
+    _touch(str(audio_root / 'ET3' / 'disc1' / '03 c.m4a'))
+    _bump_mtime(str(audio_root / 'ET3' / 'disc1'))
+    _touch(str(subtitle_root / 'ET3' / 'disc1' / '02 b.optimized.srt'))
+    _bump_mtime(str(subtitle_root / 'ET3' / 'disc1'))
+    assert index.sync() is True
+    tracks = index.get_tracks('ET3', 'disc1')
+    assert [t['filename'] for t in tracks] == ['01 a.mp3', '02 b.mp3', '03 c.m4a']
+    assert tracks[1]['has_optimized'] is True
+
+    # 新增光盘通过 refresh_disc 立即可见
+    _touch(str(audio_root / 'ET3' / 'disc2' / '01 x.mp3'))
+    index.refresh_disc('ET3', 'disc2')
+    assert index.get_tree()['ET3']['disc2'] == ['01 x.mp3']
+
+
+def test_library_index_removes_deleted_disc(tmp_path):
+    """测试删除光盘目录后索引同步删除"""
+    audio_root = tmp_path / 'audios'
+    _touch(str(audio_root / 'ET4' / 'disc1' / '01.mp3'))
+    _touch(str(audio_root / 'ET4' / 'disc2' / '01.mp3'))
+
+    index = LibraryIndex(str(audio_root), str(tmp_path / 'subtitles'),
+                         db_path=str(tmp_path / 'library.sqlite3'), sync_interval=3600)
+    assert set(index.get_tree()['ET4']) == {'disc1', 'disc2'}
+
+    os.remove(str(audio_root / 'ET4' / 'disc2' / '01.mp3'))
+    os.rmdir(str(audio_root / 'ET4' / 'disc2'))
+    _bump_mtime(str(audio_root / 'ET4'))
+    assert index.sync() is True
+    assert set(index._load()['tree']['ET4']) == {'disc1'}
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as d:
+        start = time.time()
+        test_library_index_incremental_sync(pathlib.Path(d))
+        print(f"🏁 测试完成! ({time.time() - start:.3f}s)")
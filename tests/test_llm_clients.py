@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from app.llm import providers
+from app.llm.providers import (AliyunProvider, GeminiProvider, SiliconFlowProvider, get_provider_config,
+                               reset_llm_clients)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    # API Key 在导入时读取环境变量（SiliconFlow 为 SILICON_FLOW_API_KEY），测试不依赖本机配置
+    for provider in (AliyunProvider, GeminiProvider, SiliconFlowProvider):
+        monkeypatch.setattr(provider, '__api_key__', 'test-key')
+    reset_llm_clients()
+    yield
+    reset_llm_clients()
+
+
+def test_get_llm_reuses_clients_per_provider_and_timeout():
+    """测试相同提供者和超时复用同一个客户端，参数不同时分别创建"""
+    aliyun = get_provider_config('aliyun')
+    client = aliyun.get_llm()
+    assert aliyun.get_llm() is client
+    assert get_provider_config('aliyun').get_llm() is client
+    assert aliyun.get_llm(timeout=180) is not client
+    assert aliyun.get_llm(timeout=180) is aliyun.get_llm(timeout=180)
+    assert get_provider_config('siliconflow').get_llm() is not client
+
+    gemini = get_provider_config('gemini')
+    assert gemini.get_llm() is gemini.get_llm()
+    assert gemini.get_llm(timeout=30) is not gemini.get_llm()
+
+    reset_llm_clients()
+    assert aliyun.get_llm() is not client
+
+
+def test_get_llm_recreates_clients_after_fork(monkeypatch):
+    """测试 fork 之后（进程号变化）不复用父进程的客户端"""
+    client = get_provider_config('gemini').get_llm()
+    monkeypatch.setattr(providers.os, 'getpid', lambda: os.getppid() + 100000)
+    child_client = get_provider_config('gemini').get_llm()
+    assert child_client is not client
+    assert child_client.http_pool is not client.http_pool
+    assert get_provider_config('gemini').get_llm() is child_client
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.llm import volcano_audio
+from app.llm.volcano_audio import (_snap_spans, entries_to_srt, optimize_subtitles_incremental,
+                                   optimize_subtitles_with_llm, parse_srt_to_entries, split_into_windows)
+
+PEOPLE = ['tom', 'amy', 'bob']
+
+
+def _make_srt(count):
+    entries = []
+    for i in range(count):
+        start = i * 2000 + (700 if i % 7 == 0 else 0)
+        entries.append({
+            'start_time': volcano_audio.VolcanoAudioProvider()._format_time(start),
+            'end_time': volcano_audio.VolcanoAudioProvider()._format_time(start + 1500),
+            'text': f"{PEOPLE[(i // 3) % 3]} line {i}",
+        })
+    return entries_to_srt(entries)
+
+
+class FakeLLM:
+    """每个窗口里按出现顺序给说话人编号 A/B/C，模拟各窗口标记不一致"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature, max_tokens):
+        with self.lock:
+            self.calls += 1
+        labels = {}
+        lines = []
+        for number, start, end, text in re.findall(r'^(\d+)\. \[(\S+) --> (\S+)\] (.+)$',
+                                                   messages[1]['content'], re.MULTILINE):
+            person = text.split()[0]
+            if person not in labels:
+                labels[person] = 'ABC'[len(labels)]
+            label = labels[person]
+            lines.append(f"{number}. [{start} --> {end}] [{label}] {text.capitalize()}.")
+        message = SimpleNamespace(content='\n'.join(lines))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')])
+
+
+class MergingLLM(FakeLLM):
+    """按窗口第一个条目的序号合并指定的条目，模拟 LLM 把多个碎片合并成一句"""
+
+    def __init__(self, merges):
+        super().__init__()
+        self.merges = merges  # 窗口第一个条目的全局序号 -> [(序号, ...), ...]
+
+    def create(self, model, messages, temperature, max_tokens):
+        response = super().create(model, messages, temperature, max_tokens)
+        lines = response.choices[0].message.content.split('\n')
+        numbers = [int(re.search(r'line (\d+)', line).group(1)) for line in lines]
+        merged = []
+        for group in self.merges.get(numbers[0], []):
+            first, last = numbers.index(group[0]), numbers.index(group[-1])
+            start = re.search(r'\[(\S+) -->', lines[first]).group(1)
+            end = re.search(r'--> (\S+)\]', lines[last]).group(1)
+            texts = ' '.join(line.split('] ', 2)[2] for line in lines[first:last + 1])
+            merged.append((first, last, f"{first + 1}. [{start} --> {end}] [A] {texts}"))
+        for first, last, line in reversed(merged):
+            lines[first:last + 1] = [line]
+        response.choices[0].message.content = '\n'.join(lines)
+        return response
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeLLM()
+    monkeypatch.setattr(volcano_audio, 'get_provider_config',
+                        lambda name: SimpleNamespace(get_llm=lambda: llm))
+    return llm
+
+
+def test_split_into_windows_overlaps():
+    """测试窗口切分覆盖全部条目且相邻窗口重叠"""
+    assert split_into_windows(list(range(10)), size=40, overlap=6) == [(0, 10)]
+    assert split_into_windows(list(range(100)), size=40, overlap=6) == [(0, 40), (34, 74), (68, 100)]
+
+
+def test_windowed_optimization_keeps_every_entry_and_speakers(fake_llm, monkeypatch):
+    """测试长字幕分窗口优化后不丢条目、不重复，说话人标记全局一致，且结果与并发度无关"""
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_SIZE', 20)
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_OVERLAP', 6)
+    srt = _make_srt(100)
+
+    optimized = optimize_subtitles_with_llm(srt)
+    assert fake_llm.calls == len(split_into_windows(list(range(100)), size=20, overlap=6))
+
+    entries = parse_srt_to_entries(optimized)
+    assert [int(e['text'].split()[-1].rstrip('.')) for e in entries] == list(range(100))
+    speaker_of = {}
+    for entry in entries:
+        person = entry['text'].split()[0].lower()
+        assert speaker_of.setdefault(person, entry['speaker']) == entry['speaker']
+    assert sorted(speaker_of.values()) == ['A', 'B', 'C']
+
+    monkeypatch.setattr(volcano_audio, 'LLM_OPTIMIZE_CONCURRENCY', 1)
+    assert optimize_subtitles_with_llm(srt) == optimized
+
+
+def test_failed_window_keeps_original_entries(fake_llm, monkeypatch):
+    """测试某个窗口优化失败时保留原始条目，而不是丢掉后半部分"""
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_SIZE', 20)
+    monkeypatch.setattr(volcano_audio, 'time', SimpleNamespace(sleep=lambda s: None, time=lambda: 0))
+    create = fake_llm.create
+
+    def flaky(model, messages, temperature, max_tokens):
+        if '[00:02:' in messages[1]['content']:
+            raise RuntimeError('timeout')
+        return create(model, messages, temperature, max_tokens)
+
+    fake_llm.chat.completions.create = flaky
+    entries = parse_srt_to_entries(optimize_subtitles_with_llm(_make_srt(100)))
+    assert [int(e['text'].split()[-1].rstrip('.')) for e in entries] == list(range(100))
+
+
+def test_incremental_reoptimizes_only_changed_entries(fake_llm, monkeypatch):
+    """测试原始字幕部分变化时只重新优化变化的条目，结果与整体重新优化一致"""
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_SIZE', 20)
+    srt = _make_srt(100)
+    optimized = optimize_subtitles_with_llm(srt)
+
+    assert optimize_subtitles_incremental(srt, srt, optimized) == optimized
+
+    entries = parse_srt_to_entries(srt)
+    entries[50]['text'] = entries[50]['text'].replace('line', 'row')
+    del entries[70]
+    changed_srt = entries_to_srt(entries)
+
+    fake_llm.calls = 0
+    incremental = optimize_subtitles_incremental(changed_srt, srt, optimized)
+    assert fake_llm.calls == 2
+    assert [(e['text'], e['speaker']) for e in parse_srt_to_entries(incremental)] == \
+        [(e['text'], e['speaker']) for e in parse_srt_to_entries(optimize_subtitles_with_llm(changed_srt))]
+
+
+def test_incremental_drops_deleted_entries_without_context(fake_llm, monkeypatch):
+    """测试不带上下文时只删除条目，被删除条目对应的旧优化条目不会保留"""
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_SIZE', 20)
+    monkeypatch.setattr(volcano_audio, 'LLM_INCREMENTAL_CONTEXT', 0)
+    srt = _make_srt(100)
+    optimized = optimize_subtitles_with_llm(srt)
+
+    for deleted in (0, 50, 99):
+        entries = parse_srt_to_entries(srt)
+        del entries[deleted]
+        changed_srt = entries_to_srt(entries)
+
+        fake_llm.calls = 0
+        incremental = optimize_subtitles_incremental(changed_srt, srt, optimized)
+        assert fake_llm.calls == 1
+        texts = [e['text'] for e in parse_srt_to_entries(incremental)]
+        assert not any(re.search(rf'line {deleted}\b', text) for text in texts)
+        assert texts == [e['text'] for e in parse_srt_to_entries(optimize_subtitles_with_llm(changed_srt))]
+
+
+def test_snap_spans_does_not_cut_merged_cues():
+    """测试变化区间边界落在合并后的优化条目中间时扩大到条目边界"""
+    entries = parse_srt_to_entries(_make_srt(20))
+    merged = {'start_ms': entries[4]['start_ms'], 'end_ms': entries[6]['end_ms'], 'speaker': 'A'}
+    assert _snap_spans([[5, 12], [11, 14]], entries, [merged]) == [[4, 14]]
+
+
+def test_status_endpoints_report_processing_after_source_regenerated(tmp_path, monkeypatch):
+    """测试原始字幕重新生成后，查询接口和 SSE 都不把过期的优化字幕报告为已完成"""
+    import app as app_module
+    from app.task_store import TaskStore
+
+    disc = tmp_path / 'subtitles' / 'ET3' / 'disc1'
+    disc.mkdir(parents=True)
+    (disc / '01.srt').write_text(_make_srt(3), encoding='utf-8')
+    volcano_audio.save_optimized_subtitle(str(disc / '01.optimized.srt'), _make_srt(3), _make_srt(3))
+    tasks = TaskStore('subtitle_optimization', db_path=str(tmp_path / 'tasks.sqlite3'))
+    monkeypatch.setattr(app_module, 'SUBTITLE_ROOT', str(tmp_path / 'subtitles'))
+    monkeypatch.setattr(app_module, 'optimization_tasks', tasks)
+    monkeypatch.setattr(app_module, 'OPTIMIZATION_EVENTS_MAX_WAIT', 0)
+    client = app_module.app.test_client()
+    query = 'book=ET3&disc=disc1&filename=01.mp3'
+
+    def status():
+        return client.get(f'/api/check-optimized-subtitle?{query}').get_json()['status']
+
+    def events():
+        response = client.get(f'/api/optimized-subtitle-events?{query}')
+        data = response.get_data(as_text=True)
+        response.close()
+        return data
+
+    assert status() == 'completed'
+    assert 'event: completed' in events()
+
+    # 原始字幕重新生成：优化字幕过期，重新优化期间两个接口都报告处理中（SSE 只发送心跳，不发送事件）
+    (disc / '01.srt').write_text(_make_srt(4), encoding='utf-8')
+    assert status() == 'not_started'
+    assert tasks.claim('ET3_disc1_01.mp3')
+    assert status() == 'processing'
+    assert 'event:' not in events()
+
+    volcano_audio.save_optimized_subtitle(str(disc / '01.optimized.srt'), _make_srt(4), _make_srt(4))
+    tasks.complete('ET3_disc1_01.mp3', {'optimized_url': '/subtitles/ET3/disc1/01.optimized.srt'})
+    assert status() == 'completed'
+    assert 'event: completed' in events()
+
+    # 已完成的任务属于旧的原始字幕，再次重新生成后视为未开始
+    (disc / '01.srt').write_text(_make_srt(5), encoding='utf-8')
+    assert status() == 'not_started'
+    assert 'event: not_started' in events()
+
+
+@pytest.mark.parametrize('merges', [
+    {0: [(5, 6, 7)]},   # 前一窗口把跨过接缝的条目合并成一条
+    {6: [(6, 7, 8)]},   # 后一窗口把跨过接缝的条目合并成一条
+])
+def test_stitch_keeps_cues_merged_across_seam(monkeypatch, merges):
+    """测试 LLM 合并的条目跨过窗口接缝时，拼接结果既不重复也不丢失内容"""
+    llm = MergingLLM(merges)
+    monkeypatch.setattr(volcano_audio, 'get_provider_config', lambda name: SimpleNamespace(get_llm=lambda: llm))
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_SIZE', 10)
+    monkeypatch.setattr(volcano_audio, 'LLM_WINDOW_OVERLAP', 4)
+
+    entries = parse_srt_to_entries(optimize_subtitles_with_llm(_make_srt(20)))
+    assert [int(n) for e in entries for n in re.findall(r'line (\d+)', e['text'])] == list(range(20))
+    assert any(len(re.findall(r'line \d+', e['text'])) == 3 for e in entries)
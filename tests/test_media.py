@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from flask import Flask, abort
+
+from app.media import resolve_media_path, send_media
+
+
+def _make_app(root, mode='direct'):
+    media_app = Flask(__name__)
+
+    @media_app.route('/audio/<path:filename>')
+    def serve(filename):
+        path = resolve_media_path(root, filename)
+        if path is None:
+            abort(404)
+        return send_media(root, path, max_age=3600, mode=mode)
+
+    return media_app.test_client()
+
+
+def test_media_range_and_conditional(tmp_path):
+    """测试 Range、ETag 和条件请求"""
+    disc = tmp_path / 'ET3' / 'disc1'
+    disc.mkdir(parents=True)
+    (disc / '01.mp3').write_bytes(bytes(range(256)) * 4)
+    client = _make_app(str(tmp_path))
+
+    full = client.get('/audio/ET3/disc1/01.mp3')
+    assert full.status_code == 200
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    assert 'max-age=3600' in full.headers['Cache-Control']
+    etag = full.headers['ETag']
+    assert not etag.startswith('W/')
+
+    partial = client.get('/audio/ET3/disc1/01.mp3', headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206
+    assert partial.data == bytes(range(10, 20))
+    assert partial.headers['Content-Range'] == 'bytes 10-19/1024'
+
+    cached = client.get('/audio/ET3/disc1/01.mp3', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    cached = client.get('/audio/ET3/disc1/01.mp3',
+                        headers={'If-Modified-Since': full.headers['Last-Modified']})
+    assert cached.status_code == 304
+
+
+def test_media_rejects_path_traversal(tmp_path):
+    """测试路径越界和不存在的文件返回 404"""
+    (tmp_path / 'media').mkdir()
+    (tmp_path / 'secret.txt').write_text('secret')
+    client = _make_app(str(tmp_path / 'media'))
+
+    assert client.get('/audio/../secret.txt').status_code == 404
+    assert client.get('/audio/missing.mp3').status_code == 404
+
+
+def test_media_accel_redirect(tmp_path):
+    """测试 x-accel 模式只返回 X-Accel-Redirect 头，不发送文件内容"""
+    audio_root = tmp_path / 'audios'
+    (audio_root / 'ET3' / 'disc1').mkdir(parents=True)
+    (audio_root / 'ET3' / 'disc1' / '01 曲目.mp3').write_bytes(b'ID3' * 100)
+    client = _make_app(str(audio_root), mode='x-accel')
+
+    response = client.get('/audio/ET3/disc1/01 曲目.mp3')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == (
+        '/_protected/audios/ET3/disc1/01%20%E6%9B%B2%E7%9B%AE.mp3'
+    )
+    assert response.mimetype == 'audio/mpeg'
+    assert 'max-age=3600' in response.headers['Cache-Control']
+
+    assert client.get('/audio/../../etc/passwd').status_code == 404
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from app.subtitle_search import SubtitleSearchIndex
+from app.subtitle_store import add_write_hook, write_atomic, write_subtitle, _write_hooks
+
+SRT = ('1\n00:00:00,500 --> 00:00:02,600\nExcuse me, is this the way to the library?\n\n'
+       '2\n00:00:03,000 --> 00:00:05,200\nYes, go straight and turn left at the corner.\n')
+
+
+def test_index_and_search(tmp_path):
+    """测试写入字幕时更新索引，按短语检索返回音轨和条目时间，优化字幕取代原始字幕"""
+    root = tmp_path / 'subtitles'
+    index = SubtitleSearchIndex(str(root), db_path=str(tmp_path / 'search.sqlite3'))
+    add_write_hook(index.index_file)
+    try:
+        write_subtitle(str(root / 'ET3' / 'disc1' / '01.srt'), SRT)
+        write_subtitle(str(root / 'ET4' / 'disc2' / '05.srt'), SRT.replace('library', 'museum'))
+        write_subtitle(str(tmp_path / 'elsewhere.srt'), SRT)
+    finally:
+        _write_hooks.remove(index.index_file)
+
+    hits = index.search('turn left')
+    assert [(h['book'], h['disc'], h['track']) for h in hits] == [('ET3', 'disc1', '01'), ('ET4', 'disc2', '05')]
+    assert hits[0]['start_ms'] == 3000 and hits[0]['end_ms'] == 5200
+    assert [h['book'] for h in index.search('LIBRARY')] == ['ET3']
+    assert [h['book'] for h in index.search('turn left', book='ET4')] == ['ET4']
+    # 短语不相邻时退回到所有词都出现
+    assert index.search('left corner')[0]['text'].startswith('Yes')
+    assert index.search('"unbalanced') == []
+
+    write_atomic(str(root / 'ET3' / 'disc1' / '01.optimized.srt'), SRT.replace('library', 'station'))
+    index.index_file(str(root / 'ET3' / 'disc1' / '01.optimized.srt'))
+    index.index_file(str(root / 'ET3' / 'disc1' / '01.srt'))
+    assert index.search('library') == []
+    assert index.search('station')[0]['optimized'] is True
+
+
+def test_sync_with_directory(tmp_path):
+    """测试全量同步：索引直接放进目录的字幕，跳过未修改的，删除已不存在的音轨"""
+    root = tmp_path / 'subtitles'
+    index = SubtitleSearchIndex(str(root), db_path=str(tmp_path / 'search.sqlite3'))
+    write_atomic(str(root / 'ET3' / 'disc1' / '01.srt'), SRT)
+    write_atomic(str(root / 'ET3' / 'disc1' / '02.srt'), SRT)
+    write_atomic(str(root / 'ET3' / 'disc1' / '02.optimized.srt'), SRT.replace('library', 'station'))
+    write_atomic(str(root / 'ET3' / 'disc1' / '02.optimized.src.srt'), SRT)
+
+    assert index.sync() == {'indexed': 2, 'removed': 0}
+    assert index.sync() == {'indexed': 0, 'removed': 0}
+    assert [h['track'] for h in index.search('library')] == ['01']
+
+    os.remove(str(root / 'ET3' / 'disc1' / '01.srt'))
+    assert index.sync() == {'indexed': 0, 'removed': 1}
+    assert index.search('library') == []
+
+
+def test_search_endpoint(tmp_path, monkeypatch):
+    """测试检索接口：缺少 q 返回 400，结果包含音轨和耗时"""
+    import app as app_module
+
+    index = SubtitleSearchIndex(str(tmp_path), db_path=str(tmp_path / 'search.sqlite3'))
+    write_atomic(str(tmp_path / 'ET3' / 'disc1' / '01.srt'), SRT)
+    index.sync()
+    monkeypatch.setattr(app_module, 'subtitle_index', index)
+
+    client = app_module.app.test_client()
+    assert client.get('/api/search').status_code == 400
+    data = client.get('/api/search?q=turn+left&limit=5').get_json()
+    assert data['success'] is True
+    assert data['results'][0]['subtitle'] == 'ET3/disc1/01.srt'
+    assert data['elapsed_ms'] >= 0
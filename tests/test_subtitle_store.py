@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from app.ingest import AudioStore
+from app.llm.cue_store import CueStore
+from app.subtitle_store import SubtitleStore, ensure_sidecar, write_atomic, write_subtitle
+
+SRT = '1\n00:00:00,000 --> 00:00:01,000\nHello\n'
+PARAMS = {'asr': 'volcano', 'language': 'en'}
+
+
+def _make_store(tmp_path):
+    db_path = str(tmp_path / 'store.sqlite3')
+    audio_store = AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'), db_path=db_path)
+    for path, content in (('ET3/disc1/01.mp3', b'same'), ('ET4/disc2/Track 1.mp3', b'same'),
+                          ('ET3/disc1/02.mp3', b'other')):
+        full_path = tmp_path / 'audios' / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(content)
+    return SubtitleStore(audio_store, store_root=str(tmp_path / 'artifacts'), db_path=db_path)
+
+
+def test_materialize_by_audio_content_and_params(tmp_path):
+    """测试字幕按音频内容和生成参数复用：改名/换教材的音轨命中，参数或内容不同不命中"""
+    store = _make_store(tmp_path)
+    assert store.materialize('ET3/disc1/01.mp3', 'srt', PARAMS) is False
+
+    source = store.subtitle_path('ET3/disc1/01.mp3', 'srt')
+    write_atomic(source, SRT)
+    key = store.adopt('ET3/disc1/01.mp3', 'srt', PARAMS)
+    assert key == store.key_for('ET4/disc2/Track 1.mp3', 'srt', PARAMS)
+
+    assert store.materialize('ET4/disc2/Track 1.mp3', 'srt', dict(PARAMS, language='zh')) is False
+    assert store.materialize('ET3/disc1/02.mp3', 'srt', PARAMS) is False
+    assert store.materialize('ET4/disc2/Track 1.mp3', 'srt', PARAMS) is True
+    target = store.subtitle_path('ET4/disc2/Track 1.mp3', 'srt')
+    assert open(target, encoding='utf-8').read() == SRT
+    assert os.stat(target).st_ino == os.stat(source).st_ino
+
+    # 整体替换一个引用不影响存储和其他引用
+    write_atomic(target, 'edited')
+    assert open(source, encoding='utf-8').read() == SRT
+
+
+def test_report_and_evict(tmp_path):
+    """测试引用计数报告，以及淘汰只删除没有引用的存储项"""
+    store = _make_store(tmp_path)
+    write_atomic(store.subtitle_path('ET3/disc1/01.mp3', 'srt'), SRT)
+    write_atomic(store.subtitle_path('ET3/disc1/02.mp3', 'optimized'), SRT + 'x')
+    shared_key = store.adopt('ET3/disc1/01.mp3', 'srt', PARAMS)
+    lone_key = store.adopt('ET3/disc1/02.mp3', 'optimized', PARAMS)
+    store.materialize('ET4/disc2/Track 1.mp3', 'srt', PARAMS)
+
+    report = store.report()
+    refcounts = {a['key']: a['refcount'] for a in report['artifacts']}
+    assert refcounts == {shared_key: 2, lone_key: 1}
+    assert report['references'] == 3
+    assert report['exclusive_bytes'] == 0
+
+    os.remove(store.subtitle_path('ET3/disc1/02.mp3', 'optimized'))
+    report = store.report()
+    assert {a['key']: a['refcount'] for a in report['artifacts']}[lone_key] == 0
+    assert report['exclusive_bytes'] == len(SRT) + 1
+
+    assert store.evict(max_bytes=0) == {'evicted': 1, 'freed_bytes': len(SRT) + 1}
+    assert [a['key'] for a in store.report()['artifacts']] == [shared_key]
+    assert store.evict(unused_days=0) == {'evicted': 0, 'freed_bytes': 0}
+
+
+def test_sidecars_and_format_negotiation(tmp_path, monkeypatch):
+    """测试写入 SRT 时生成 .vtt / .json，按扩展名或 Accept 头提供，缺失或过期时即时生成"""
+    import app as app_module
+
+    root = tmp_path / 'subtitles'
+    srt_path = str(root / 'ET3' / 'disc1' / '01.srt')
+    write_subtitle(srt_path, SRT, words=[(0, 400, 'Hello')])
+    assert CueStore.from_json((root / 'ET3' / 'disc1' / '01.json').read_text()).words == [[(0, 400, 'Hello')]]
+
+    monkeypatch.setattr(app_module, 'SUBTITLE_ROOT', str(root))
+    client = app_module.app.test_client()
+    assert client.get('/subtitles/ET3/disc1/01.srt').data.decode() == SRT
+    vtt = client.get('/subtitles/ET3/disc1/01.vtt')
+    assert vtt.mimetype == 'text/vtt' and vtt.data.startswith(b'WEBVTT')
+    negotiated = client.get('/subtitles/ET3/disc1/01.srt', headers={'Accept': 'application/json'})
+    assert negotiated.get_json()['cues'] == [[0, 1000, 'Hello', None, [[0, 400, 'Hello']]]]
+    assert 'Accept' in negotiated.headers['Vary']
+
+    # 直接替换 SRT（例如 rsync 同步）后 JSON 视为过期，重新生成时保留仍与文本一致的词级时间
+    os.replace(str(root / 'ET3' / 'disc1' / '01.srt'), str(root / 'ET3' / 'disc1' / 'old.srt'))
+    (root / 'ET3' / 'disc1' / '01.srt').write_text(SRT.replace('Hello', 'Hello there'), encoding='utf-8')
+    assert ensure_sidecar(srt_path, 'json') == str(root / 'ET3' / 'disc1' / '01.json')
+    assert client.get('/subtitles/ET3/disc1/01.json').get_json()['cues'][0][2:] == \
+        ['Hello there', None, [[0, 400, 'Hello']]]
+
+    # 文本改变后旧的词级时间不再沿用
+    os.replace(str(root / 'ET3' / 'disc1' / '01.srt'), str(root / 'ET3' / 'disc1' / 'old.srt'))
+    (root / 'ET3' / 'disc1' / '01.srt').write_text(SRT.replace('Hello', 'Hi'), encoding='utf-8')
+    ensure_sidecar(srt_path, 'json')
+    assert client.get('/subtitles/ET3/disc1/01.json').get_json()['cues'][0][2:] == ['Hi', None]
+    assert client.get('/subtitles/ET3/disc1/missing.json').status_code == 404
+
+
+def test_rewritten_subtitle_keeps_only_matching_words(tmp_path):
+    """测试重写字幕时只沿用文本仍一致的条目的词级时间，显式传入空列表时不沿用"""
+    srt = ("1\n00:00:00,000 --> 00:00:01,000\nHello world\n\n"
+           "2\n00:00:02,000 --> 00:00:03,000\nGood morning\n\n")
+    words = [(0, 400, 'Hello'), (500, 900, 'world'), (2000, 2400, 'Good'), (2500, 2900, 'morning')]
+    srt_path = str(tmp_path / 'ET3' / 'disc1' / '01.srt')
+    write_subtitle(srt_path, srt, words=words)
+
+    # 优化字幕没有自己的 JSON，沿用原始字幕中文本仍一致的条目的词级时间
+    optimized_path = str(tmp_path / 'ET3' / 'disc1' / '01.optimized.srt')
+    write_subtitle(optimized_path, srt.replace('Good morning', 'Good evening').replace('Hello world', 'Hello, world!'))
+    optimized = CueStore.from_json((tmp_path / 'ET3' / 'disc1' / '01.optimized.json').read_text())
+    assert optimized.words == [[(0, 400, 'Hello'), (500, 900, 'world')], None]
+
+    write_subtitle(srt_path, srt, words=[])
+    assert CueStore.from_json((tmp_path / 'ET3' / 'disc1' / '01.json').read_text()).words == [None, None]
+
+
+def test_adopt_notifies_hooks_and_stale_refs_are_dropped(tmp_path, monkeypatch):
+    """测试收入存储时通知写入回调、更新派生文件，字幕重新生成为其他内容后引用失效"""
+    import app.subtitle_store as subtitle_store
+
+    written = []
+    monkeypatch.setattr(subtitle_store, '_write_hooks', [lambda path, cues: written.append(path)])
+    store = _make_store(tmp_path)
+    source = store.subtitle_path('ET3/disc1/01.mp3', 'srt')
+    write_atomic(source, SRT)
+    key = store.adopt('ET3/disc1/01.mp3', 'srt', PARAMS)
+    assert written == [source]
+
+    # 同一音频已有存储项：字幕被替换为存储中的内容，派生文件随之更新
+    target = store.subtitle_path('ET4/disc2/Track 1.mp3', 'srt')
+    write_subtitle(target, SRT.replace('Hello', 'Different'))
+    written.clear()
+    assert store.adopt('ET4/disc2/Track 1.mp3', 'srt', PARAMS) == key
+    assert written == [target]
+    assert CueStore.from_json(open(target[:-len('.srt')] + '.json', encoding='utf-8').read()).texts == ['Hello']
+    assert store.report()['artifacts'][0]['refcount'] == 2
+
+    # 重新生成的字幕不再指向存储项，引用不再计数
+    write_subtitle(target, SRT.replace('Hello', 'Regenerated'))
+    artifact = store.report()['artifacts'][0]
+    assert artifact['refcount'] == 1
+    assert artifact['paths'] == ['ET3/disc1/01.srt']
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.task_store import TaskStore
+
+
+def test_claim_is_exclusive_across_threads(tmp_path):
+    """测试多个线程（各自独立的连接）同时认领同一任务时只有一个成功"""
+    db_path = str(tmp_path / 'tasks.sqlite3')
+    barrier = threading.Barrier(8)
+
+    def claim():
+        store = TaskStore('subtitle_optimization', db_path=db_path)
+        barrier.wait()
+        return store.claim('ET3_disc1_01.mp3')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: claim(), range(8)))
+
+    assert results.count(True) == 1
+    assert TaskStore('subtitle_optimization', db_path=db_path).get('ET3_disc1_01.mp3')['status'] == 'processing'
+
+
+def test_task_lifecycle_and_stale_expiry(tmp_path):
+    """测试任务完成、失败后可以重新认领，过期的 processing 任务可被接管"""
+    store = TaskStore('subtitle_optimization', db_path=str(tmp_path / 'tasks.sqlite3'), stale_after=1)
+
+    assert store.get('missing') is None
+    assert store.claim('a') is True
+    store.complete('a', {'optimized_url': '/subtitles/a.optimized.srt'})
+    task = store.get('a')
+    assert task['status'] == 'completed'
+    assert task['result']['optimized_url'] == '/subtitles/a.optimized.srt'
+
+    assert store.claim('a') is True
+    store.fail('a', 'LLM error')
+    assert store.get('a')['error'] == 'LLM error'
+
+    # 模拟 worker 崩溃：processing 记录不再更新
+    for task_key in ('b', 'c'):
+        _insert_orphan(store, task_key)
+    assert store.get('b')['status'] == 'failed'
+    assert store.claim('b') is True
+    assert store.claim('b') is False
+    assert store.expire_stale() == 1
+    assert store.get('b')['status'] == 'processing'
+    assert store.get('c')['status'] == 'failed'
+
+
+def _insert_orphan(store, task_key):
+    """写入一条已退出的 worker 遗留的 processing 记录"""
+    stale = time.time() - store.stale_after - 1
+    store._conn().execute(
+        "INSERT INTO tasks (kind, task_key, status, owner, started_at, updated_at) "
+        "VALUES (?, ?, 'processing', 'dead-worker', ?, ?)",
+        (store.kind, task_key, stale, stale)
+    )
+
+
+def test_heartbeat_keeps_claimed_task_alive_and_checks_owner(tmp_path):
+    """测试认领的任务在排队或执行期间由心跳线程维持；被接管后原 owner 的结果不再写入"""
+    db_path = str(tmp_path / 'tasks.sqlite3')
+    store = TaskStore('subtitle_optimization', db_path=db_path, stale_after=0.4)
+    other_worker = TaskStore('subtitle_optimization', db_path=db_path, stale_after=0.4)
+
+    assert store.claim('long') is True
+    time.sleep(1)
+    assert store.get('long')['status'] == 'processing'
+    assert other_worker.claim('long') is False
+    assert store.heartbeat('long') is True
+
+    # 模拟任务被其他 worker 接管
+    store._conn().execute("UPDATE tasks SET owner = 'other' WHERE task_key = 'long'")
+    assert store.heartbeat('long') is False
+    store.complete('long', {'optimized_url': '/stale'})
+    assert store.get('long')['result'] == {}
+    assert other_worker.heartbeat('long') is False
+
+
+def test_wait_finished_wakes_in_process_and_polls_other_workers(tmp_path):
+    """测试同进程完成时立即唤醒，其他 worker（独立实例）完成时通过轮询发现"""
+    db_path = str(tmp_path / 'tasks.sqlite3')
+    store = TaskStore('subtitle_optimization', db_path=db_path)
+    other_worker = TaskStore('subtitle_optimization', db_path=db_path)
+
+    assert store.wait_finished('missing', timeout=0.1) is None
+
+    store.claim('a')
+    assert store.wait_finished('a', timeout=0.1)['status'] == 'processing'
+
+    threading.Timer(0.2, store.complete, args=('a', {'optimized_url': '/x'})).start()
+    start = time.monotonic()
+    assert store.wait_finished('a', timeout=5, poll_interval=10)['status'] == 'completed'
+    assert time.monotonic() - start < 2
+
+    other_worker.claim('b')
+    threading.Timer(0.2, other_worker.fail, args=('b', 'LLM error')).start()
+    task = store.wait_finished('b', timeout=5, poll_interval=0.1)
+    assert task['status'] == 'failed' and task['error'] == 'LLM error'
+
+
+def test_optimization_events_cap_concurrent_streams(tmp_path, monkeypatch):
+    """测试同时打开的 SSE 连接达到上限时返回 503（前端退回轮询），连接关闭后释放名额"""
+    import app as app_module
+
+    store = TaskStore('subtitle_optimization', db_path=str(tmp_path / 'tasks.sqlite3'))
+    store.claim('ET3_disc1_01.mp3')
+    monkeypatch.setattr(app_module, 'optimization_tasks', store)
+    monkeypatch.setattr(app_module, 'SUBTITLE_ROOT', str(tmp_path / 'subtitles'))
+    monkeypatch.setattr(app_module, 'OPTIMIZATION_EVENTS_MAX_WAIT', 0)
+    monkeypatch.setattr(app_module, '_optimization_event_streams', threading.BoundedSemaphore(1))
+    client = app_module.app.test_client()
+    url = '/api/optimized-subtitle-events?book=ET3&disc=disc1&filename=01.mp3'
+
+    held = client.get(url, buffered=False)
+    assert held.status_code == 200
+    rejected = client.get(url)
+    assert rejected.status_code == 503
+    assert rejected.headers['Retry-After']
+
+    held.close()
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 200 and 'retry:' in response.get_data(as_text=True)
+        response.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ingest import AudioStore
+from app.url_import import UrlImportManager
+
+CONTENT = os.urandom(512 * 1024)
+# MPEG-1 Layer III 128 kbps 44.1 kHz，每帧 417 字节
+MP3_CONTENT = b''.join(b'\xff\xfb\x90\x00' + bytes(413) for _ in range(40))
+
+
+class FlakyRangeHandler(BaseHTTPRequestHandler):
+    """第一次请求发送一半数据后断开连接，之后按 Range 续传"""
+
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.requests_seen.append(range_header)
+        if self.path == '/missing.mp3':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == '/unsized.mp3':
+            self._send_unsized(range_header)
+            return
+
+        start = int(range_header.split('=')[1].rstrip('-')) if range_header else 0
+        body = CONTENT[start:]
+        self.send_response(206 if range_header else 200)
+        self.send_header('Content-Length', str(len(body)))
+        if range_header:
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        self.end_headers()
+
+        if len(self.requests_seen) == 1:
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.close()
+            return
+        self.wfile.write(body)
+
+    def _send_unsized(self, range_header):
+        """不带 Content-Length：第一次在最后一帧中间关闭连接，续传时才给出 Content-Range"""
+        if not range_header:
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(MP3_CONTENT[:-200])
+            return
+        start = int(range_header.split('=')[1].rstrip('-'))
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{len(MP3_CONTENT) - 1}/{len(MP3_CONTENT)}')
+        self.end_headers()
+        self.wfile.write(MP3_CONTENT[start:])
+
+
+@pytest.fixture
+def server():
+    FlakyRangeHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FlakyRangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def _wait(manager, job_id, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"import job did not finish: {manager.get(job_id)}")
+
+
+def test_url_import_resumes_with_range(tmp_path, server, monkeypatch):
+    """测试连接中断后使用 Range 续传并校验 sha256"""
+    monkeypatch.setattr('app.url_import.RETRY_BACKOFF', 0)
+    store = AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'),
+                       db_path=str(tmp_path / 'store.sqlite3'))
+    completed = []
+    manager = UrlImportManager(store, on_complete=completed.append,
+                               db_path=str(tmp_path / 'store.sqlite3'))
+
+    job_id = manager.submit(f"{server}/track.mp3", 'ET3/disc1/01.mp3',
+                            expected_sha256=hashlib.sha256(CONTENT).hexdigest())
+    job = _wait(manager, job_id)
+
+    assert job['status'] == 'completed', job['error']
+    assert job['attempts'] == 2
+    assert job['total_bytes'] == len(CONTENT)
+    assert FlakyRangeHandler.requests_seen[0] is None
+    assert FlakyRangeHandler.requests_seen[1].startswith('bytes=')
+    assert (tmp_path / 'audios' / 'ET3' / 'disc1' / '01.mp3').read_bytes() == CONTENT
+    assert os.listdir(tmp_path / 'audios' / 'ET3' / 'disc1') == ['01.mp3']
+    assert completed and completed[0]['id'] == job_id
+
+
+def test_url_import_fails_fast_on_404(tmp_path, server):
+    """测试 404 不重试"""
+    store = AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'),
+                       db_path=str(tmp_path / 'store.sqlite3'))
+    manager = UrlImportManager(store, db_path=str(tmp_path / 'store.sqlite3'))
+
+    job = _wait(manager, manager.submit(f"{server}/missing.mp3", 'ET3/disc1/02.mp3'))
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 1
+    assert '404' in job['error']
+
+
+def test_url_import_detects_truncation_without_content_length(tmp_path, server, monkeypatch):
+    """测试没有 Content-Length 时按音频帧检查是否完整，不完整时续传"""
+    monkeypatch.setattr('app.url_import.RETRY_BACKOFF', 0)
+    store = AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'),
+                       db_path=str(tmp_path / 'store.sqlite3'))
+    manager = UrlImportManager(store, db_path=str(tmp_path / 'store.sqlite3'))
+
+    job = _wait(manager, manager.submit(f"{server}/unsized.mp3", 'ET3/disc1/03.mp3'))
+    assert job['status'] == 'completed', job['error']
+    assert job['attempts'] == 2
+    assert FlakyRangeHandler.requests_seen == [None, f'bytes={len(MP3_CONTENT) - 200}-']
+    assert (tmp_path / 'audios' / 'ET3' / 'disc1' / '03.mp3').read_bytes() == MP3_CONTENT
+
+
+def test_url_import_recovers_orphaned_jobs(tmp_path, server, monkeypatch):
+    """测试启动时接管已退出 worker 遗留的任务，重试次数用完的标记为失败"""
+    monkeypatch.setattr('app.url_import.RETRY_BACKOFF', 0)
+    db_path = str(tmp_path / 'store.sqlite3')
+    store = AudioStore(str(tmp_path / 'audios'), str(tmp_path / 'subtitles'), db_path=db_path)
+    manager = UrlImportManager(store, db_path=db_path)
+    stale = time.time() - 600
+    for job_id, status, attempts in (('orphan', 'downloading', 1), ('queued', 'queued', 0),
+                                     ('exhausted', 'downloading', 5)):
+        manager._conn().execute(
+            'INSERT INTO url_import_jobs (id, url, path, status, attempts, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, f"{server}/unsized.mp3", f'ET3/disc1/{job_id}.mp3', status, attempts, stale, stale)
+        )
+
+    assert manager.recover() == 2
+    assert UrlImportManager(store, db_path=db_path).recover() == 0
+    assert _wait(manager, 'orphan')['status'] == 'completed'
+    assert _wait(manager, 'queued')['status'] == 'completed'
+    exhausted = manager.get('exhausted')
+    assert exhausted['status'] == 'failed'
+    assert 'worker' in exhausted['error']
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import requests
+
+from app.llm import volcano_audio
+from app.llm.volcano_audio import VolcanoAudioProvider, VolcanoJobError, VolcanoJobPoller, VolcanoJobTimeout
+
+DONE = {'code': 0, 'message': 'Success', 'utterances': [{'text': 'hello', 'start_time': 0, 'end_time': 900}]}
+
+
+class ScriptedProvider(VolcanoAudioProvider):
+    """按预设序列返回查询结果：None 表示处理中，异常会被抛出"""
+
+    def __init__(self, scripts):
+        super().__init__()
+        self.scripts = {job_id: list(steps) for job_id, steps in scripts.items()}
+        self.queries = []
+
+    def submit(self, file_url, language='en'):
+        return file_url
+
+    def query(self, job_id):
+        self.queries.append(job_id)
+        step = self.scripts[job_id].pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(volcano_audio, 'POLL_INITIAL_INTERVAL', 0.01)
+    monkeypatch.setattr(volcano_audio, 'POLL_MAX_INTERVAL', 0.04)
+
+
+def test_get_subtitles_polls_until_done_and_retries_network_errors():
+    """测试处理中继续轮询、网络错误重试，直到拿到结果"""
+    provider = ScriptedProvider({'job': [None, requests.ConnectionError('reset'), None, DONE]})
+    assert provider.get_subtitles('job') == DONE
+    assert len(provider.queries) == 4
+
+    provider = ScriptedProvider({'job': [None] * 100})
+    with pytest.raises(VolcanoJobTimeout):
+        provider.wait_for_result('job', timeout=0.1)
+
+
+def test_poller_multiplexes_jobs_on_one_thread():
+    """测试一个轮询线程同时跟踪多个任务，各自独立完成或失败"""
+    provider = ScriptedProvider({
+        'a': [None, None, DONE],
+        'b': [DONE],
+        'c': [None, VolcanoJobError('code 1013')],
+        'd': [None] * 100,
+    })
+    poller = VolcanoJobPoller(provider, timeout=5)
+    futures = {job_id: poller.submit(job_id) for job_id in 'abc'}
+    futures['d'] = poller.track('d', timeout=0.1)
+
+    assert futures['a'].result(5) == DONE
+    assert futures['b'].result(5) == DONE
+    with pytest.raises(VolcanoJobError):
+        futures['c'].result(5)
+    with pytest.raises(VolcanoJobTimeout):
+        futures['d'].result(5)
+    assert poller.pending() == 0
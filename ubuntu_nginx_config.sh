@@ -36,7 +36,7 @@ User=$USER
 Group=www-data
 WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/venv/bin"
-ExecStart=$APP_DIR/venv/bin/gunicorn --workers 3 --bind unix:$APP_DIR/$APP_NAME.sock -m 007 wsgi:app
+ExecStart=$APP_DIR/venv/bin/gunicorn --workers 3 --worker-class gthread --threads 8 --bind unix:$APP_DIR/$APP_NAME.sock -m 007 wsgi:app
 
 [Install]
 WantedBy=multi-user.target
@@ -58,6 +58,21 @@ server {
         include proxy_params;
         proxy_pass http://unix:$APP_DIR/$APP_NAME.sock;
     }
+
+    # 字幕优化状态推送（SSE）不能被缓冲
+    location /api/optimized-subtitle-events {
+        include proxy_params;
+        proxy_pass http://unix:$APP_DIR/$APP_NAME.sock;
+        proxy_buffering off;
+        proxy_read_timeout 90s;
+    }
+
+    # 音频/字幕文件由 nginx 直接发送（.env 中设置 MEDIA_DELIVERY_MODE=x-accel）
+    # Flask 只校验路径并返回 X-Accel-Redirect，gunicorn worker 不再被大文件传输占用
+    location /_protected/ {
+        internal;
+        alias $APP_DIR/current/app/static/;
+    }
 }
 EOF
 